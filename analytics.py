@@ -1,4 +1,115 @@
 """Analytics and user preference analysis."""
+from video_generator import ATTRIBUTE_VALUES, TITLE_FORMATS, TITLE_MATCHER
+
+# Locations and title formats the familiarity score and insights look for
+COMMON_LOCATIONS = ["Bangalore", "Mumbai", "Delhi", "Chennai", "Hyderabad", "Pune", "Goa"]
+FORMAT_PATTERNS = TITLE_FORMATS
+
+# Location codes of item["attrs"] (video_generator.ATTRIBUTE_VALUES) that count, by name;
+# the generator knows more locations than the analytics look for
+_LOCATION_NAMES = {code: loc for code, loc in enumerate(ATTRIBUTE_VALUES["location"]) if loc in COMMON_LOCATIONS}
+
+
+class UserProfile:
+    """
+    Running summary of a user's choices.
+
+    Holds everything the familiarity score and preference insights need,
+    updated in O(tags) per new choice instead of re-walking the history.
+    Locations and title formats come from the item's integer-coded
+    ``attrs``; only items without them have their title scanned, once
+    per item id (video_generator.TITLE_MATCHER).
+    Counts are kept in first-seen order so ties resolve exactly as they do
+    when the history is scanned from the start.
+    """
+
+    def __init__(self):
+        self.num_videos = 0
+        self.category_counts = {}
+        self.max_category_count = 0
+        self.tag_counts = {}
+        self.repeated_tags = 0
+        self.location_counts = {}
+        self.location_mentions = 0
+        self.format_matches = 0
+
+    @classmethod
+    def from_history(cls, user_history):
+        """Build a profile from a list of chosen videos."""
+        profile = cls()
+        for video in user_history or []:
+            profile.add(video)
+        return profile
+
+    def add(self, video):
+        """Fold one chosen video into the profile."""
+        self.num_videos += 1
+
+        category = video.get("category", "")
+        count = self.category_counts.get(category, 0) + 1
+        self.category_counts[category] = count
+        self.max_category_count = max(self.max_category_count, count)
+
+        for tag in video.get("tags", []):
+            count = self.tag_counts.get(tag, 0) + 1
+            self.tag_counts[tag] = count
+            if count == 2:
+                self.repeated_tags += 1
+
+        attrs = video.get("attrs")
+        if attrs is not None:
+            # Integer-coded attributes (video_generator.ATTRIBUTE_SLOTS): no title scanning
+            code = attrs.get("location")
+            locations = () if code is None else (code,)
+            has_format = "format" in attrs
+        else:
+            # Every location and format in the title, in one memoized pass
+            found = TITLE_MATCHER.match(video)
+            locations = found.get("location", ())
+            has_format = "format" in found
+
+        for code in locations:
+            loc = _LOCATION_NAMES.get(code)
+            if loc is None:
+                continue
+            self.location_counts[loc] = self.location_counts.get(loc, 0) + 1
+            self.location_mentions += 1
+        if has_format:
+            self.format_matches += 1
+
+    def top_categories(self):
+        """Categories sorted by count, most chosen first (ties keep first-seen order)."""
+        return sorted(self.category_counts.items(), key=lambda x: x[1], reverse=True)
+
+    def to_dict(self):
+        """Compact, JSON-serializable form for storing in the session."""
+        return {
+            "n": self.num_videos,
+            "c": list(self.category_counts.items()),
+            "t": list(self.tag_counts.items()),
+            "l": list(self.location_counts.items()),
+            "f": self.format_matches
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restore a profile saved with to_dict()."""
+        profile = cls()
+        profile.num_videos = data["n"]
+        profile.category_counts = {cat: count for cat, count in data["c"]}
+        profile.max_category_count = max(profile.category_counts.values(), default=0)
+        profile.tag_counts = {tag: count for tag, count in data["t"]}
+        profile.repeated_tags = sum(1 for count in profile.tag_counts.values() if count >= 2)
+        profile.location_counts = {loc: count for loc, count in data["l"]}
+        profile.location_mentions = sum(profile.location_counts.values())
+        profile.format_matches = data["f"]
+        return profile
+
+
+def _as_profile(user_history):
+    if isinstance(user_history, UserProfile):
+        return user_history
+    return UserProfile.from_history(user_history)
 
 
 def calculate_familiarity_score(user_history):
@@ -6,74 +117,40 @@ def calculate_familiarity_score(user_history):
     Calculate how well we understand user preferences based on viewing history.
 
     Args:
-        user_history: List of videos user has chosen
+        user_history: List of videos user has chosen, or a UserProfile
 
     Returns:
         int: Familiarity percentage (0-100)
     """
-    if not user_history or len(user_history) == 0:
+    profile = _as_profile(user_history)
+    if profile.num_videos == 0:
         return 0
 
     # Factors that increase familiarity
-    num_videos = len(user_history)
+    num_videos = profile.num_videos
 
     # 1. Basic familiarity from number of views (max 40%)
     # 1 video = 15%, 2 = 25%, 3 = 30%, 5 = 40%
     view_score = min(40, 15 + (num_videos - 1) * 5)
 
     # 2. Category consistency (max 30%)
-    categories = [v.get("category", "") for v in user_history]
-    category_counts = {}
-    for cat in categories:
-        category_counts[cat] = category_counts.get(cat, 0) + 1
-
-    if len(category_counts) > 0:
-        # Higher concentration in fewer categories = more familiar
-        max_category_count = max(category_counts.values())
-        category_ratio = max_category_count / len(user_history)
-        category_score = int(category_ratio * 30)
-    else:
-        category_score = 0
+    # Higher concentration in fewer categories = more familiar
+    category_ratio = profile.max_category_count / num_videos
+    category_score = int(category_ratio * 30)
 
     # 3. Tag/topic overlap (max 20%)
-    all_tags = []
-    for video in user_history:
-        all_tags.extend(video.get("tags", []))
-
-    tag_counts = {}
-    for tag in all_tags:
-        tag_counts[tag] = tag_counts.get(tag, 0) + 1
-
     # Tags that appear multiple times indicate clear interests
-    repeated_tags = sum(1 for count in tag_counts.values() if count >= 2)
-    tag_score = min(20, repeated_tags * 5)
+    tag_score = min(20, profile.repeated_tags * 5)
 
     # 4. Pattern strength (max 10%)
-    # Check for location patterns, topic patterns, etc.
     pattern_score = 0
 
-    # Check for location consistency in titles
-    common_locations = ["Bangalore", "Mumbai", "Delhi", "Chennai", "Hyderabad", "Pune", "Goa"]
-    location_mentions = []
-    for video in user_history:
-        title = video.get("title", "")
-        for loc in common_locations:
-            if loc in title:
-                location_mentions.append(loc)
-
-    if len(location_mentions) >= 2:
-        # User has location preference
+    # Location consistency in titles
+    if profile.location_mentions >= 2:
         pattern_score += 5
 
-    # Check for format patterns (Top N, Best X, etc.)
-    format_patterns = ["Top", "Best", "places to", "things to", "How to"]
-    format_matches = 0
-    for video in user_history:
-        title = video.get("title", "")
-        if any(pattern in title for pattern in format_patterns):
-            format_matches += 1
-
-    if format_matches >= 2:
+    # Format patterns (Top N, Best X, etc.)
+    if profile.format_matches >= 2:
         pattern_score += 5
 
     # Total score
@@ -87,12 +164,13 @@ def get_preference_insights(user_history):
     Get insights about user preferences.
 
     Args:
-        user_history: List of videos user has chosen
+        user_history: List of videos user has chosen, or a UserProfile
 
     Returns:
         dict: Insights about user preferences
     """
-    if not user_history:
+    profile = _as_profile(user_history)
+    if profile.num_videos == 0:
         return {
             "primary_interest": "Unknown",
             "secondary_interest": None,
@@ -100,12 +178,7 @@ def get_preference_insights(user_history):
         }
 
     # Category analysis
-    categories = [v.get("category", "") for v in user_history]
-    category_counts = {}
-    for cat in categories:
-        category_counts[cat] = category_counts.get(cat, 0) + 1
-
-    sorted_categories = sorted(category_counts.items(), key=lambda x: x[1], reverse=True)
+    sorted_categories = profile.top_categories()
 
     primary_interest = sorted_categories[0][0] if sorted_categories else "Unknown"
     secondary_interest = sorted_categories[1][0] if len(sorted_categories) > 1 else None
@@ -114,29 +187,13 @@ def get_preference_insights(user_history):
     patterns = []
 
     # Location pattern
-    common_locations = ["Bangalore", "Mumbai", "Delhi", "Chennai", "Hyderabad", "Pune", "Goa"]
-    location_counts = {}
-    for video in user_history:
-        title = video.get("title", "")
-        for loc in common_locations:
-            if loc in title:
-                location_counts[loc] = location_counts.get(loc, 0) + 1
-
-    if location_counts:
-        top_location = max(location_counts.items(), key=lambda x: x[1])
+    if profile.location_counts:
+        top_location = max(profile.location_counts.items(), key=lambda x: x[1])
         if top_location[1] >= 2:
             patterns.append(f"Focused on {top_location[0]} content")
 
     # Tag patterns
-    all_tags = []
-    for video in user_history:
-        all_tags.extend(video.get("tags", []))
-
-    tag_counts = {}
-    for tag in all_tags:
-        tag_counts[tag] = tag_counts.get(tag, 0) + 1
-
-    frequent_tags = [tag for tag, count in tag_counts.items() if count >= 2]
+    frequent_tags = [tag for tag, count in profile.tag_counts.items() if count >= 2]
     if frequent_tags:
         patterns.append(f"Interest in: {', '.join(frequent_tags[:3])}")
 
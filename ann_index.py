@@ -0,0 +1,270 @@
+"""Approximate nearest-neighbour index over catalog item vectors."""
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+
+from ranker import FEATURE_WEIGHTS, MAX_PROFILE_TAGS
+
+# Weight of each title word in an item vector (tags and category dominate)
+TITLE_WEIGHT = 0.35
+
+TOKEN_RE = re.compile(r"[a-z][a-z0-9]+")
+STOPWORDS = {"a", "an", "and", "for", "in", "is", "it", "of", "on", "the", "this", "to", "with", "you", "your"}
+
+
+class ItemVectorizer:
+    """
+    Hashes category, tag and title-word features into dense unit vectors.
+
+    Each feature lands in one of ``dim`` buckets with a hash-derived sign
+    (the hashing trick), so vectors need no vocabulary and items added to
+    the catalog later vectorize the same way.
+    """
+
+    def __init__(self, dim=128):
+        self.dim = dim
+        self._buckets = {}
+
+    def _bucket(self, feature):
+        bucket = self._buckets.get(feature)
+        if bucket is None:
+            h = zlib.crc32(feature.encode())
+            bucket = self._buckets[feature] = (h % self.dim, 1.0 if h & 0x80000000 else -1.0)
+        return bucket
+
+    def vector(self, weighted_features):
+        """Unit vector for an iterable of (feature, weight) pairs."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in weighted_features:
+            index, sign = self._bucket(feature)
+            vector[index] += sign * weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def item_features(video):
+        """Weighted features of one catalog item."""
+        category = video.get("category", "")
+        features = [("cat:" + category, FEATURE_WEIGHTS["cat"])]
+        features += [("tag:" + tag, FEATURE_WEIGHTS["tag"]) for tag in video.get("tags", []) if tag != category]
+        words = set(TOKEN_RE.findall(video.get("title", "").lower())) - STOPWORDS
+        features += [("word:" + word, TITLE_WEIGHT) for word in sorted(words)]
+        return features
+
+    @staticmethod
+    def profile_features(profile):
+        """Weighted features of a UserProfile, on the same scale as ranker.CatalogRanker.profile_vector."""
+        n = profile.num_videos
+        features = [("cat:" + c, FEATURE_WEIGHTS["cat"] * count / n) for c, count in profile.category_counts.items()]
+        tags = sorted(profile.tag_counts.items(), key=lambda x: x[1], reverse=True)[:MAX_PROFILE_TAGS]
+        features += [("tag:" + tag, FEATURE_WEIGHTS["tag"] * count / n) for tag, count in tags]
+        features += [
+            ("word:" + loc.lower(), FEATURE_WEIGHTS["loc"] * count / n) for loc, count in profile.location_counts.items()
+        ]
+        return features
+
+
+def spherical_kmeans(points, num_lists, iterations=10, seed=0, chunk=65536):
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Returns:
+        Tuple: (centroids, assignment) with unit-norm centroids and one list
+        number per point
+    """
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), num_lists, replace=False)].copy()
+    assignment = np.zeros(len(points), dtype=np.int32)
+    for _ in range(iterations):
+        for start in range(0, len(points), chunk):
+            assignment[start:start + chunk] = np.argmax(points[start:start + chunk] @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, points)
+        norms = np.linalg.norm(sums, axis=1)
+        empty = norms == 0
+        # Re-seed empty lists with random points
+        sums[empty] = points[rng.choice(len(points), int(empty.sum()), replace=False)]
+        norms[empty] = 1.0
+        centroids = (sums / norms[:, None]).astype(np.float32)
+    return centroids, assignment
+
+
+class VectorIndex:
+    """
+    IVF (inverted file) index over catalog item vectors, queried by profile.
+
+    Items with identical features share one vector ("point"); the members
+    of a point are kept most popular first, as in CatalogRanker. Points are
+    clustered with spherical k-means into ``num_lists`` lists. A query
+    scores the list centroids, scores only the points of the ``nprobe``
+    best lists, and walks them best first taking unused members, probing
+    more lists if exclusions leave fewer than ``k`` results.
+
+    top_k() has the signature of CatalogRanker.top_k, so the index can
+    serve as the candidate source of app.select_candidates.
+    """
+
+    def __init__(self, catalog, dim=128, num_lists=None, nprobe=8, iterations=10, seed=0):
+        """
+        Args:
+            catalog: Catalog to index
+            dim: Vector size
+            num_lists: Number of IVF lists (default: about sqrt(points))
+            nprobe: Lists scored per query
+            iterations: k-means iterations
+            seed: Seed of the k-means initialisation
+        """
+        start = time.perf_counter()
+        self.catalog = catalog
+        self.vectorizer = ItemVectorizer(dim)
+        self.nprobe = nprobe
+
+        point_of_key = {}
+        members = []
+        for row, video in enumerate(catalog):
+            key = (video.get("category", ""), video.get("title", ""), tuple(video.get("tags", ())))
+            point = point_of_key.get(key)
+            if point is None:
+                point = point_of_key[key] = len(members)
+                members.append([])
+            members[point].append(row)
+        self.points = np.empty((len(members), dim), dtype=np.float32)
+        for point, rows in enumerate(members):
+            self.points[point] = self.vectorizer.vector(self.vectorizer.item_features(catalog.items[rows[0]]))
+
+        # Tiny popularity prior so ties break towards widely viewed items
+        views = np.fromiter((v.get("views", 0) for v in catalog), dtype=np.float64, count=len(catalog))
+        log_views = np.log1p(views)
+        peak = log_views.max() if len(log_views) else 0.0
+        prior = 1e-3 * log_views / peak if peak else log_views
+        self.members = [sorted(rows, key=lambda r: -prior[r]) for rows in members]
+        # A vector ranks by its most popular member
+        self.prior = np.fromiter((prior[rows[0]] for rows in self.members), dtype=np.float32, count=len(self.members))
+
+        num_lists = num_lists or max(1, int(np.sqrt(len(self.points))))
+        self.num_lists = min(num_lists, len(self.points))
+        self.centroids, assignment = spherical_kmeans(self.points, self.num_lists, iterations, seed)
+        order = np.argsort(assignment, kind="stable")
+        self.list_points = order.astype(np.int32)
+        self.list_offsets = np.searchsorted(assignment[order], np.arange(self.num_lists + 1)).astype(np.int64)
+        self.build_seconds = time.perf_counter() - start
+        self._queries = 0
+        self._points_scored = 0
+
+    def query_vector(self, profile):
+        return self.vectorizer.vector(self.vectorizer.profile_features(profile))
+
+    def _walk(self, candidate_points, query, k, excluded_rows):
+        """Best-first unused members of the given points."""
+        scores = self.points[candidate_points] @ query + self.prior[candidate_points]
+        items = self.catalog.items
+        # Sort only the best few points; widen if exclusions use them up
+        size = min(len(scores), max(4 * k, 256))
+        while True:
+            best = np.argpartition(-scores, size - 1)[:size] if size < len(scores) else np.arange(len(scores))
+            found = []
+            for i in best[np.argsort(-scores[best], kind="stable")]:
+                for row in self.members[candidate_points[i]]:
+                    if row not in excluded_rows:
+                        found.append(items[row])
+                        if len(found) >= k:
+                            return found
+            if size >= len(scores):
+                return found
+            size = min(len(scores), size * 4)
+
+    def top_k(self, profile, k, exclude=(), nprobe=None):
+        """
+        Return about the ``k`` best unused videos for a profile, best first.
+
+        Args:
+            profile: UserProfile of the session
+            k: Number of videos to return
+            exclude: Collection of video ids already used
+            nprobe: Lists to probe (default: the index's nprobe)
+
+        Returns:
+            List of video dicts
+        """
+        if profile.num_videos == 0:
+            return []
+        query = self.query_vector(profile)
+        excluded_rows = {row for row in map(self.catalog.row_of, exclude) if row is not None}
+        list_order = np.argsort(-(self.centroids @ query))
+        probe = min(nprobe or self.nprobe, self.num_lists)
+        while True:
+            lists = list_order[:probe]
+            candidate_points = np.concatenate([
+                self.list_points[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists
+            ])
+            found = self._walk(candidate_points, query, k, excluded_rows)
+            if len(found) >= k or probe >= self.num_lists:
+                break
+            probe = min(probe * 2, self.num_lists)
+        self._queries += 1
+        self._points_scored += len(candidate_points)
+        return found
+
+    def exact_top_k(self, profile, k, exclude=()):
+        """Brute-force version of top_k: every point is scored."""
+        if profile.num_videos == 0:
+            return []
+        excluded_rows = {row for row in map(self.catalog.row_of, exclude) if row is not None}
+        return self._walk(np.arange(len(self.points)), self.query_vector(profile), k, excluded_rows)
+
+    def recall(self, queries, k, nprobe=None):
+        """
+        Mean share of the exact top ``k`` that top_k() finds.
+
+        Args:
+            queries: List of (profile, exclude) pairs
+            k: Result size compared
+            nprobe: Lists to probe (default: the index's nprobe)
+
+        Returns:
+            float: Recall@k in [0, 1]
+        """
+        total = 0.0
+        for profile, exclude in queries:
+            exact = {v["id"] for v in self.exact_top_k(profile, k, exclude)}
+            if exact:
+                found = {v["id"] for v in self.top_k(profile, k, exclude, nprobe=nprobe)}
+                total += len(found & exact) / len(exact)
+            else:
+                total += 1.0
+        return total / len(queries) if queries else 1.0
+
+    def stats(self):
+        return {
+            "items": len(self.catalog),
+            "points": len(self.points),
+            "lists": self.num_lists,
+            "nprobe": self.nprobe,
+            "dim": self.vectorizer.dim,
+            "build_ms": round(self.build_seconds * 1000, 1),
+            "queries": self._queries,
+            "avg_points_scored": round(self._points_scored / self._queries, 1) if self._queries else 0.0,
+        }
+
+
+def create_vector_index(catalog):
+    """
+    Build the candidate index for a catalog from environment configuration.
+
+    Returns:
+        VectorIndex, or None when ANN_INDEX_ENABLED is off
+    """
+    if os.getenv("ANN_INDEX_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    index = VectorIndex(
+        catalog,
+        dim=int(os.getenv("ANN_DIM", 128)),
+        num_lists=int(os.getenv("ANN_LISTS", 0)) or None,
+        nprobe=int(os.getenv("ANN_NPROBE", 8)),
+    )
+    stats = index.stats()
+    print(f"✓ Indexed {stats['points']} item vectors in {stats['lists']} lists ({stats['build_ms']} ms)")
+    return index
@@ -1,11 +1,30 @@
 """Flask web application for video recommendation system."""
-import os
 import json
-from flask import Flask, render_template, request, session, redirect, url_for, jsonify
+import os
+import random
+import secrets
+from contextlib import nullcontext
+from flask import Flask, Response, g, render_template, request, session, redirect, url_for, jsonify
 from dotenv import load_dotenv
-from video_generator import generate_initial_videos, generate_video_pool, format_video_for_prompt
+from video_generator import TITLE_MATCHER, generate_initial_videos, generate_video_pool, format_video_for_prompt
 from recommender import VideoRecommender
-from analytics import calculate_familiarity_score, get_preference_insights
+from batching import BatchingRecommender
+from tiered import TieredRecommender
+from catalog import Catalog
+from compiled_catalog import load_catalog
+from ranker import CatalogRanker, CategoryRecommender, LocalRecommender
+from session_store import SQLiteSessionBackend, create_session_interface
+from funnel import build_funnel, record_familiarity
+from prefetch import RecommendationPrefetcher
+from recommendation_cache import create_cache
+from prompt_builder import PromptBuilder
+from llm_guard import create_guard
+from ann_index import create_vector_index
+from coclick import create_coclick
+from singleflight import create_singleflight
+from metrics import create_metrics
+from profiling import create_profiler
+from analytics import UserProfile, calculate_familiarity_score, get_preference_insights
 
 # Load environment variables
 load_dotenv()
@@ -13,15 +32,91 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret-key-change-in-production")
 
-# Load pre-generated thumbnails from config
-THUMBNAILS_POOL = []
+# Keep session data server-side; the cookie only carries a signed session id
+session_interface = create_session_interface()
+if session_interface is not None:
+    app.session_interface = session_interface
+
+# Load pre-generated thumbnails from config and index them once
+CATALOG_PATH = os.getenv("CATALOG_PATH", "thumbnails_config.json")
 try:
-    with open("thumbnails_config.json", "r") as f:
-        THUMBNAILS_POOL = json.load(f)
-    print(f"✓ Loaded {len(THUMBNAILS_POOL)} pre-generated thumbnails")
+    CATALOG = load_catalog(CATALOG_PATH)
+    print(f"✓ Loaded {len(CATALOG)} pre-generated thumbnails from {CATALOG_PATH}")
 except FileNotFoundError:
-    print("⚠ Warning: thumbnails_config.json not found. Run generate_thumbnails_config.py first.")
-    THUMBNAILS_POOL = generate_video_pool(1000, user_history=None)
+    print(f"⚠ Warning: {CATALOG_PATH} not found. Run generate_thumbnails_config.py first.")
+    CATALOG = Catalog(generate_video_pool(1000, user_history=None))
+
+# Local ranker: zero-LLM recommender and prefilter for the LLM candidate list
+RANKER = CatalogRanker(CATALOG)
+LOCAL_RECOMMENDER = LocalRecommender(RANKER)
+CATEGORY_RECOMMENDER = CategoryRecommender(RANKER)
+# Optional approximate nearest-neighbour index replacing the ranker as the candidate source
+ANN_INDEX = create_vector_index(CATALOG)
+CANDIDATE_INDEX = ANN_INDEX if ANN_INDEX is not None else RANKER
+RECOMMENDER_BACKEND = os.getenv("RECOMMENDER_BACKEND", "claude").lower()
+# With the "tiered" backend: when the local ranker is trusted instead of Claude
+TIER_OPTIONS = {
+    "min_familiarity": int(os.getenv("TIER_MIN_FAMILIARITY", 60)),
+    "min_dominance": float(os.getenv("TIER_MIN_DOMINANCE", 0.6)),
+    "shift_window": int(os.getenv("TIER_SHIFT_WINDOW", 3)),
+    "sample_rate": float(os.getenv("TIER_LLM_SAMPLE_RATE", 0.05)),
+}
+LLM_CANDIDATES = int(os.getenv("LLM_CANDIDATES", 40))
+LLM_EXPLORE_CANDIDATES = int(os.getenv("LLM_EXPLORE_CANDIDATES", 10))
+COCLICK_CANDIDATES = int(os.getenv("COCLICK_CANDIDATES", 10))
+
+# "Chose A, then B" counts from every session, aggregated in the background
+COCLICK = create_coclick()
+
+# Cache of Claude's answers shared by every recommender in this process
+REC_CACHE = create_cache()
+
+# Prompt fragments for every catalog item are built once at startup
+PROMPT_BUILDER = PromptBuilder(
+    token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", 1500)),
+    history_window=int(os.getenv("PROMPT_HISTORY_WINDOW", 8)),
+    catalog=CATALOG,
+)
+# Also send the catalog listing in the cached system prefix (candidates become handles)
+PROMPT_CACHE_CATALOG = os.getenv("PROMPT_CACHE_CATALOG", "false").lower() in ("1", "true", "yes")
+# Stream ids-first answers and stop generating once the ids are in
+LLM_STREAM_IDS = os.getenv("LLM_STREAM_IDS", "false").lower() in ("1", "true", "yes")
+
+# Send up to this many concurrent Claude requests as one call (1 = no batching)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", 1))
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", 5))
+
+# Deadline, hedging and circuit breaker around every Claude call
+LLM_GUARD = create_guard()
+
+# Identical concurrent Claude requests (across threads and local workers) share one call
+SINGLEFLIGHT = create_singleflight()
+
+# Per-stage timers, Server-Timing headers and the Prometheus /metrics endpoint
+METRICS = create_metrics()
+if METRICS is not None:
+    METRICS.gauge("catalog_items", lambda: len(CATALOG), "Items in the catalog")
+    if session_interface is not None:
+        # The SQLite store is shared by the workers on a host, the in-memory one is per worker
+        METRICS.gauge(
+            "sessions", lambda: len(session_interface.backend), "Stored sessions",
+            aggregate="max" if isinstance(session_interface.backend, SQLiteSessionBackend) else "sum"
+        )
+
+
+# Profiles single requests on demand (admin token) or when slow; None when off
+PROFILER = create_profiler()
+
+
+def stage(name):
+    """Time a block as request stage ``name`` (see metrics.Metrics); a no-op with metrics off."""
+    return METRICS.stage(name) if METRICS is not None else nullcontext()
+
+
+def count(name, **labels):
+    """Increment a metrics counter, if metrics are on."""
+    if METRICS is not None:
+        METRICS.inc(name, **labels)
 
 # Initialize recommender lazily
 recommender = None
@@ -30,19 +125,242 @@ def get_recommender():
     """Get or create the recommender instance."""
     global recommender
     if recommender is None:
-        recommender = VideoRecommender()
+        if RECOMMENDER_BACKEND == "local":
+            recommender = LOCAL_RECOMMENDER
+        else:
+            recommender = VideoRecommender(
+                cache=REC_CACHE, prompt_builder=PROMPT_BUILDER, cache_catalog=PROMPT_CACHE_CATALOG,
+                guard=LLM_GUARD, fallback=LOCAL_RECOMMENDER, stream_ids=LLM_STREAM_IDS,
+                singleflight=SINGLEFLIGHT, metrics=METRICS
+            )
+            if LLM_BATCH_SIZE > 1:
+                recommender = BatchingRecommender(
+                    recommender, max_batch=LLM_BATCH_SIZE, window=LLM_BATCH_WINDOW_MS / 1000
+                )
+            if RECOMMENDER_BACKEND == "tiered":
+                recommender = TieredRecommender(LOCAL_RECOMMENDER, recommender, **TIER_OPTIONS)
     return recommender
 
 
+def session_id(state):
+    """Stable per-session token used to key server-side work such as prefetches."""
+    sid = state.get("sid")
+    if sid is None:
+        sid = state["sid"] = secrets.token_urlsafe(12)
+    return sid
+
+
+def select_candidates(history, profile, used_set):
+    """
+    Build the candidate list the recommender chooses from.
+
+    Returns:
+        Tuple: (history_for_prompt, candidates_for_prompt)
+    """
+    # Best locally ranked candidates plus a few random ones for exploration.
+    # The exploration draw is seeded by the history so identical sessions
+    # build identical candidate sets and can share cached answers.
+    with stage("catalog"):
+        candidates = CANDIDATE_INDEX.top_k(profile, LLM_CANDIDATES, exclude=used_set)
+        # Then what other sessions chose right after this session's latest choices
+        if COCLICK is not None and COCLICK_CANDIDATES:
+            candidates += CATALOG.resolve(COCLICK.candidates(
+                [v["id"] for v in history], COCLICK_CANDIDATES,
+                exclude=set(used_set) | {v["id"] for v in candidates}
+            ))
+        explore_rng = random.Random("|".join(v["id"] for v in history))
+        candidates += CATALOG.sample(
+            LLM_EXPLORE_CANDIDATES, exclude=set(used_set) | {v["id"] for v in candidates},
+            rng=explore_rng
+        )
+
+    with stage("prompt"):
+        history_for_prompt = [format_video_for_prompt(v) for v in history]
+        candidates_for_prompt = [format_video_for_prompt(v) for v in candidates]
+    return history_for_prompt, candidates_for_prompt
+
+
+def compute_recommendations(history, profile, used_set):
+    """
+    Pick the next three videos for a session state.
+
+    Only reads its arguments and module-level state, so it can also run
+    in the prefetch pool outside of a request.
+
+    Args:
+        history: List of chosen video dicts, oldest first
+        profile: UserProfile for that history
+        used_set: Set of video ids already shown or chosen
+
+    Returns:
+        Tuple: (recommended_videos, analysis_text)
+    """
+    history_for_prompt, candidates_for_prompt = select_candidates(history, profile, used_set)
+
+    try:
+        rec = get_recommender()
+        recommended_ids, analysis_text = rec.recommend(history_for_prompt, candidates_for_prompt, 3)
+        if analysis_text is None:
+            analysis_text = LOCAL_RECOMMENDER.explain(profile)
+        return CATALOG.resolve(recommended_ids), analysis_text
+
+    except Exception as e:
+        print(f"Recommendation error: {e}")
+        import traceback
+        traceback.print_exc()
+        count("fallbacks_total", reason="exception")
+        # Fallback to the local ranker
+        recommended_ids, analysis_text = LOCAL_RECOMMENDER.recommend(history_for_prompt, candidates_for_prompt, 3)
+        return CATALOG.resolve(recommended_ids), analysis_text
+
+
+def stream_recommendations(history, profile, used_set):
+    """
+    Like compute_recommendations, but returns as soon as the ids are known.
+
+    With the Claude backend the answer is streamed ids first, so this
+    returns while Claude is still writing the analysis.
+
+    Returns:
+        Tuple: (recommended_videos, analysis_chunks) where analysis_chunks
+        is an iterator of analysis text pieces
+    """
+    history_for_prompt, candidates_for_prompt = select_candidates(history, profile, used_set)
+
+    try:
+        rec = get_recommender()
+        if not hasattr(rec, "recommend_stream"):
+            recommended_ids, analysis_text = rec.recommend(history_for_prompt, candidates_for_prompt, 3)
+            return CATALOG.resolve(recommended_ids), iter([analysis_text])
+        events = rec.recommend_stream(history_for_prompt, candidates_for_prompt, 3)
+        _, recommended_ids = next(events)
+
+    except Exception as e:
+        print(f"Recommendation error: {e}")
+        import traceback
+        traceback.print_exc()
+        count("fallbacks_total", reason="exception")
+        # Fallback to the local ranker
+        recommended_ids, analysis_text = LOCAL_RECOMMENDER.recommend(history_for_prompt, candidates_for_prompt, 3)
+        return CATALOG.resolve(recommended_ids), iter([analysis_text])
+
+    def analysis_chunks():
+        streamed = False
+        try:
+            for _, text in events:
+                streamed = True
+                yield text
+        finally:
+            events.close()
+        if not streamed:
+            yield LOCAL_RECOMMENDER.explain(profile)
+
+    return CATALOG.resolve(recommended_ids), analysis_chunks()
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def round_stats(payload, analysis_text):
+    """The closing event of a streamed round: scores, insights and counters."""
+    keys = ("familiarity_score", "insights", "round", "total_rounds", "pool_remaining")
+    stats = {key: payload[key] for key in keys}
+    stats["analysis"] = analysis_text
+    return stats
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def schedule_prefetch(sid, history_ids, history, profile, used_ids, recommended_videos):
+    """Prefetch the follow-up recommendations for each video on offer."""
+    used_set = frozenset(used_ids)
+    for video in recommended_videos:
+        next_profile = UserProfile.from_dict(profile.to_dict())
+        next_profile.add(video)
+        PREFETCHER.schedule(
+            sid, video["id"], history_ids + [video["id"]],
+            history=history + [video], profile=next_profile, used_set=used_set
+        )
+
+
+PREFETCHER = None
+# Opt-in: every round schedules a follow-up per offered video, about three
+# Claude calls of which at most one is used
+if os.getenv("PREFETCH_ENABLED", "false").lower() in ("1", "true", "yes"):
+    PREFETCHER = RecommendationPrefetcher(
+        compute_recommendations,
+        max_workers=int(os.getenv("PREFETCH_WORKERS", 4)),
+        max_pending=int(os.getenv("PREFETCH_MAX_PENDING", 256)),
+    )
+# A running prefetch is the same call the request would make, so waiting for it
+# up to the LLM deadline is never slower than starting over
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", 10))
+
+
+def load_profile(state, history_ids):
+    """Restore the session's UserProfile, rebuilding it if it is missing or stale."""
+    data = state.get("profile")
+    if data is not None and data["n"] == len(history_ids):
+        return UserProfile.from_dict(data)
+    return UserProfile.from_history(CATALOG.resolve(history_ids))
+
+
+if METRICS is not None:
+    @app.before_request
+    def start_request_timing():
+        g.metrics_token = METRICS.start_request()
+
+    @app.after_request
+    def add_server_timing(response):
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            # Endpoint names (view functions), not paths, keep the label set small
+            response.headers["Server-Timing"] = METRICS.finish_request(
+                token, request.endpoint or "unmatched", response.status_code
+            )
+        return response
+
+
+if PROFILER is not None:
+    @app.before_request
+    def start_profile():
+        # The admin token comes as a header, or as ?profile=<token> for a browser
+        g.profile = PROFILER.begin(
+            request.headers.get("X-Profile-Token") or request.args.get("profile"),
+            request.headers.get("X-Profile-Mode") or request.args.get("profile_mode")
+        )
+
+    @app.after_request
+    def save_profile(response):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            path = PROFILER.end(profile, request.endpoint or "unmatched")
+            if path is not None and not profile.automatic:
+                response.headers["X-Profile-File"] = os.path.basename(path)
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # after_request is skipped when the view raised
+        profile = g.pop("profile", None)
+        if profile is not None:
+            PROFILER.cancel(profile)
+
+
 @app.route("/")
 def index():
     """Initial landing page with 3 starter videos."""
-    # Reset session
+    # Reset session and drop any prefetches made for it
+    if PREFETCHER is not None and "sid" in session:
+        PREFETCHER.cancel_session(session["sid"])
     session.clear()
 
     # Pick 3 random initial videos from the pool
-    import random
-    initial_videos = random.sample(THUMBNAILS_POOL, 3)
+    with stage("catalog"):
+        initial_videos = CATALOG.sample(3)
 
     # Store in session
     session["history"] = []
@@ -50,7 +368,8 @@ def index():
     session["total_rounds"] = 0
     session["used_video_ids"] = []  # Track used IDs
 
-    return render_template("index.html", videos=initial_videos)
+    with stage("render"):
+        return render_template("index.html", videos=initial_videos)
 
 
 @app.route("/choose", methods=["POST"])
@@ -68,7 +387,7 @@ def choose():
     current_recommendations = session.get("current_recommendations", [])
 
     # Find the chosen video from the pool
-    chosen_video = next((v for v in THUMBNAILS_POOL if v["id"] == video_id), None)
+    chosen_video = CATALOG.get(video_id)
 
     if not chosen_video:
         return redirect(url_for("index"))
@@ -82,8 +401,17 @@ def choose():
         used_ids.append(video_id)
         session["used_video_ids"] = used_ids
 
-    # Add to history
-    history.append(chosen_video)
+    if COCLICK is not None and history:
+        COCLICK.record(history[-1], video_id)
+
+    # Fold the choice into the running profile
+    with stage("profile"):
+        profile = load_profile(session, history)
+        profile.add(chosen_video)
+        session["profile"] = profile.to_dict()
+
+    # Add to history (ids only; videos are rehydrated from the catalog)
+    history.append(video_id)
     session["history"] = history
     session["total_rounds"] = session.get("total_rounds", 0) + 1
 
@@ -101,46 +429,37 @@ def new_round():
         return redirect(url_for("index"))
 
     # Get available thumbnails (excluding used ones)
-    thumbnail_pool = [v for v in THUMBNAILS_POOL if v["id"] not in used_ids]
+    used_set = set(used_ids)
 
-    if len(thumbnail_pool) < 3:
-        # Pool exhausted
-        return redirect(url_for("results"))
+    with stage("catalog"):
+        if CATALOG.available_count(used_set) < 3:
+            # Pool exhausted
+            return redirect(url_for("results"))
 
     # Use smart category-based recommendations for speed
-    import random
-    from collections import Counter
-
-    # Get user's preferred categories from history
-    category_counts = Counter([v["category"] for v in history])
-    preferred_category = category_counts.most_common(1)[0][0] if category_counts else None
-
-    # Find videos matching preferred category (60%) and diverse (40%)
-    if preferred_category:
-        matching = [v for v in thumbnail_pool if v["category"] == preferred_category][:10]
-        diverse = [v for v in thumbnail_pool if v["category"] != preferred_category][:10]
-        candidates = matching + diverse
-        recommended_videos_sample = random.sample(candidates, min(3, len(candidates)))
-        analysis_text = f"Based on your {len(history)} choices, you seem to enjoy {preferred_category} content. I'm showing you more {preferred_category} videos with some variety."
-    else:
-        recommended_videos_sample = random.sample(thumbnail_pool, min(3, len(thumbnail_pool)))
-        analysis_text = "Exploring your interests with a diverse selection."
+    with stage("profile"):
+        profile = load_profile(session, history)
+
+    with stage("catalog"):
+        recommended_videos_sample, analysis_text = CATEGORY_RECOMMENDER.pick(profile, used_set)
 
     recommended_ids = [v["id"] for v in recommended_videos_sample]
 
-    # Calculate familiarity score
-    familiarity_score = calculate_familiarity_score(history)
+    with stage("profile"):
+        # Calculate familiarity score and keep it for the funnel view
+        familiarity_score = calculate_familiarity_score(profile)
+        session["familiarity_trail"] = record_familiarity(
+            session.get("familiarity_trail", []), len(history), familiarity_score
+        )
 
-    # Get preference insights
-    insights = get_preference_insights(history)
+        # Get preference insights
+        insights = get_preference_insights(profile)
 
     session["current_recommendations"] = recommended_ids
     session["round"] = session.get("round", 0) + 1
 
     # Get the recommended video objects
-    recommended_videos = [
-        v for v in thumbnail_pool if v["id"] in recommended_ids
-    ]
+    recommended_videos = CATALOG.resolve(recommended_ids)
 
     # Debug logging
     print(f"[DEBUG] Round {session['round']}")
@@ -148,22 +467,23 @@ def new_round():
     print(f"[DEBUG] Familiarity Score: {familiarity_score}")
     print(f"[DEBUG] Insights: {insights}")
 
-    return render_template(
-        "round.html",
-        videos=recommended_videos,
-        round_num=session["round"],
-        total_rounds=session["total_rounds"],
-        pool_remaining=len(THUMBNAILS_POOL) - len(used_ids),
-        analysis=analysis_text,
-        familiarity_score=familiarity_score,
-        insights=insights
-    )
+    with stage("render"):
+        return render_template(
+            "round.html",
+            videos=recommended_videos,
+            round_num=session["round"],
+            total_rounds=session["total_rounds"],
+            pool_remaining=CATALOG.available_count(used_set),
+            analysis=analysis_text,
+            familiarity_score=familiarity_score,
+            insights=insights
+        )
 
 
 @app.route("/results")
 def results():
     """Show results and statistics."""
-    history = session.get("history", [])
+    history = CATALOG.resolve(session.get("history", []))
     total_rounds = session.get("total_rounds", 0)
     recommendation_hits = session.get("recommendation_hits", 0)
 
@@ -182,109 +502,37 @@ def results():
     if total_rounds > 1:
         accuracy = round((recommendation_hits / (total_rounds - 1)) * 100, 1)
 
-    return render_template(
-        "results.html",
-        history=history,
-        total_rounds=total_rounds,
-        category_counts=category_counts,
-        accuracy=accuracy,
-        recommendation_hits=recommendation_hits
-    )
+    with stage("render"):
+        return render_template(
+            "results.html",
+            history=history,
+            total_rounds=total_rounds,
+            category_counts=category_counts,
+            accuracy=accuracy,
+            recommendation_hits=recommendation_hits
+        )
 
 
 @app.route("/funnel")
 def funnel():
     """Visualization of recommendation funnel showing AI learning progression."""
-    from collections import Counter
-
-    history = session.get("history", [])
+    history = CATALOG.resolve(session.get("history", []))
 
     if not history:
         return redirect(url_for("index"))
 
-    # Category colors for visualization
-    CATEGORY_COLORS = {
-        "food": "#ef4444",
-        "travel": "#3b82f6",
-        "tech": "#8b5cf6",
-        "lifestyle": "#ec4899",
-        "education": "#10b981",
-        "entertainment": "#f59e0b"
-    }
+    with stage("profile"):
+        initial_distribution, funnel_levels, final_stats = build_funnel(
+            CATALOG, history, session.get("familiarity_trail", [])
+        )
 
-    # Calculate initial distribution (all 1000 thumbnails)
-    initial_counts = Counter([v["category"] for v in THUMBNAILS_POOL])
-    initial_distribution = {}
-    for category, count in initial_counts.items():
-        initial_distribution[category] = {
-            "count": count,
-            "percentage": round((count / len(THUMBNAILS_POOL)) * 100, 1),
-            "color": CATEGORY_COLORS.get(category, "#6b7280")
-        }
-
-    # Build funnel levels for each choice
-    funnel_levels = []
-    cumulative_used_ids = []
-
-    for i, chosen_video in enumerate(history):
-        # Track used IDs up to this point
-        cumulative_used_ids.append(chosen_video["id"])
-
-        # Get remaining pool after this choice
-        remaining_pool = [v for v in THUMBNAILS_POOL if v["id"] not in cumulative_used_ids]
-
-        # Calculate category distribution in remaining pool
-        remaining_counts = Counter([v["category"] for v in remaining_pool])
-        distribution = {}
-        for category, count in remaining_counts.items():
-            distribution[category] = {
-                "count": count,
-                "percentage": round((count / len(remaining_pool)) * 100, 1) if remaining_pool else 0,
-                "color": CATEGORY_COLORS.get(category, "#6b7280")
-            }
-
-        # Calculate user's preferred category so far
-        history_so_far = history[:i+1]
-        category_preference = Counter([v["category"] for v in history_so_far])
-        preferred_category = category_preference.most_common(1)[0][0] if category_preference else None
-
-        # Generate insight about AI learning
-        if i == 0:
-            insight = f"First choice revealed interest in {chosen_video['category']} content. Filtering begins."
-        else:
-            if chosen_video["category"] == preferred_category:
-                insight = f"Confirmed preference for {preferred_category}. Narrowing focus on similar content."
-            else:
-                insight = f"Exploring {chosen_video['category']} while maintaining {preferred_category} as primary interest."
-
-        # Calculate familiarity score at this point
-        familiarity_score = calculate_familiarity_score(history_so_far)
-
-        funnel_levels.append({
-            "chosen": chosen_video,
-            "remaining": len(remaining_pool),
-            "distribution": distribution,
-            "preferred_category": preferred_category,
-            "insight": insight,
-            "familiarity_score": familiarity_score
-        })
-
-    # Final stats
-    final_category_counts = Counter([v["category"] for v in history])
-    primary_category = final_category_counts.most_common(1)[0][0] if final_category_counts else "None"
-
-    final_stats = {
-        "primary_category": primary_category,
-        "familiarity": calculate_familiarity_score(history),
-        "remaining": len([v for v in THUMBNAILS_POOL if v["id"] not in cumulative_used_ids])
-    }
-
-    return render_template(
-        "funnel.html",
-        initial_distribution=initial_distribution,
-        funnel_levels=funnel_levels,
-        final_stats=final_stats
-    )
+    with stage("render"):
+        return render_template(
+            "funnel.html",
+            initial_distribution=initial_distribution,
+            funnel_levels=funnel_levels,
+            final_stats=final_stats
+        )
 
 
 @app.route("/continue", methods=["POST"])
@@ -293,102 +541,220 @@ def continue_session():
     return redirect(url_for("new_round"))
 
 
-@app.route("/api/recommend", methods=["POST"])
-def api_recommend():
-    """API endpoint for infinite scroll - get recommendations after a choice."""
-    data = request.get_json()
-    video_id = data.get("video_id")
+def start_recommend_round(state, video_id):
+    """
+    Apply a choice made in the infinite-scroll view to the session state.
 
+    Shared by the sync endpoint below and the async one in async_app.py.
+
+    Args:
+        state: The session mapping
+        video_id: Id of the chosen video
+
+    Returns:
+        Tuple: (error, round_state). ``error`` is a (payload, status) pair to
+        answer with instead of recommending; otherwise ``round_state`` holds
+        what compute_recommendations() and finish_recommend_round() need.
+    """
     if not video_id:
-        return jsonify({"error": "No video_id provided"}), 400
+        return ({"error": "No video_id provided"}, 400), None
 
-    history = session.get("history", [])
-    used_ids = session.get("used_video_ids", [])
-    previous_recommendations = session.get("current_recommendations", [])
+    history_ids = state.get("history", [])
+    used_ids = state.get("used_video_ids", [])
+    previous_recommendations = state.get("current_recommendations", [])
 
     # Find the chosen video from the pool
-    chosen_video = next((v for v in THUMBNAILS_POOL if v["id"] == video_id), None)
+    chosen_video = CATALOG.get(video_id)
 
     if not chosen_video:
-        return jsonify({"error": "Video not found"}), 404
+        return ({"error": "Video not found"}, 404), None
 
     # Track if user chose a recommended video (not the initial 3)
     if previous_recommendations and video_id in previous_recommendations:
-        session["recommendation_hits"] = session.get("recommendation_hits", 0) + 1
+        state["recommendation_hits"] = state.get("recommendation_hits", 0) + 1
 
-    # Add to history
-    history.append(chosen_video)
-    session["history"] = history
-    session["total_rounds"] = session.get("total_rounds", 0) + 1
+    if COCLICK is not None and history_ids:
+        COCLICK.record(history_ids[-1], video_id)
+
+    # Fold the choice into the running profile
+    with stage("profile"):
+        profile = load_profile(state, history_ids)
+        profile.add(chosen_video)
+        state["profile"] = profile.to_dict()
+
+    # Add to history (ids only; videos are rehydrated from the catalog)
+    history_ids.append(video_id)
+    state["history"] = history_ids
+    state["total_rounds"] = state.get("total_rounds", 0) + 1
 
     # Track used video
     if video_id not in used_ids:
         used_ids.append(video_id)
-        session["used_video_ids"] = used_ids
+        state["used_video_ids"] = used_ids
 
     # Get available thumbnails (excluding used ones)
-    available_pool = [v for v in THUMBNAILS_POOL if v["id"] not in used_ids]
+    with stage("catalog"):
+        history = CATALOG.resolve(history_ids)
+        used_set = set(used_ids)
+        available_count = CATALOG.available_count(used_set)
 
-    if len(available_pool) < 3:
-        return jsonify({
+    if available_count < 3:
+        return ({
             "error": "Pool exhausted",
             "message": "You've explored all available thumbnails!"
-        }), 200
+        }, 200), None
+
+    return None, {
+        "sid": session_id(state),
+        "video_id": video_id,
+        "history_ids": history_ids,
+        "history": history,
+        "profile": profile,
+        "used_ids": used_ids,
+        "used_set": used_set,
+        "available_count": available_count,
+    }
 
-    # Get recommendations from Claude
-    history_for_prompt = [format_video_for_prompt(v) for v in history]
-    candidates_for_prompt = [format_video_for_prompt(v) for v in available_pool[:100]]  # Limit to 100 for performance
 
-    analysis_text = "Analyzing your preferences..."
-    recommended_videos = []
+# Catalog item fields for internal use only (integer attribute codes), never sent to clients
+INTERNAL_FIELDS = frozenset({"attrs"})
 
-    try:
-        rec = get_recommender()
-        recommended_ids, analysis_text = rec.recommend(history_for_prompt, candidates_for_prompt, 3)
 
-        # Get the recommended video objects
-        recommended_videos = [v for v in available_pool if v["id"] in recommended_ids]
+def public_video(video):
+    """A video dict without its internal fields, for API responses."""
+    return {key: value for key, value in video.items() if key not in INTERNAL_FIELDS}
 
-        # Track these as used
-        for rec_id in recommended_ids:
-            if rec_id not in used_ids:
-                used_ids.append(rec_id)
-        session["used_video_ids"] = used_ids
 
-    except Exception as e:
-        print(f"Recommendation error: {e}")
-        import traceback
-        traceback.print_exc()
-        # Fallback to random
-        import random
-        recommended_videos = random.sample(available_pool, min(3, len(available_pool)))
-        analysis_text = "Unable to analyze preferences at this time. Showing random selections."
+def finish_recommend_round(state, round_state, recommended_videos, analysis_text):
+    """
+    Record the recommendations in the session and build the JSON payload.
+
+    Returns:
+        dict: Response payload of /api/recommend
+    """
+    used_ids = round_state["used_ids"]
+    history = round_state["history"]
+    profile = round_state["profile"]
+
+    # Track these as used
+    for video in recommended_videos:
+        if video["id"] not in used_ids:
+            used_ids.append(video["id"])
+    state["used_video_ids"] = used_ids
+
+    # Start on the follow-up for each of the three possible next choices
+    if PREFETCHER is not None:
+        schedule_prefetch(
+            round_state["sid"], round_state["history_ids"], history, profile, used_ids, recommended_videos
+        )
 
     # Calculate familiarity score and insights
-    familiarity_score = calculate_familiarity_score(history)
-    insights = get_preference_insights(history)
+    with stage("profile"):
+        familiarity_score = calculate_familiarity_score(profile)
+        insights = get_preference_insights(profile)
+        state["familiarity_trail"] = record_familiarity(
+            state.get("familiarity_trail", []), len(history), familiarity_score
+        )
 
-    session["round"] = session.get("round", 0) + 1
+    state["round"] = state.get("round", 0) + 1
 
     # Store current recommendations for next click tracking
-    session["current_recommendations"] = [v["id"] for v in recommended_videos]
+    state["current_recommendations"] = [v["id"] for v in recommended_videos]
 
-    return jsonify({
+    return {
         "success": True,
-        "recommendations": recommended_videos,
+        "recommendations": [public_video(v) for v in recommended_videos],
         "analysis": analysis_text,
         "familiarity_score": familiarity_score,
         "insights": insights,
-        "round": session["round"],
-        "total_rounds": session["total_rounds"],
-        "pool_remaining": len(available_pool) - 3
-    })
+        "round": state["round"],
+        "total_rounds": state["total_rounds"],
+        "pool_remaining": round_state["available_count"] - 3
+    }
+
+
+@app.route("/api/recommend", methods=["POST"])
+def api_recommend():
+    """API endpoint for infinite scroll - get recommendations after a choice."""
+    data = request.get_json()
+    error, round_state = start_recommend_round(session, data.get("video_id"))
+    if error is not None:
+        return jsonify(error[0]), error[1]
+
+    # Serve the speculative follow-up for this choice if one was prefetched
+    result = None
+    if PREFETCHER is not None:
+        result = PREFETCHER.take(
+            round_state["sid"], round_state["video_id"], round_state["history_ids"],
+            timeout=PREFETCH_WAIT_SECONDS
+        )
+    if result is None:
+        result = compute_recommendations(round_state["history"], round_state["profile"], round_state["used_set"])
+    else:
+        count("prefetch_served_total")
+
+    payload = finish_recommend_round(session, round_state, *result)
+    with stage("render"):
+        return jsonify(payload)
+
+
+@app.route("/api/recommend/stream", methods=["POST"])
+def api_recommend_stream():
+    """
+    Server-Sent Events version of /api/recommend.
+
+    Takes video_id in a JSON body, like /api/recommend. POST only: the
+    request records a choice, and EventSource (GET) would record it again
+    on every automatic reconnect; read the stream with fetch() instead.
+    Events, in order: ``recommendations`` as soon as the three videos are
+    known, ``analysis`` text chunks while Claude writes them, ``stats``
+    with the familiarity score, insights and round counters, then ``done``.
+    """
+    data = request.get_json(silent=True) or {}
+    error, round_state = start_recommend_round(session, data.get("video_id"))
+    if error is not None:
+        return jsonify(error[0]), error[1]
+
+    result = None
+    if PREFETCHER is not None:
+        result = PREFETCHER.take(
+            round_state["sid"], round_state["video_id"], round_state["history_ids"],
+            timeout=PREFETCH_WAIT_SECONDS
+        )
+    if result is not None:
+        count("prefetch_served_total")
+        recommended_videos, analysis_text = result
+        analysis_chunks = iter([analysis_text])
+    else:
+        recommended_videos, analysis_chunks = stream_recommendations(
+            round_state["history"], round_state["profile"], round_state["used_set"]
+        )
+
+    # The session is saved when this view returns, so all of it is updated
+    # here; only the analysis and the derived stats are sent later
+    payload = finish_recommend_round(session, round_state, recommended_videos, None)
+
+    def events():
+        yield sse_event("recommendations", {"recommendations": payload["recommendations"]})
+        parts = []
+        try:
+            for text in analysis_chunks:
+                if text:
+                    parts.append(text)
+                    yield sse_event("analysis", {"text": text})
+        finally:
+            if hasattr(analysis_chunks, "close"):
+                analysis_chunks.close()
+        yield sse_event("stats", round_stats(payload, "".join(parts) or None))
+        yield sse_event("done", {})
+
+    return Response(events(), mimetype="text/event-stream", headers=SSE_HEADERS)
 
 
 @app.route("/api/stats")
 def api_stats():
     """API endpoint for current statistics."""
-    history = session.get("history", [])
+    history = CATALOG.resolve(session.get("history", []))
     total_rounds = session.get("total_rounds", 0)
 
     category_counts = {}
@@ -403,6 +769,35 @@ def api_stats():
     })
 
 
+@app.route("/api/engine/stats")
+def api_engine_stats():
+    """API endpoint for recommendation engine counters of this worker."""
+    llm_recommender = getattr(recommender, "llm", recommender)
+    return jsonify({
+        "prefetch": PREFETCHER.stats() if PREFETCHER is not None else None,
+        "cache": REC_CACHE.stats() if REC_CACHE is not None else None,
+        "prompt": PROMPT_BUILDER.stats(),
+        "llm": recommender.usage_stats() if hasattr(recommender, "usage_stats") else None,
+        "guard": LLM_GUARD.stats(),
+        "singleflight": SINGLEFLIGHT.stats() if SINGLEFLIGHT is not None else None,
+        "batching": llm_recommender.stats() if isinstance(llm_recommender, BatchingRecommender) else None,
+        "tiers": recommender.stats() if isinstance(recommender, TieredRecommender) else None,
+        "coclick": COCLICK.stats() if COCLICK is not None else None,
+        "ann": ANN_INDEX.stats() if ANN_INDEX is not None else None,
+        "matcher": TITLE_MATCHER.stats(),
+        "metrics": METRICS.stats() if METRICS is not None else None,
+        "profiler": PROFILER.stats() if PROFILER is not None else None
+    })
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus metrics of all workers on this host (see metrics.py)."""
+    if METRICS is None:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/test/analytics")
 def test_analytics():
     """Test endpoint to verify analytics are working."""
@@ -0,0 +1,267 @@
+"""Async serving mode: the LLM-bound endpoint on an event loop, the rest of the app unchanged.
+
+Run a single process with ``hypercorn async_app:application`` (see README).
+``/api/recommend`` (and its SSE version) is served by a Quart app that awaits Claude through one
+AsyncAnthropic client per process, so hundreds of sessions can wait on the
+LLM at once. Every other route is the regular Flask app from app.py, run
+through asgiref's WSGI adapter. Both share the catalog, ranker, caches,
+prefetcher and server-side session store of app.py.
+"""
+import asyncio
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, Response, g, jsonify, request, session
+from quart.sessions import SessionInterface
+
+import app as sync_app
+from app import (
+    CATALOG, LLM_BATCH_SIZE, LLM_GUARD, LLM_STREAM_IDS, LOCAL_RECOMMENDER, METRICS, PREFETCHER, PREFETCH_WAIT_SECONDS,
+    PROFILER, PROMPT_BUILDER, PROMPT_CACHE_CATALOG, REC_CACHE, RECOMMENDER_BACKEND, SINGLEFLIGHT,
+    SSE_HEADERS, TIER_OPTIONS, count, finish_recommend_round, round_stats, select_candidates, sse_event, stage,
+    start_recommend_round,
+)
+from recommender import AsyncVideoRecommender
+from session_store import ServerSideSessionInterface
+from tiered import AsyncTieredRecommender
+
+# Paths served by the async app; everything else goes to the Flask app
+ASYNC_PATHS = {"/api/recommend", "/api/recommend/stream"}
+
+
+class AsyncServerSideSessionInterface(SessionInterface):
+    """
+    Quart adapter for session_store.ServerSideSessionInterface.
+
+    Wraps the Flask interface of app.py so both apps read and write the
+    same backend under the same signed cookie.
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+
+    # The backends are blocking (SQLite), so they run off the event loop
+    async def open_session(self, app, request):
+        return await asyncio.to_thread(self.interface.open_session, app, request)
+
+    async def save_session(self, app, session, response):
+        await asyncio.to_thread(self.interface.save_session, app, session, response)
+
+
+async_app = Quart(__name__)
+async_app.secret_key = sync_app.app.secret_key
+if isinstance(sync_app.app.session_interface, ServerSideSessionInterface):
+    async_app.session_interface = AsyncServerSideSessionInterface(sync_app.app.session_interface)
+
+if METRICS is not None:
+    # Same stage timings and Server-Timing header as the Flask routes
+    @async_app.before_request
+    async def start_request_timing():
+        g.metrics_token = METRICS.start_request()
+
+    @async_app.after_request
+    async def add_server_timing(response):
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            response.headers["Server-Timing"] = METRICS.finish_request(
+                token, request.endpoint or "unmatched", response.status_code
+            )
+        return response
+
+if PROFILER is not None:
+    # Both profilers watch the event loop thread, so a profile also holds
+    # whatever other requests the loop ran meanwhile
+    @async_app.before_request
+    async def start_profile():
+        g.profile = PROFILER.begin(
+            request.headers.get("X-Profile-Token") or request.args.get("profile"),
+            request.headers.get("X-Profile-Mode") or request.args.get("profile_mode")
+        )
+
+    @async_app.after_request
+    async def save_profile(response):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            path = PROFILER.end(profile, request.endpoint or "unmatched")
+            if path is not None and not profile.automatic:
+                response.headers["X-Profile-File"] = os.path.basename(path)
+        return response
+
+    @async_app.teardown_request
+    async def stop_profile(exc):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            PROFILER.cancel(profile)
+
+if LLM_BATCH_SIZE > 1:
+    print(f"⚠ Warning: LLM_BATCH_SIZE={LLM_BATCH_SIZE} has no effect on the async /api/recommend endpoints")
+
+# One AsyncAnthropic client (and HTTP connection pool) per process, created lazily
+async_recommender = None
+
+
+def get_async_recommender():
+    """Get or create the async recommender instance."""
+    global async_recommender
+    if async_recommender is None:
+        async_recommender = AsyncVideoRecommender(
+            cache=REC_CACHE, prompt_builder=PROMPT_BUILDER, cache_catalog=PROMPT_CACHE_CATALOG,
+            guard=LLM_GUARD, fallback=LOCAL_RECOMMENDER, stream_ids=LLM_STREAM_IDS,
+            singleflight=SINGLEFLIGHT, metrics=METRICS
+        )
+        if RECOMMENDER_BACKEND == "tiered":
+            async_recommender = AsyncTieredRecommender(LOCAL_RECOMMENDER, async_recommender, **TIER_OPTIONS)
+    return async_recommender
+
+
+async def compute_recommendations_async(history, profile, used_set):
+    """
+    Async version of app.compute_recommendations.
+
+    Returns:
+        Tuple: (recommended_videos, analysis_text)
+    """
+    history_for_prompt, candidates_for_prompt = select_candidates(history, profile, used_set)
+
+    try:
+        if RECOMMENDER_BACKEND == "local":
+            recommended_ids, analysis_text = LOCAL_RECOMMENDER.recommend(history_for_prompt, candidates_for_prompt, 3)
+        else:
+            rec = get_async_recommender()
+            recommended_ids, analysis_text = await rec.recommend(history_for_prompt, candidates_for_prompt, 3)
+        if analysis_text is None:
+            analysis_text = LOCAL_RECOMMENDER.explain(profile)
+        return CATALOG.resolve(recommended_ids), analysis_text
+
+    except Exception as e:
+        print(f"Recommendation error: {e}")
+        import traceback
+        traceback.print_exc()
+        count("fallbacks_total", reason="exception")
+        # Fallback to the local ranker
+        recommended_ids, analysis_text = LOCAL_RECOMMENDER.recommend(history_for_prompt, candidates_for_prompt, 3)
+        return CATALOG.resolve(recommended_ids), analysis_text
+
+
+async def one_chunk(text):
+    """An async iterator over a single piece of analysis text."""
+    yield text
+
+
+async def stream_recommendations_async(history, profile, used_set):
+    """
+    Async version of app.stream_recommendations.
+
+    Returns:
+        Tuple: (recommended_videos, analysis_chunks) where analysis_chunks
+        is an async iterator of analysis text pieces
+    """
+    history_for_prompt, candidates_for_prompt = select_candidates(history, profile, used_set)
+
+    try:
+        if RECOMMENDER_BACKEND == "local":
+            recommended_ids, analysis_text = LOCAL_RECOMMENDER.recommend(history_for_prompt, candidates_for_prompt, 3)
+            return CATALOG.resolve(recommended_ids), one_chunk(analysis_text)
+        events = get_async_recommender().recommend_stream(history_for_prompt, candidates_for_prompt, 3)
+        _, recommended_ids = await anext(events)
+
+    except Exception as e:
+        print(f"Recommendation error: {e}")
+        import traceback
+        traceback.print_exc()
+        count("fallbacks_total", reason="exception")
+        # Fallback to the local ranker
+        recommended_ids, analysis_text = LOCAL_RECOMMENDER.recommend(history_for_prompt, candidates_for_prompt, 3)
+        return CATALOG.resolve(recommended_ids), one_chunk(analysis_text)
+
+    async def analysis_chunks():
+        streamed = False
+        try:
+            async for _, text in events:
+                streamed = True
+                yield text
+        finally:
+            await events.aclose()
+        if not streamed:
+            yield LOCAL_RECOMMENDER.explain(profile)
+
+    return CATALOG.resolve(recommended_ids), analysis_chunks()
+
+
+@async_app.route("/api/recommend", methods=["POST"])
+async def api_recommend():
+    """Async version of app.api_recommend."""
+    data = await request.get_json()
+    error, round_state = start_recommend_round(session, data.get("video_id"))
+    if error is not None:
+        return jsonify(error[0]), error[1]
+
+    # Waiting on a running prefetch blocks, so it happens off the event loop
+    result = None
+    if PREFETCHER is not None:
+        result = await asyncio.to_thread(
+            PREFETCHER.take, round_state["sid"], round_state["video_id"], round_state["history_ids"],
+            timeout=PREFETCH_WAIT_SECONDS
+        )
+    if result is None:
+        result = await compute_recommendations_async(
+            round_state["history"], round_state["profile"], round_state["used_set"]
+        )
+    else:
+        count("prefetch_served_total")
+
+    payload = finish_recommend_round(session, round_state, *result)
+    with stage("render"):
+        return jsonify(payload)
+
+
+@async_app.route("/api/recommend/stream", methods=["POST"])
+async def api_recommend_stream():
+    """Async version of app.api_recommend_stream (same events)."""
+    data = await request.get_json(silent=True) or {}
+    error, round_state = start_recommend_round(session, data.get("video_id"))
+    if error is not None:
+        return jsonify(error[0]), error[1]
+
+    result = None
+    if PREFETCHER is not None:
+        result = await asyncio.to_thread(
+            PREFETCHER.take, round_state["sid"], round_state["video_id"], round_state["history_ids"],
+            timeout=PREFETCH_WAIT_SECONDS
+        )
+    if result is not None:
+        count("prefetch_served_total")
+        recommended_videos, analysis_text = result
+        analysis_chunks = one_chunk(analysis_text)
+    else:
+        recommended_videos, analysis_chunks = await stream_recommendations_async(
+            round_state["history"], round_state["profile"], round_state["used_set"]
+        )
+
+    payload = finish_recommend_round(session, round_state, recommended_videos, None)
+
+    async def events():
+        yield sse_event("recommendations", {"recommendations": payload["recommendations"]})
+        parts = []
+        try:
+            async for text in analysis_chunks:
+                if text:
+                    parts.append(text)
+                    yield sse_event("analysis", {"text": text})
+        finally:
+            await analysis_chunks.aclose()
+        yield sse_event("stats", round_stats(payload, "".join(parts) or None))
+        yield sse_event("done", {})
+
+    return Response(events(), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+wsgi_app = WsgiToAsgi(sync_app.app)
+
+
+async def application(scope, receive, send):
+    """ASGI entry point dispatching between the async and the Flask app."""
+    if scope["type"] == "http" and scope["path"] not in ASYNC_PATHS:
+        await wsgi_app(scope, receive, send)
+    else:
+        await async_app(scope, receive, send)
@@ -0,0 +1,151 @@
+"""Micro-batching of concurrent recommendation requests into one Claude call."""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Queue
+
+
+class _Pending:
+    """One recommend() call waiting for its batch."""
+
+    __slots__ = ("request", "key", "cache_key", "future")
+
+    def __init__(self, request, key, cache_key):
+        self.request = request
+        self.key = key
+        self.cache_key = cache_key
+        self.future = Future()
+
+
+class BatchingRecommender:
+    """
+    Sends concurrent recommend() calls of a VideoRecommender to Claude together.
+
+    A call that misses the cache waits in a queue for up to ``window``
+    seconds, or until ``max_batch`` calls are pending. The batch is then
+    sent as one prompt (PromptBuilder.build_batch: one shared candidate
+    section, a history section per user) that asks for a JSON object of
+    handles per user, and each caller gets its own entry. Users missing
+    from the answer get their ids from the recommender's fallback.
+    Identical requests in a batch share one entry, and a batch of one is
+    sent as a regular request.
+
+    Batched answers carry no analysis text (None), so callers supply their
+    own, as with ``stream_ids``. Streamed answers are not batched.
+    """
+
+    def __init__(self, recommender, max_batch=8, window=0.005, max_workers=4):
+        """
+        Args:
+            recommender: VideoRecommender whose client, prompt builder,
+                cache, guard and fallback are used
+            max_batch: Most requests sent in one call
+            window: Seconds the first request of a batch waits for others
+            max_workers: Batches in flight to Claude at once
+        """
+        self.recommender = recommender
+        self.max_batch = max_batch
+        self.window = window
+        self._queue = Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-batch")
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "cache_hits": 0,
+            "batches": 0,
+            "batched_requests": 0,
+            "deduplicated": 0,
+            "missing_entries": 0,
+            "errors": 0,
+        }
+        self._dispatcher = threading.Thread(target=self._dispatch, name="llm-batcher", daemon=True)
+        self._dispatcher.start()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def recommend(self, user_history, candidate_videos, num_recommendations=3):
+        """
+        Recommend videos from candidates based on user history.
+
+        Args:
+            user_history: List of dicts with video metadata user has chosen
+            candidate_videos: List of candidate videos to choose from
+            num_recommendations: Number of recommendations to return (default: 3)
+
+        Returns:
+            Tuple: (recommended_ids, analysis_text)
+        """
+        self._count("requests")
+        cache_key, key, cached = self.recommender.lookup(user_history, candidate_videos, num_recommendations)
+        if cached is not None:
+            self._count("cache_hits")
+            return list(cached["ids"]), cached["analysis"]
+
+        pending = _Pending((user_history, candidate_videos, num_recommendations), key, cache_key)
+        self._queue.put(pending)
+        recommended_ids, analysis_text = pending.future.result()
+        return list(recommended_ids), analysis_text
+
+    def recommend_stream(self, *args, **kwargs):
+        """Streamed answers go straight to the wrapped recommender."""
+        return self.recommender.recommend_stream(*args, **kwargs)
+
+    def usage_stats(self):
+        return self.recommender.usage_stats()
+
+    def _dispatch(self):
+        """Collect requests into batches and hand them to the pool."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        groups = {}
+        for pending in batch:
+            groups.setdefault(pending.key, []).append(pending)
+        self._count("deduplicated", len(batch) - len(groups))
+        leaders = [group[0] for group in groups.values()]
+        try:
+            if len(leaders) == 1:
+                results = [self.recommender.recommend(*leaders[0].request)]
+            else:
+                results = self._recommend_batch(leaders)
+        except BaseException as e:
+            self._count("errors")
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        for group, result in zip(groups.values(), results):
+            for pending in group:
+                pending.future.set_result(result)
+
+    def _recommend_batch(self, batch):
+        """One Claude call for several distinct requests; returns one result per request."""
+        self._count("batches")
+        self._count("batched_requests", len(batch))
+        results, missing = self.recommender.recommend_batch(
+            [pending.request for pending in batch], [pending.cache_key for pending in batch]
+        )
+        self._count("missing_entries", missing)
+        return results
+
+    def stats(self):
+        """Counters plus the average number of requests per batched call."""
+        with self._lock:
+            stats = dict(self._counters)
+        stats["queued"] = self._queue.qsize()
+        stats["avg_batch_size"] = (
+            round(stats["batched_requests"] / stats["batches"], 2) if stats["batches"] else 0.0
+        )
+        return stats
@@ -0,0 +1 @@
+"""Benchmarks for the video recommender. Run from the repo root with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,77 @@
+"""Build time, query latency and recall of the IVF index over synthetic catalogs.
+
+Each query is the profile of a random history, with the history and a
+random set of used ids excluded. "score all" is the row-level full scan
+the index replaces (CatalogRanker.score plus a partial sort), "exact" is
+brute force over the index's vectors, and recall@k is measured against
+"exact" at several nprobe values.
+
+Usage:
+    python -m benchmarks.ann_index [catalog_size ...]
+"""
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from analytics import UserProfile
+from ann_index import VectorIndex
+from catalog import Catalog
+from ranker import CatalogRanker
+from video_generator import generate_video_pool
+
+K = 50
+NPROBES = (1, 4, 8, 16)
+
+
+def timed(fn, queries):
+    timings = []
+    for profile, exclude in queries:
+        start = time.perf_counter()
+        fn(profile, exclude)
+        timings.append((time.perf_counter() - start) * 1000)
+    return f"p50 {statistics.median(timings):7.3f} ms  p99 {statistics.quantiles(timings, n=100)[-1]:7.3f} ms"
+
+
+def bench(size, requests=200, history_length=20, used=200, seed=5):
+    start = time.perf_counter()
+    catalog = Catalog(generate_video_pool(size))
+    generated = time.perf_counter() - start
+
+    index = VectorIndex(catalog)
+    ranker = CatalogRanker(catalog)
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(requests):
+        history = rng.sample(catalog.items, history_length)
+        exclude = {v["id"] for v in rng.sample(catalog.items, used)} | {v["id"] for v in history}
+        queries.append((UserProfile.from_history(history), exclude))
+
+    def score_all(profile, exclude):
+        scores = ranker.score(profile, exclude)
+        top = np.argpartition(-scores, K)[:K]
+        return top[np.argsort(-scores[top])]
+
+    stats = index.stats()
+    print(
+        f"{size:>9,} items  {stats['points']:>6,} vectors  {stats['lists']:>4} lists  "
+        f"generate {generated:6.2f} s  index build {index.build_seconds:6.2f} s  "
+        f"vectors {index.points.nbytes / 2 ** 20:5.1f} MiB"
+    )
+    print(f"{'':>11}score all     {timed(score_all, queries)}")
+    print(f"{'':>11}exact         {timed(lambda p, e: index.exact_top_k(p, K, e), queries)}")
+    for nprobe in NPROBES:
+        latency = timed(lambda p, e: index.top_k(p, K, e, nprobe=nprobe), queries)
+        print(f"{'':>11}nprobe {nprobe:<6} {latency}  recall@{K} {index.recall(queries, K, nprobe=nprobe):.3f}")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    for size in sizes:
+        bench(size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Throughput of /api/recommend: sync workers vs. the async serving mode.
+
+Every session arrives at once and makes ``rounds`` recommend requests in a
+row; each request waits ``latency`` seconds on a fake LLM. The sync mode
+drives the Flask app from ``workers`` threads, one request at a time each,
+like ``gunicorn --workers 2`` sync workers. The async mode drives the
+Quart endpoint of async_app.py with every session in flight at once.
+Requests go through the frameworks' test clients, so HTTP parsing is left
+out of both numbers.
+
+Usage:
+    python -m benchmarks.async_serving [sessions] [latency_seconds] [workers]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+os.environ["SESSION_BACKEND"] = "memory"
+os.environ["PREFETCH_ENABLED"] = "false"
+os.environ["REC_CACHE_ENABLED"] = "false"
+os.environ["RECOMMENDER_BACKEND"] = "claude"
+
+import app as sync_app  # noqa: E402
+import async_app  # noqa: E402
+from fake_llm import FakeAnthropic, FakeAsyncAnthropic  # noqa: E402
+from recommender import AsyncVideoRecommender, VideoRecommender  # noqa: E402
+
+
+def recommender_options():
+    return {
+        "prompt_builder": sync_app.PROMPT_BUILDER,
+        "guard": sync_app.LLM_GUARD,
+        "fallback": sync_app.LOCAL_RECOMMENDER,
+    }
+
+
+def report(mode, sessions, rounds, elapsed, finished):
+    requests = sessions * rounds
+    finished.sort()
+    print(
+        f"{mode:<6} {sessions:>5} sessions  {requests / elapsed:8.1f} req/s  "
+        f"wall {elapsed:6.2f} s  "
+        f"p50 {statistics.median(finished):6.2f} s  p99 {finished[int(len(finished) * 0.99) - 1]:6.2f} s"
+    )
+
+
+def run_sync(sessions, rounds, latency, workers):
+    sync_app.recommender = VideoRecommender(client=FakeAnthropic(latency=latency), **recommender_options())
+    ids = [v["id"] for v in sync_app.CATALOG.items]
+
+    start = time.perf_counter()
+
+    def session_requests(i):
+        client = sync_app.app.test_client()
+        video_id = ids[i % len(ids)]
+        done = []
+        for _ in range(rounds):
+            data = client.post("/api/recommend", json={"video_id": video_id}).get_json()
+            video_id = data["recommendations"][0]["id"]
+            done.append(time.perf_counter() - start)
+        return done
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        finished = [t for done in pool.map(session_requests, range(sessions)) for t in done]
+    report("sync", sessions, rounds, time.perf_counter() - start, finished)
+
+
+def run_async(sessions, rounds, latency):
+    async_app.async_recommender = AsyncVideoRecommender(
+        client=FakeAsyncAnthropic(latency=latency), **recommender_options()
+    )
+    ids = [v["id"] for v in sync_app.CATALOG.items]
+
+    async def session_requests(i, start):
+        client = async_app.async_app.test_client()
+        video_id = ids[i % len(ids)]
+        done = []
+        for _ in range(rounds):
+            response = await client.post("/api/recommend", json={"video_id": video_id})
+            data = await response.get_json()
+            video_id = data["recommendations"][0]["id"]
+            done.append(time.perf_counter() - start)
+        return done
+
+    async def main():
+        start = time.perf_counter()
+        results = await asyncio.gather(*(session_requests(i, start) for i in range(sessions)))
+        return start, [t for done in results for t in done]
+
+    start, finished = asyncio.run(main())
+    report("async", sessions, rounds, time.perf_counter() - start, finished)
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    rounds = 3
+
+    print(f"fake LLM latency {latency:.2f} s, {rounds} requests per session, {workers} sync workers")
+    # Sync throughput is bounded by workers / latency, so a slice of the sessions is enough
+    run_sync(min(sessions, workers * 10), rounds, latency, workers)
+    run_async(sessions, rounds, latency)
+
+
+if __name__ == "__main__":
+    main()
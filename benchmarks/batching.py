@@ -0,0 +1,102 @@
+"""Tokens and latency of batched vs. unbatched Claude calls.
+
+Every session runs in its own thread and makes ``rounds`` recommend calls
+in a row, picking the first recommendation each time. Candidates come
+from the app's local ranker, as in production, so sessions in a batch
+share some of them. The fake model takes ``latency`` seconds to the first
+token plus ``token_latency`` per 4 generated characters, so longer batched
+answers also take longer. Token counts are the fake client's estimates.
+
+Usage:
+    python -m benchmarks.batching [sessions] [max_batch] [window_ms] [latency] [token_latency]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+os.environ["SESSION_BACKEND"] = "memory"
+os.environ["PREFETCH_ENABLED"] = "false"
+os.environ["REC_CACHE_ENABLED"] = "false"
+os.environ["SINGLEFLIGHT_ENABLED"] = "false"
+
+import app  # noqa: E402
+from analytics import UserProfile  # noqa: E402
+from batching import BatchingRecommender  # noqa: E402
+from fake_llm import FakeAnthropic  # noqa: E402
+from recommender import VideoRecommender  # noqa: E402
+
+
+def run(mode, make_recommender, sessions, rounds, seed=7):
+    client_rec = make_recommender()
+    inner = getattr(client_rec, "recommender", client_rec)
+    starts = random.Random(seed).sample(app.CATALOG.items, sessions)
+    latencies = []
+
+    def session_requests(start_video):
+        history = [start_video]
+        profile = UserProfile.from_history(history)
+        used_set = {start_video["id"]}
+        done = []
+        for _ in range(rounds):
+            history_for_prompt, candidates = app.select_candidates(history, profile, used_set)
+            begin = time.perf_counter()
+            ids, _ = client_rec.recommend(history_for_prompt, candidates, 3)
+            done.append(time.perf_counter() - begin)
+            used_set.update(ids)
+            video = app.CATALOG.resolve(ids[:1])[0]
+            history.append(video)
+            profile.add(video)
+        return done
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        for done in pool.map(session_requests, starts):
+            latencies.extend(done)
+    elapsed = time.perf_counter() - start
+
+    usage = inner.usage_stats()
+    recommendations = sessions * rounds
+    latencies.sort()
+    print(
+        f"{mode:<10} {usage['calls']:>5} calls  "
+        f"{usage['total_input_tokens'] / recommendations:7.1f} in + "
+        f"{usage['output_tokens'] / recommendations:5.1f} out tokens/rec  "
+        f"p50 {statistics.median(latencies):5.2f} s  p99 {latencies[int(len(latencies) * 0.99) - 1]:5.2f} s  "
+        f"wall {elapsed:5.2f} s"
+    )
+    if isinstance(client_rec, BatchingRecommender):
+        stats = client_rec.stats()
+        print(f"{'':<10} avg batch {stats['avg_batch_size']}, missing entries {stats['missing_entries']}")
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    max_batch = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    window_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    latency = float(sys.argv[4]) if len(sys.argv) > 4 else 0.5
+    token_latency = float(sys.argv[5]) if len(sys.argv) > 5 else 0.005
+    rounds = 3
+
+    def unbatched():
+        return VideoRecommender(
+            client=FakeAnthropic(latency=latency, token_latency=token_latency),
+            prompt_builder=app.PROMPT_BUILDER, fallback=app.LOCAL_RECOMMENDER
+        )
+
+    def batched():
+        return BatchingRecommender(unbatched(), max_batch=max_batch, window=window_ms / 1000)
+
+    print(
+        f"{sessions} sessions x {rounds} requests, fake LLM {latency:.2f} s + {token_latency * 1000:.1f} ms/chunk, "
+        f"batches of up to {max_batch} within {window_ms:g} ms"
+    )
+    run("unbatched", unbatched, sessions, rounds)
+    run("batched", batched, sessions, rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Startup time and per-worker memory of the JSON vs. compiled catalog.
+
+For each size a synthetic catalog is written both as pretty-printed JSON
+(like thumbnails_config.json) and as a compiled file. Each format is then
+loaded in a fresh process that reports the load time, the resident memory
+the load added, and how much of it is private (anonymous) memory. The
+rest is file-backed mmap pages that every worker on the host shares
+through the page cache. After loading, each process also renders 100
+random items as a request would.
+
+Usage:
+    python -m benchmarks.catalog_startup [catalog_size ...]
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from generate_thumbnails_config import generate
+
+
+def memory_kib():
+    """(VmRSS, RssAnon) of this process in KiB."""
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            fields[name] = value.split()[0] if value.split() else "0"
+    return int(fields.get("VmRSS", 0)), int(fields.get("RssAnon", 0))
+
+
+def child(path):
+    """Load one catalog and print the measurements as JSON."""
+    from compiled_catalog import load_catalog
+
+    rss_before, anon_before = memory_kib()
+    start = time.perf_counter()
+    catalog = load_catalog(path)
+    loaded = time.perf_counter() - start
+
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for row in rng.sample(range(len(catalog)), 100):
+        catalog.get(catalog.items[row]["id"])
+    rendered = time.perf_counter() - start
+    rss_after, anon_after = memory_kib()
+    print(json.dumps({
+        "load_s": loaded,
+        "render_ms": rendered * 1000,
+        "rss_mib": (rss_after - rss_before) / 1024,
+        "private_mib": (anon_after - anon_before) / 1024,
+    }))
+
+
+def write_catalogs(size, directory, seed=3):
+    """Write the same ``size`` items as JSON and compiled."""
+    paths = [os.path.join(directory, f"catalog-{size}{ext}") for ext in (".json", ".vcat")]
+    for path in paths:
+        generate(path, size, os.cpu_count() or 1, seed, shard_size=10000)
+    return paths
+
+
+def measure(path):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.catalog_startup", "--load", path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    if sys.argv[1:2] == ["--load"]:
+        child(sys.argv[2])
+        return
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 100000, 1000000]
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            json_path, compiled_path = write_catalogs(size, directory)
+            for name, path in (("json", json_path), ("compiled", compiled_path)):
+                result = measure(path)
+                print(
+                    f"{size:>9,} items  {name:<8} file {os.path.getsize(path) / 2 ** 20:7.1f} MiB  "
+                    f"load {result['load_s']:7.3f} s  RSS +{result['rss_mib']:7.1f} MiB  "
+                    f"private +{result['private_mib']:7.1f} MiB  render 100 {result['render_ms']:6.2f} ms"
+                )
+            os.remove(json_path)
+            os.remove(compiled_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Hit rate, category coverage, latency and Claude cost of each recommender on replayed sessions.
+
+Replays the same session traces (see evaluation.py) through the /round
+category heuristic, the local ranker, Claude and the tiered policy, with
+candidates built by app.select_candidates as in production. Claude is
+fake_llm.FakeAnthropic, which answers deterministically with the first
+candidates (the local ranking) after ``--llm-latency`` seconds, so the
+run is offline and repeatable: its hit rate says nothing about the real
+model, while its calls, tokens and the overhead around the call are real.
+
+Traces are simulated (drifting interests, see evaluation.simulate_traces)
+unless ``--traces`` names a JSON Lines file or ``--sessions-db`` the SQLite
+session store to take logged sessions from. Caches, co-click candidates
+and prefetching are off so every policy sees the same requests.
+
+Usage:
+    python -m benchmarks.evaluate [--sessions N] [--rounds N] [--shift P] [--seed N]
+        [--traces FILE | --sessions-db FILE] [--save-traces FILE]
+        [--policies heuristic,local,claude,tiered] [--llm-latency SECONDS] [--json]
+"""
+import argparse
+import json
+import os
+import random
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+os.environ["SESSION_BACKEND"] = "memory"
+os.environ["PREFETCH_ENABLED"] = "false"
+os.environ["REC_CACHE_ENABLED"] = "false"
+os.environ["SINGLEFLIGHT_ENABLED"] = "false"
+os.environ["COCLICK_ENABLED"] = "false"
+os.environ["METRICS_ENABLED"] = "false"
+
+import app  # noqa: E402
+from evaluation import ReplayHarness, load_traces, save_traces, simulate_traces, traces_from_sessions  # noqa: E402
+from fake_llm import FakeAnthropic  # noqa: E402
+from ranker import CategoryRecommender  # noqa: E402
+from recommender import VideoRecommender  # noqa: E402
+from tiered import TieredRecommender  # noqa: E402
+
+
+def fake_claude(latency):
+    return VideoRecommender(
+        client=FakeAnthropic(latency=latency), prompt_builder=app.PROMPT_BUILDER,
+        cache_catalog=app.PROMPT_CACHE_CATALOG, fallback=app.LOCAL_RECOMMENDER
+    )
+
+
+POLICIES = {
+    "heuristic": lambda args: CategoryRecommender(app.RANKER, rng=random.Random(args.seed)),
+    "local": lambda args: app.LOCAL_RECOMMENDER,
+    "claude": lambda args: fake_claude(args.llm_latency),
+    "tiered": lambda args: TieredRecommender(
+        app.LOCAL_RECOMMENDER, fake_claude(args.llm_latency), rng=random.Random(args.seed), **app.TIER_OPTIONS
+    ),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay sessions through each recommender.")
+    parser.add_argument("--sessions", type=int, default=100, help="Simulated sessions (default: 100)")
+    parser.add_argument("--rounds", type=int, default=10, help="Rounds per simulated session (default: 10)")
+    parser.add_argument("--shift", type=float, default=0.1, help="Interest change probability per round")
+    parser.add_argument("--seed", type=int, default=7, help="Seed of the simulation and the policies")
+    parser.add_argument("--traces", help="JSON Lines file of logged or simulated traces")
+    parser.add_argument("--sessions-db", help="SQLite session store to take logged traces from")
+    parser.add_argument("--save-traces", help="Write the replayed traces to this JSON Lines file")
+    parser.add_argument("--policies", default=",".join(POLICIES), help="Comma-separated policies to replay")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Fake Claude seconds per call")
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON")
+    args = parser.parse_args()
+
+    if args.traces:
+        traces = load_traces(args.traces)
+    elif args.sessions_db:
+        traces = traces_from_sessions(args.sessions_db)
+    else:
+        traces = simulate_traces(app.CATALOG, args.sessions, args.rounds, args.shift, args.seed)
+    if args.save_traces:
+        save_traces(traces, args.save_traces)
+
+    harness = ReplayHarness(app.CATALOG, app.select_candidates, seed=args.seed)
+    reports = {}
+    for name in args.policies.split(","):
+        if name not in POLICIES:
+            parser.error(f"unknown policy {name!r} (choose from {', '.join(POLICIES)})")
+        reports[name] = harness.replay(POLICIES[name](args), traces)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    logged = sum("choices" in trace for trace in traces)
+    print(f"{len(traces)} sessions ({logged} logged, {len(traces) - logged} simulated), {len(app.CATALOG)} videos")
+    print(
+        f"{'policy':<10} {'calls':>6} {'hit rate':>9} {'coverage':>9} {'p50 ms':>8} {'p90 ms':>8} "
+        f"{'p99 ms':>8} {'LLM/sess':>9} {'tokens/sess':>12}"
+    )
+    for name, report in reports.items():
+        print(
+            f"{name:<10} {report['calls']:>6} {report['hit_rate']:>9.1%} {report['category_coverage']:>9.1%} "
+            f"{report['p50_ms']:>8.2f} {report['p90_ms']:>8.2f} {report['p99_ms']:>8.2f} "
+            f"{report['llm_calls_per_session']:>9.2f} {report['tokens_per_session']:>12,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Title matching for items without attributes: per-value loops vs. TitleMatcher.
+
+"loops" is the scan analytics.UserProfile.add did per history item before
+the matcher (``value in title`` for every value), "scan" is one
+TitleMatcher pass per title and "memo" is TitleMatcher.match, memoized by
+item id, as the analytics use it. Titles come from synthetic items with
+their "attrs" removed, i.e. items from outside video_generator.
+
+The first table grows the vocabulary (the real attribute values plus
+random made-up values per slot), the second times analytics on long
+histories of such items, from a pool of 1,000 items.
+
+Usage:
+    python -m benchmarks.matcher [history_length ...]
+"""
+import random
+import string
+import sys
+import time
+
+from analytics import UserProfile, calculate_familiarity_score, get_preference_insights
+from matcher import TitleMatcher
+from video_generator import ATTRIBUTE_VALUES, generate_video_pool
+
+EXTRA_VALUES = (0, 100, 1000, 10000)
+
+
+def per_title_us(fn, titles, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for title in titles:
+            fn(title)
+        best = min(best, time.perf_counter() - start)
+    return best / len(titles) * 1e6
+
+
+def vocabulary_with(extra, rng):
+    """The attribute vocabulary plus ``extra`` random values spread over its slots."""
+    vocabulary = {slot: list(values) for slot, values in ATTRIBUTE_VALUES.items()}
+    slots = list(vocabulary)
+    for i in range(extra):
+        word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))).capitalize()
+        vocabulary[slots[i % len(slots)]].append(word)
+    return vocabulary
+
+
+def bench_vocabulary(titles, rng):
+    print(f"{'values':>8}  {'loops':>12}  {'scan':>12}  build")
+    for extra in EXTRA_VALUES:
+        vocabulary = vocabulary_with(extra, rng)
+        flat = [(slot, code, value) for slot, values in vocabulary.items() for code, value in enumerate(values)]
+
+        def loops(title):
+            found = {}
+            for slot, code, value in flat:
+                if value in title:
+                    found.setdefault(slot, []).append(code)
+            return found
+
+        start = time.perf_counter()
+        matcher = TitleMatcher(vocabulary, cache_size=0)
+        built = time.perf_counter() - start
+        assert all({s: tuple(c) for s, c in loops(t).items()} == matcher.scan(t) for t in titles[:500])
+        print(
+            f"{len(flat):>8,}  {per_title_us(loops, titles):9.2f} us  "
+            f"{per_title_us(matcher.scan, titles):9.2f} us  {built * 1000:.1f} ms"
+        )
+
+
+def bench_history(pool, lengths, rng):
+    locations = ATTRIBUTE_VALUES["location"]
+    formats = ATTRIBUTE_VALUES["format"]
+
+    def loops(history):
+        # The pre-matcher UserProfile title scan, on its own
+        for video in history:
+            title = video["title"]
+            for loc in locations:
+                if loc in title:
+                    pass
+            any(pattern in title for pattern in formats)
+
+    def scan(history):
+        for video in history:
+            matcher.scan(video["title"])
+
+    def memo(history):
+        for video in history:
+            matcher.match(video)
+
+    def analytics(history):
+        profile = UserProfile.from_history(history)
+        calculate_familiarity_score(profile)
+        get_preference_insights(profile)
+
+    matcher = TitleMatcher(ATTRIBUTE_VALUES)
+    print(f"\n{'history':>8}  {'loops':>10}  {'scan':>10}  {'memo':>10}  analytics (memo)")
+    for length in lengths:
+        history = [rng.choice(pool) for _ in range(length)]
+        # Warm both memos, as in a long-running worker
+        memo(history)
+        analytics(history)
+        timings = []
+        for fn in (loops, scan, memo, analytics):
+            start = time.perf_counter()
+            fn(history)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{length:>8,}  " + "  ".join(f"{t:7.2f} ms" for t in timings))
+
+
+def main():
+    lengths = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]
+    rng = random.Random(7)
+    pool = generate_video_pool(1000)
+    for video in pool:
+        del video["attrs"]
+    titles = [video["title"] for video in pool]
+    bench_vocabulary(titles, rng)
+    bench_history(pool, lengths, rng)
+
+
+if __name__ == "__main__":
+    main()
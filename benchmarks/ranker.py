@@ -0,0 +1,50 @@
+"""Per-request latency of the local ranker over synthetic catalogs.
+
+Usage:
+    python -m benchmarks.ranker [catalog_size ...]
+"""
+import random
+import statistics
+import sys
+import time
+
+from analytics import UserProfile
+from catalog import Catalog
+from ranker import CatalogRanker
+from video_generator import generate_video_pool
+
+
+def bench(size, requests=200, history_length=20, used=200):
+    start = time.perf_counter()
+    catalog = Catalog(generate_video_pool(size))
+    generated = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ranker = CatalogRanker(catalog)
+    built = time.perf_counter() - start
+
+    timings = []
+    for _ in range(requests):
+        history = random.sample(catalog.items, history_length)
+        profile = UserProfile.from_history(history)
+        used_ids = {v["id"] for v in random.sample(catalog.items, used)}
+        start = time.perf_counter()
+        ranker.top_k(profile, 100, exclude=used_ids)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print(
+        f"{size:>9,} items  {ranker.num_features:>4} features  "
+        f"generate {generated:6.2f} s  build {built:6.2f} s  "
+        f"top-100 p50 {statistics.median(timings):.3f} ms  "
+        f"p99 {statistics.quantiles(timings, n=100)[-1]:.3f} ms"
+    )
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for size in sizes:
+        bench(size)
+
+
+if __name__ == "__main__":
+    main()
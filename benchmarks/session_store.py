@@ -0,0 +1,109 @@
+"""Compare cookie and server-side sessions: bytes on the wire and request latency.
+
+Usage:
+    python -m benchmarks.session_store [rounds]
+"""
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark-key")
+
+from flask.sessions import SecureCookieSessionInterface
+
+import app as web
+from session_store import LRUSessionBackend, SQLiteSessionBackend, ServerSideSessionInterface
+
+VIDEO_ID_RE = re.compile(r'name="video_id" value="([^"]+)"')
+
+
+def cookie_bytes(client):
+    cookie = client.get_cookie(web.app.config["SESSION_COOKIE_NAME"])
+    return len(cookie.value) if cookie else 0
+
+
+def set_cookie_bytes(response):
+    return sum(len(v) for v in response.headers.getlist("Set-Cookie"))
+
+
+def play(rounds):
+    """Play ``rounds`` choose/round cycles and collect per-request numbers."""
+    client = web.app.test_client()
+    page = client.get("/").get_data(as_text=True)
+
+    latencies = []
+    sent = []
+    received = []
+    for _ in range(rounds):
+        video_id = VIDEO_ID_RE.findall(page)[0]
+        for method, path, kwargs in (
+            ("post", "/choose", {"data": {"video_id": video_id}}),
+            ("get", "/round", {}),
+        ):
+            sent.append(cookie_bytes(client))
+            start = time.perf_counter()
+            response = getattr(client, method)(path, **kwargs)
+            latencies.append((time.perf_counter() - start) * 1000)
+            received.append(set_cookie_bytes(response))
+        if response.status_code != 200:
+            break
+        page = response.get_data(as_text=True)
+
+    with client.session_transaction() as sess:
+        final_session = dict(sess)
+    return latencies, sent, received, final_session
+
+
+def legacy_cookie_cost(final_session):
+    """Size and codec cost of the same session stored the old way (full dicts in the cookie)."""
+    legacy = dict(final_session)
+    legacy["history"] = web.CATALOG.resolve(final_session.get("history", []))
+    serializer = SecureCookieSessionInterface().get_signing_serializer(web.app)
+
+    start = time.perf_counter()
+    for _ in range(100):
+        serializer.loads(serializer.dumps(legacy))
+    codec_ms = (time.perf_counter() - start) * 10
+    return len(serializer.dumps(legacy)), codec_ms
+
+
+def report(name, latencies, sent, received):
+    print(
+        f"{name:<8} "
+        f"p50 {statistics.median(latencies):6.2f} ms  "
+        f"p95 {statistics.quantiles(latencies, n=20)[-1]:6.2f} ms  "
+        f"cookie sent last {sent[-1]:5d} B  "
+        f"total on wire {sum(sent) + sum(received):8d} B"
+    )
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"{rounds} rounds over a {len(web.CATALOG)}-item catalog\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {
+            "cookie": SecureCookieSessionInterface(),
+            "memory": ServerSideSessionInterface(LRUSessionBackend()),
+            "sqlite": ServerSideSessionInterface(
+                SQLiteSessionBackend(os.path.join(tmp, "sessions.sqlite3"))
+            ),
+        }
+        final_session = None
+        for name, interface in backends.items():
+            web.app.session_interface = interface
+            latencies, sent, received, final_session = play(rounds)
+            report(name, latencies, sent, received)
+
+    size, codec_ms = legacy_cookie_cost(final_session)
+    print(
+        f"\nlegacy   full-dict cookie after {rounds} rounds: {size} B "
+        f"(browser limit is ~4096 B), sign+serialize+verify {codec_ms:.3f} ms per request"
+    )
+
+
+if __name__ == "__main__":
+    main()
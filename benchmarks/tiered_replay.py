@@ -0,0 +1,117 @@
+"""Replay of simulated sessions through the tiered policy: LLM calls avoided vs. hit rate.
+
+Each simulated user has a hidden current interest (a category) that
+switches to another category with probability ``shift`` before each
+round. A round is a hit when at least one of the three offered videos is
+in the current interest; the user then picks one of those, otherwise a
+random offered video. Every policy replays the same users with the same
+seeds.
+
+The LLM tier is a stand-in that knows the user's current interest and
+offers matching candidates with probability ``llm_accuracy`` (otherwise
+the first candidates, i.e. the local ranking). It models a model that
+reads an ambiguous history better than the ranker does; the numbers are
+only as good as that assumption. The local tier is the real ranker.
+
+Usage:
+    python -m benchmarks.tiered_replay [sessions] [rounds] [shift] [llm_accuracy]
+"""
+import os
+import random
+import sys
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+os.environ["SESSION_BACKEND"] = "memory"
+os.environ["PREFETCH_ENABLED"] = "false"
+
+import app  # noqa: E402
+from analytics import UserProfile  # noqa: E402
+from tiered import TieredRecommender  # noqa: E402
+
+CATEGORIES = sorted({v["category"] for v in app.CATALOG.items})
+
+
+class ReferenceLLM:
+    """LLM stand-in that sees the simulated user's current interest."""
+
+    def __init__(self, accuracy, seed):
+        self.accuracy = accuracy
+        self.rng = random.Random(seed)
+        self.interest = None
+        self.calls = 0
+
+    def recommend(self, user_history, candidate_videos, num_recommendations=3):
+        self.calls += 1
+        picks = candidate_videos[:num_recommendations]
+        if self.rng.random() < self.accuracy:
+            matching = [v for v in candidate_videos if v["category"] == self.interest]
+            picks = (matching + [v for v in candidate_videos if v not in matching])[:num_recommendations]
+        return [v["id"] for v in picks], "stand-in analysis"
+
+
+def replay(make_policy, sessions, rounds, shift, llm_accuracy, seed=11):
+    llm = ReferenceLLM(llm_accuracy, seed)
+    policy = make_policy(llm)
+    hits = 0
+    for session in range(sessions):
+        interest_rng = random.Random(f"{seed}-interest-{session}")
+        choice_rng = random.Random(f"{seed}-choice-{session}")
+        interest = interest_rng.choice(CATEGORIES)
+        start = choice_rng.choice([v for v in app.CATALOG.items if v["category"] == interest])
+        history = [start]
+        profile = UserProfile.from_history(history)
+        used_set = {start["id"]}
+
+        for _ in range(rounds):
+            if interest_rng.random() < shift:
+                interest = interest_rng.choice([c for c in CATEGORIES if c != interest])
+            llm.interest = interest
+            history_for_prompt, candidates = app.select_candidates(history, profile, used_set)
+            ids, _ = policy.recommend(history_for_prompt, candidates, 3)
+            offered = app.CATALOG.resolve(ids)
+            used_set.update(ids)
+            matching = [v for v in offered if v["category"] == interest]
+            hits += bool(matching)
+            choice = choice_rng.choice(matching or offered)
+            history.append(choice)
+            profile.add(choice)
+    return policy, llm.calls, hits / (sessions * rounds)
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    shift = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+    llm_accuracy = float(sys.argv[4]) if len(sys.argv) > 4 else 0.9
+    requests = sessions * rounds
+
+    policies = [
+        ("llm only", lambda llm: llm),
+        ("local only", lambda llm: app.LOCAL_RECOMMENDER),
+    ]
+    for min_familiarity, min_dominance in ((40, 0.5), (60, 0.6), (80, 0.8)):
+        policies.append((
+            f"tiered {min_familiarity}/{min_dominance:.1f}",
+            lambda llm, f=min_familiarity, d=min_dominance: TieredRecommender(
+                app.LOCAL_RECOMMENDER, llm, min_familiarity=f, min_dominance=d, rng=random.Random(3)
+            )
+        ))
+
+    print(
+        f"{sessions} sessions x {rounds} rounds, interest shift {shift:.0%}/round, "
+        f"LLM stand-in accuracy {llm_accuracy:.0%}; tiered = min familiarity/min dominance"
+    )
+    print(f"{'policy':<16} {'LLM calls':>9} {'avoided':>8} {'hit rate':>9}  escalations")
+    for name, make_policy in policies:
+        policy, calls, hit_rate = replay(make_policy, sessions, rounds, shift, llm_accuracy)
+        reasons = ""
+        if isinstance(policy, TieredRecommender):
+            reasons = ", ".join(
+                f"{reason} {count}" for reason, count in policy.stats()["reasons"].items()
+                if count and reason != "confident"
+            )
+        print(f"{name:<16} {calls:>9} {1 - calls / requests:>8.1%} {hit_rate:>9.1%}  {reasons}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Indexed in-memory catalog of pre-generated thumbnails."""
+import json
+import random
+
+from video_generator import title_attributes
+
+
+class Catalog:
+    """Read-only catalog built once at startup.
+
+    Holds the thumbnails in file order plus an id -> row index and
+    per-category / per-tag posting lists of rows, so lookups and candidate
+    filtering do not have to scan the whole pool on every request. Items
+    without integer-coded ``attrs`` (catalog files written before they
+    were generated) are replaced by copies with attrs backfilled from
+    their title and tags; the caller's dicts are left alone.
+    """
+
+    def __init__(self, items):
+        """Build the indexes for a list of video dicts."""
+        self.items = list(items)
+        self._rows = {}
+        self._category_rows = {}
+        self._tag_rows = {}
+
+        for row, video in enumerate(self.items):
+            if "attrs" not in video:
+                video = self.items[row] = dict(
+                    video, attrs=title_attributes(video.get("title", ""), video.get("category"), video.get("tags", ()))
+                )
+            self._rows[video["id"]] = row
+            self._category_rows.setdefault(video.get("category", ""), []).append(row)
+            for tag in set(video.get("tags", [])):
+                self._tag_rows.setdefault(tag, []).append(row)
+
+        self.category_counts = {
+            category: len(rows) for category, rows in self._category_rows.items()
+        }
+
+    @classmethod
+    def from_json(cls, path):
+        """Load a catalog from a thumbnails_config.json style file."""
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __contains__(self, video_id):
+        return video_id in self._rows
+
+    @property
+    def categories(self):
+        """Categories present in the catalog, in first-seen order."""
+        return list(self._category_rows)
+
+    def get(self, video_id):
+        """Return the video dict for an id, or None if it is unknown."""
+        row = self._rows.get(video_id)
+        return self.items[row] if row is not None else None
+
+    def row_of(self, video_id):
+        """Return the row index for an id, or None if it is unknown."""
+        return self._rows.get(video_id)
+
+    def resolve(self, video_ids):
+        """Map a sequence of ids to video dicts, skipping unknown ids."""
+        items = self.items
+        rows = self._rows
+        return [items[rows[vid]] for vid in video_ids if vid in rows]
+
+    def _category_posting(self, category):
+        """Rows of a category, in file order."""
+        return self._category_rows.get(category, [])
+
+    def _tag_posting(self, tag):
+        """Rows carrying a tag, in file order."""
+        return self._tag_rows.get(tag, [])
+
+    def ids_in_category(self, category):
+        """Return the ids of every video in a category, in file order."""
+        return [self.items[row]["id"] for row in self._category_posting(category)]
+
+    def ids_with_tag(self, tag):
+        """Return the ids of every video carrying a tag, in file order."""
+        return [self.items[row]["id"] for row in self._tag_posting(tag)]
+
+    def available_count(self, exclude=()):
+        """Number of catalog videos not in the exclusion set."""
+        return len(self.items) - sum(1 for vid in set(exclude) if vid in self._rows)
+
+    def take(self, limit, exclude=(), category=None, exclude_category=None, tag=None):
+        """
+        Return up to ``limit`` unused videos in file order.
+
+        Walks the relevant posting list (or the whole catalog) and stops as
+        soon as ``limit`` videos are found, so the cost depends on ``limit``
+        and the number of excluded ids rather than on the catalog size.
+
+        Args:
+            limit: Maximum number of videos to return
+            exclude: Collection of video ids to skip (used ids)
+            category: Only return videos from this category
+            exclude_category: Skip videos from this category
+            tag: Only return videos carrying this tag
+
+        Returns:
+            List of video dicts
+        """
+        exclude = exclude if isinstance(exclude, (set, frozenset)) else set(exclude)
+
+        if category is not None:
+            rows = self._category_posting(category)
+        elif tag is not None:
+            rows = self._tag_posting(tag)
+        else:
+            rows = range(len(self.items))
+
+        found = []
+        for row in rows:
+            if len(found) >= limit:
+                break
+            video = self.items[row]
+            if video["id"] in exclude:
+                continue
+            if exclude_category is not None and video.get("category") == exclude_category:
+                continue
+            if tag is not None and category is not None and tag not in video.get("tags", []):
+                continue
+            found.append(video)
+        return found
+
+    def sample(self, k, exclude=(), rng=random):
+        """
+        Randomly sample ``k`` distinct unused videos.
+
+        Uses rejection sampling on row indices while the pool is mostly
+        unused, falling back to an explicit scan once most of it is taken.
+
+        Args:
+            k: Number of videos to sample
+            exclude: Collection of video ids to skip (used ids)
+            rng: Random source (defaults to the ``random`` module)
+
+        Returns:
+            List of video dicts (shorter than ``k`` if the pool runs out)
+        """
+        exclude = exclude if isinstance(exclude, (set, frozenset)) else set(exclude)
+        available = self.available_count(exclude)
+        k = min(k, available)
+        if k <= 0:
+            return []
+
+        if available < 2 * k or available < len(self.items) // 2:
+            pool = [v for v in self.items if v["id"] not in exclude]
+            return rng.sample(pool, k)
+
+        chosen_rows = []
+        seen = set()
+        while len(chosen_rows) < k:
+            row = rng.randrange(len(self.items))
+            if row not in seen and self.items[row]["id"] not in exclude:
+                seen.add(row)
+                chosen_rows.append(row)
+        return [self.items[row] for row in chosen_rows]
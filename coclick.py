@@ -0,0 +1,265 @@
+"""Item-item co-click model aggregated from live choice events."""
+import atexit
+import heapq
+import json
+import os
+import tempfile
+import threading
+import time
+from operator import itemgetter
+from queue import Empty, Full, Queue
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows: snapshots are written without a lock
+    fcntl = None
+
+
+def _increment(counts, source, target, amount, max_neighbors):
+    """
+    Add ``amount`` to the (source, target) counter with Space-Saving pruning.
+
+    A source keeps at most ``max_neighbors`` counters. A new target takes
+    over the smallest one and inherits its count, so counts can only be
+    overestimated, and targets seen often enough are never lost.
+    """
+    row = counts.get(source)
+    if row is None:
+        row = counts[source] = {}
+    if target in row:
+        row[target] += amount
+    elif len(row) < max_neighbors:
+        row[target] = amount
+    else:
+        smallest = min(row, key=row.get)
+        row[target] = row.pop(smallest) + amount
+
+
+class CoClickModel:
+    """
+    Counts of "chose A, then chose B" between catalog items.
+
+    Request handlers only enqueue (previous, chosen) pairs with record(); a
+    background aggregator thread folds them into the counts and rebuilds
+    the top-K neighbour list of every item it touched. neighbors() is a
+    dict lookup of that precomputed list.
+
+    Memory is bounded: items come from the catalog, each keeps at most
+    ``max_neighbors`` counters (see _increment), and the event queue is
+    bounded too; events arriving while it is full are dropped and counted.
+
+    With ``path`` set, the counts are loaded at startup and saved every
+    ``snapshot_interval`` seconds. A save merges this worker's increments
+    into the file under a lock, so gunicorn workers pool their counts and
+    each picks up the others' at its next save. close() saves whatever is
+    left at exit, so choices after the last snapshot are kept.
+    """
+
+    def __init__(self, top_k=20, max_neighbors=64, path=None, snapshot_interval=60, max_queue=10000):
+        """
+        Args:
+            top_k: Neighbours kept in each precomputed list
+            max_neighbors: Counters kept per item (at least top_k)
+            path: JSON snapshot file (None = in memory only)
+            snapshot_interval: Seconds between saves
+            max_queue: Choice events waiting for the aggregator at most
+        """
+        self.top_k = top_k
+        self.max_neighbors = max(max_neighbors, top_k)
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self._counts = {}
+        self._delta = {}
+        self._neighbors = {}
+        self._queue = Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._counters = {"recorded": 0, "dropped": 0, "saves": 0, "save_errors": 0}
+        self.load_seconds = None
+        if path and os.path.exists(path):
+            self.load()
+        self._aggregator = threading.Thread(target=self._run, name="coclick", daemon=True)
+        self._aggregator.start()
+        if path:
+            # The aggregator is a daemon thread, which stops without a last save
+            atexit.register(self.close)
+
+    def record(self, previous_id, chosen_id):
+        """Queue one "chose previous_id, then chosen_id" event (never blocks)."""
+        if previous_id == chosen_id:
+            return
+        try:
+            self._queue.put_nowait((previous_id, chosen_id))
+            name = "recorded"
+        except Full:
+            name = "dropped"
+        with self._lock:
+            self._counters[name] += 1
+
+    def neighbors(self, video_id):
+        """
+        Items most often chosen right after ``video_id``.
+
+        Returns:
+            Tuple of (video_id, count) pairs, most frequent first
+        """
+        return self._neighbors.get(video_id, ())
+
+    def candidates(self, history_ids, k, exclude=(), window=3):
+        """
+        Candidate ids from the neighbours of the most recent choices.
+
+        The latest choice weighs most; each older one counts half as much.
+
+        Args:
+            history_ids: Chosen ids, oldest first
+            k: Number of ids to return at most
+            exclude: Collection of ids to leave out (e.g. already used)
+            window: Number of recent choices to use
+
+        Returns:
+            list: Video ids, best first
+        """
+        scores = {}
+        weight = 1.0
+        for video_id in reversed(history_ids[-window:]):
+            neighbors = self.neighbors(video_id)
+            if neighbors:
+                top_count = neighbors[0][1]
+                for neighbor, count in neighbors:
+                    if neighbor not in exclude:
+                        scores[neighbor] = scores.get(neighbor, 0.0) + weight * count / top_count
+            weight /= 2
+        return [video_id for video_id, _ in heapq.nlargest(k, scores.items(), key=itemgetter(1))]
+
+    def _top(self, row):
+        return tuple(heapq.nlargest(self.top_k, row.items(), key=itemgetter(1)))
+
+    def _run(self):
+        """Aggregator loop: apply queued events in batches, save on schedule."""
+        next_save = time.monotonic() + self.snapshot_interval
+        while True:
+            timeout = max(0.0, next_save - time.monotonic()) if self.path else None
+            events = []
+            try:
+                events.append(self._queue.get(timeout=timeout))
+                while len(events) < 1000:
+                    events.append(self._queue.get_nowait())
+            except Empty:
+                pass
+            if events:
+                self._apply(events)
+                for _ in events:
+                    self._queue.task_done()
+            if self.path and time.monotonic() >= next_save:
+                self.save()
+                next_save = time.monotonic() + self.snapshot_interval
+
+    def _apply(self, events):
+        touched = set()
+        with self._lock:
+            for source, target in events:
+                _increment(self._counts, source, target, 1, self.max_neighbors)
+                if self.path:
+                    _increment(self._delta, source, target, 1, self.max_neighbors)
+                touched.add(source)
+            for source in touched:
+                self._neighbors[source] = self._top(self._counts[source])
+
+    def flush(self):
+        """Wait until every queued event has been applied."""
+        self._queue.join()
+
+    def close(self):
+        """Apply the events still queued and save them (registered with atexit when ``path`` is set)."""
+        events = []
+        try:
+            while True:
+                events.append(self._queue.get_nowait())
+        except Empty:
+            pass
+        if events:
+            self._apply(events)
+            for _ in events:
+                self._queue.task_done()
+        with self._lock:
+            pending = bool(self._delta)
+        if pending:
+            self.save()
+
+    def _read(self):
+        with open(self.path) as f:
+            return json.load(f)["counts"]
+
+    def load(self):
+        """Replace the counts with the snapshot at ``path``."""
+        start = time.perf_counter()
+        counts = self._read()
+        neighbors = {source: self._top(row) for source, row in counts.items()}
+        with self._lock:
+            self._counts = counts
+            self._neighbors = neighbors
+        self.load_seconds = time.perf_counter() - start
+
+    def save(self):
+        """Merge this worker's increments since the last save into the snapshot file."""
+        if not self.path:
+            return
+        with self._lock:
+            delta, self._delta = self._delta, {}
+        try:
+            with open(self.path + ".lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                merged = self._read() if os.path.exists(self.path) else {}
+                for source, row in delta.items():
+                    for target, count in row.items():
+                        _increment(merged, source, target, count, self.max_neighbors)
+                directory = os.path.dirname(os.path.abspath(self.path))
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"counts": merged}, f, separators=(",", ":"))
+                os.replace(tmp_path, self.path)
+        except (OSError, ValueError) as e:
+            print(f"Co-click snapshot not saved: {e}")
+            with self._lock:
+                for source, row in delta.items():
+                    for target, count in row.items():
+                        _increment(self._delta, source, target, count, self.max_neighbors)
+                self._counters["save_errors"] += 1
+            return
+
+        with self._lock:
+            # Increments applied while saving are still to be saved; keep them in memory too
+            for source, row in self._delta.items():
+                for target, count in row.items():
+                    _increment(merged, source, target, count, self.max_neighbors)
+            self._counts = merged
+            self._neighbors = {source: self._top(row) for source, row in merged.items()}
+            self._counters["saves"] += 1
+
+    def stats(self):
+        """Counters plus the size of the model."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["items"] = len(self._counts)
+            stats["pairs"] = sum(len(row) for row in self._counts.values())
+        stats["queued"] = self._queue.qsize()
+        stats["load_ms"] = round(self.load_seconds * 1000, 1) if self.load_seconds is not None else None
+        return stats
+
+
+def create_coclick():
+    """
+    Build the co-click model from environment configuration.
+
+    Returns:
+        CoClickModel, or None when COCLICK_ENABLED is off
+    """
+    if os.getenv("COCLICK_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return CoClickModel(
+        top_k=int(os.getenv("COCLICK_TOP_K", 20)),
+        max_neighbors=int(os.getenv("COCLICK_MAX_NEIGHBORS", 64)),
+        path=os.getenv("COCLICK_PATH", "coclick.json") or None,
+        snapshot_interval=float(os.getenv("COCLICK_SNAPSHOT_SECONDS", 60)),
+    )
@@ -0,0 +1,402 @@
+"""Compiled, memory-mapped catalog format.
+
+A compiled catalog is one file: a magic number, a JSON header and
+64-byte aligned NumPy columns.
+
+- numeric fields (duration, views, likes) are plain integer columns
+- categories are small integer codes into the header's category list
+- titles, creators, colours and tags are codes into one string table
+  (a UTF-8 blob plus offsets) in which each distinct string appears once
+- ids are a fixed-width column, plus a sorted copy for binary search
+- integer-coded title attributes (video_generator.ATTRIBUTE_SLOTS) are
+  one int16 column per slot, -1 where an item has none
+
+The file is opened read-only with mmap, so gunicorn workers share its
+pages through the page cache instead of each holding its own dicts, and
+a dict is only built for an item that is actually looked at.
+
+Convert a JSON (array) or JSONL catalog with:
+    python compiled_catalog.py [thumbnails_config.json] [thumbnails.vcat]
+"""
+import json
+import mmap
+import os
+import sys
+import tempfile
+from array import array
+from collections.abc import Sequence
+from functools import lru_cache
+from operator import index as as_index
+
+import numpy as np
+
+from catalog import Catalog
+from video_generator import ATTRIBUTE_SLOTS, title_attributes
+
+MAGIC = b"VRCATLG1"
+VERSION = 2
+ALIGN = 64
+
+NUMERIC_FIELDS = {"duration": "<i4", "views": "<i8", "likes": "<i8"}
+STRING_FIELDS = ("title", "creator", "thumbnail_color")
+FIELDS = ("id", "title", "category", "tags") + tuple(NUMERIC_FIELDS) + ("thumbnail_color", "creator", "attrs")
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+class CatalogWriter:
+    """
+    Builds a compiled catalog one item at a time.
+
+    Only the columns are held in memory (compact arrays and the table of
+    distinct strings), never the item dicts, so items can be streamed in
+    from a generator or a JSONL file. Fields outside FIELDS are not stored.
+
+    Usage:
+        with CatalogWriter("thumbnails.vcat") as writer:
+            for video in videos:
+                writer.add(video)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = []
+        self._categories = {}
+        self._category_codes = array("H")
+        self._numeric = {field: array("q") for field in NUMERIC_FIELDS}
+        self._string_codes = {field: array("I") for field in STRING_FIELDS}
+        self._tag_offsets = array("Q", [0])
+        self._tag_codes = array("I")
+        self._attrs = {slot: array("h") for slot in ATTRIBUTE_SLOTS}
+        self._strings = {}
+        self._blob = bytearray()
+        self._string_offsets = array("Q", [0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _string(self, text):
+        code = self._strings.get(text)
+        if code is None:
+            code = self._strings[text] = len(self._strings)
+            self._blob += text.encode()
+            self._string_offsets.append(len(self._blob))
+        return code
+
+    def add(self, video):
+        """Append one video dict."""
+        self._ids.append(video["id"].encode())
+        category = video.get("category", "")
+        code = self._categories.get(category)
+        if code is None:
+            code = self._categories[category] = len(self._categories)
+        self._category_codes.append(code)
+        for field, column in self._numeric.items():
+            column.append(int(video.get(field, 0)))
+        for field, column in self._string_codes.items():
+            column.append(self._string(video.get(field, "")))
+        tags = video.get("tags", [])
+        self._tag_codes.extend(self._string(tag) for tag in tags)
+        self._tag_offsets.append(len(self._tag_codes))
+        attrs = video.get("attrs")
+        if attrs is None:
+            attrs = title_attributes(video.get("title", ""), category, tags)
+        for slot, column in self._attrs.items():
+            column.append(attrs.get(slot, -1))
+
+    def add_all(self, videos):
+        for video in videos:
+            self.add(video)
+
+    def _columns(self):
+        width = max((len(vid) for vid in self._ids), default=1)
+        ids = np.array(self._ids, dtype=f"S{width}")
+        id_rows = np.argsort(ids, kind="stable").astype(np.uint32)
+        sorted_ids = ids[id_rows]
+        if len(sorted_ids) > 1 and np.any(sorted_ids[1:] == sorted_ids[:-1]):
+            duplicate = sorted_ids[1:][sorted_ids[1:] == sorted_ids[:-1]][0].decode()
+            raise ValueError(f"Duplicate video id in catalog: {duplicate}")
+
+        columns = {
+            "ids": ids,
+            "sorted_ids": sorted_ids,
+            "id_rows": id_rows,
+            "category": np.frombuffer(self._category_codes, dtype=np.uint16),
+            "tag_offsets": np.frombuffer(self._tag_offsets, dtype=np.uint64),
+            "tag_codes": np.frombuffer(self._tag_codes, dtype=np.uint32),
+            "string_offsets": np.frombuffer(self._string_offsets, dtype=np.uint64),
+            "string_blob": np.frombuffer(bytes(self._blob), dtype=np.uint8),
+        }
+        for field, dtype in NUMERIC_FIELDS.items():
+            columns[field] = np.frombuffer(self._numeric[field], dtype=np.int64).astype(dtype)
+        for field in STRING_FIELDS:
+            columns[field] = np.frombuffer(self._string_codes[field], dtype=np.uint32)
+        for slot in ATTRIBUTE_SLOTS:
+            columns["attr_" + slot] = np.frombuffer(self._attrs[slot], dtype=np.int16)
+        return columns
+
+    def close(self):
+        """
+        Write the file (atomically, via a temporary file and rename).
+
+        Returns:
+            int: Number of items written
+
+        Raises:
+            ValueError: If two items share an id
+        """
+        columns = self._columns()
+        layout = {}
+        offset = 0
+        for name, column in columns.items():
+            layout[name] = {"dtype": column.dtype.str, "shape": list(column.shape), "offset": offset}
+            offset = _aligned(offset + column.nbytes)
+        header = json.dumps({
+            "version": VERSION,
+            "count": len(self._ids),
+            "categories": list(self._categories),
+            "columns": layout,
+        }).encode()
+        data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC + len(header).to_bytes(8, "little") + header)
+                for name, column in columns.items():
+                    f.seek(data_start + layout[name]["offset"])
+                    f.write(column.tobytes())
+                f.truncate(data_start + offset)
+            os.chmod(tmp_path, 0o644)  # mkstemp creates it owner-only
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return len(self._ids)
+
+
+class _ItemView(Sequence):
+    """Read-only sequence of a compiled catalog's items, built on access."""
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+
+    def __len__(self):
+        return len(self._catalog)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self._catalog._item(r) for r in range(*row.indices(len(self)))]
+        row = as_index(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("catalog row out of range")
+        return self._catalog._item(row)
+
+    def __iter__(self):
+        item = self._catalog._item
+        return (item(row) for row in range(len(self)))
+
+
+class CompiledCatalog(Catalog):
+    """
+    Catalog backed by a memory-mapped compiled file.
+
+    Same interface as Catalog. ``items`` is a lazy sequence: indexing it
+    builds a fresh video dict from the columns, so only the items a
+    request touches cost Python objects. Id lookups binary-search the
+    sorted id column; category and tag posting lists are computed with
+    NumPy on first use.
+    """
+
+    def __init__(self, path):
+        """Map a compiled catalog file (see CatalogWriter)."""
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # A plain ndarray over the mapping: np.memmap slicing is several times slower
+        self._map = np.frombuffer(self._mmap, dtype=np.uint8)
+        if self._map[:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError(f"{path} is not a compiled catalog")
+        header_length = int.from_bytes(self._map[len(MAGIC):len(MAGIC) + 8].tobytes(), "little")
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._map[header_start:header_start + header_length].tobytes())
+        if header.get("version") != VERSION:
+            raise ValueError(f"{path} is a version {header.get('version')} compiled catalog; recompile it")
+        data_start = _aligned(header_start + header_length)
+
+        columns = {}
+        for name, spec in header["columns"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            start = data_start + spec["offset"]
+            columns[name] = self._map[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+        self._columns = columns
+        self._count = header["count"]
+        self._category_names = header["categories"]
+        self._category_code = {name: code for code, name in enumerate(self._category_names)}
+        self._id_width = columns["ids"].dtype.itemsize
+        self._attr_columns = [(slot, columns["attr_" + slot]) for slot in ATTRIBUTE_SLOTS]
+        self._string = lru_cache(maxsize=65536)(self._decode)
+        self._category_cache = {}
+        self._tag_cache = {}
+        self._tag_vocabulary = None
+        self._tag_entry_rows = None
+
+        self.items = _ItemView(self)
+        counts = np.bincount(columns["category"], minlength=len(self._category_names))
+        self.category_counts = {name: int(counts[code]) for code, name in enumerate(self._category_names) if counts[code]}
+
+    @classmethod
+    def compile(cls, items, path):
+        """Write ``items`` to ``path`` and map the result."""
+        with CatalogWriter(path) as writer:
+            writer.add_all(items)
+        return cls(path)
+
+    def _decode(self, code):
+        offsets = self._columns["string_offsets"]
+        return self._columns["string_blob"][offsets[code]:offsets[code + 1]].tobytes().decode()
+
+    def _item(self, row):
+        """Build the video dict of one row."""
+        columns = self._columns
+        string = self._string
+        offsets = columns["tag_offsets"]
+        attrs = {}
+        for slot, column in self._attr_columns:
+            code = int(column[row])
+            if code >= 0:
+                attrs[slot] = code
+        return {
+            "id": columns["ids"][row].decode(),
+            "title": string(int(columns["title"][row])),
+            "category": self._category_names[columns["category"][row]],
+            "tags": [string(int(code)) for code in columns["tag_codes"][offsets[row]:offsets[row + 1]]],
+            "duration": int(columns["duration"][row]),
+            "views": int(columns["views"][row]),
+            "likes": int(columns["likes"][row]),
+            "thumbnail_color": string(int(columns["thumbnail_color"][row])),
+            "creator": string(int(columns["creator"][row])),
+            "attrs": attrs,
+        }
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __contains__(self, video_id):
+        return self.row_of(video_id) is not None
+
+    @property
+    def categories(self):
+        """Categories present in the catalog, in first-seen order."""
+        return list(self._category_names)
+
+    def row_of(self, video_id):
+        """Return the row index for an id, or None if it is unknown."""
+        key = video_id.encode() if isinstance(video_id, str) else video_id
+        if not isinstance(key, bytes) or len(key) > self._id_width:
+            return None
+        sorted_ids = self._columns["sorted_ids"]
+        i = int(sorted_ids.searchsorted(key))
+        if i < len(sorted_ids) and sorted_ids[i] == key:
+            return int(self._columns["id_rows"][i])
+        return None
+
+    def get(self, video_id):
+        """Return the video dict for an id, or None if it is unknown."""
+        row = self.row_of(video_id)
+        return self._item(row) if row is not None else None
+
+    def resolve(self, video_ids):
+        """Map a sequence of ids to video dicts, skipping unknown ids."""
+        rows = (self.row_of(vid) for vid in video_ids)
+        return [self._item(row) for row in rows if row is not None]
+
+    def available_count(self, exclude=()):
+        """Number of catalog videos not in the exclusion set."""
+        return self._count - sum(1 for vid in set(exclude) if vid in self)
+
+    def _category_posting(self, category):
+        rows = self._category_cache.get(category)
+        if rows is None:
+            code = self._category_code.get(category)
+            codes = self._columns["category"]
+            rows = np.flatnonzero(codes == code).tolist() if code is not None else []
+            self._category_cache[category] = rows
+        return rows
+
+    def _tag_posting(self, tag):
+        rows = self._tag_cache.get(tag)
+        if rows is None:
+            tag_codes = self._columns["tag_codes"]
+            if self._tag_vocabulary is None:
+                self._tag_vocabulary = {self._string(int(code)): int(code) for code in np.unique(tag_codes)}
+                self._tag_entry_rows = np.repeat(
+                    np.arange(self._count, dtype=np.uint32), np.diff(self._columns["tag_offsets"]).astype(np.int64)
+                )
+            code = self._tag_vocabulary.get(tag)
+            rows = np.unique(self._tag_entry_rows[tag_codes == code]).tolist() if code is not None else []
+            self._tag_cache[tag] = rows
+        return rows
+
+
+def is_compiled(path):
+    """True if ``path`` starts with the compiled catalog magic number."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def iter_json_items(path):
+    """Yield the items of a JSON array file, or of a JSONL file one line at a time."""
+    if path.endswith(".jsonl"):
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, "r") as f:
+            yield from json.load(f)
+
+
+def load_catalog(path):
+    """
+    Open a catalog file of any supported format.
+
+    Args:
+        path: Compiled catalog, JSON array or JSONL file
+
+    Returns:
+        CompiledCatalog for a compiled file, otherwise an in-memory Catalog
+    """
+    if is_compiled(path):
+        return CompiledCatalog(path)
+    return Catalog(iter_json_items(path))
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else "thumbnails_config.json"
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + ".vcat"
+    with CatalogWriter(target) as writer:
+        writer.add_all(iter_json_items(source))
+        count = len(writer)
+    print(f"✓ Compiled {count} thumbnails from {source}")
+    print(f"✓ Saved to {target} ({os.path.getsize(target) / 1024:.1f} KiB, {os.path.getsize(source) / 1024:.1f} KiB as JSON)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Offline replay of session traces through recommenders, with quality and cost metrics."""
+import json
+import random
+import sqlite3
+import time
+
+from analytics import UserProfile
+
+
+def load_traces(path):
+    """
+    Read session traces from a JSON Lines file.
+
+    Each line is one session: ``{"session": ..., "choices": [video ids]}``
+    for a logged session, or ``{"session": ..., "start": video id,
+    "interests": [categories]}`` for a simulated one (see simulate_traces).
+
+    Args:
+        path: File to read
+
+    Returns:
+        List of trace dicts
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_traces(traces, path):
+    """Write session traces as JSON Lines, one session per line."""
+    with open(path, "w") as f:
+        for trace in traces:
+            f.write(json.dumps(trace, separators=(",", ":")) + "\n")
+
+
+def traces_from_sessions(path, min_choices=2):
+    """
+    Logged traces from the SQLite session store (SESSION_SQLITE_PATH).
+
+    Args:
+        path: SQLite session database
+        min_choices: Sessions with fewer choices are skipped
+
+    Returns:
+        List of logged trace dicts, ordered by session id
+    """
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT sid, data FROM sessions ORDER BY sid").fetchall()
+    finally:
+        conn.close()
+    traces = []
+    for sid, data in rows:
+        history = json.loads(data).get("history", [])
+        if len(history) >= min_choices:
+            traces.append({"session": sid, "choices": history})
+    return traces
+
+
+def simulate_traces(catalog, sessions, rounds, shift=0.1, seed=7):
+    """
+    Simulated sessions: a hidden interest per round that drifts over time.
+
+    Each user starts on a video of a random category, which is their
+    interest, and switches to another category with probability ``shift``
+    before each round.
+
+    Args:
+        catalog: Catalog the videos come from
+        sessions: Number of sessions
+        rounds: Recommendation rounds per session
+        shift: Probability of an interest change before a round
+        seed: Seed of the simulation
+
+    Returns:
+        List of simulated trace dicts
+    """
+    rng = random.Random(seed)
+    categories = sorted({v["category"] for v in catalog.items})
+    traces = []
+    for session in range(sessions):
+        interest = rng.choice(categories)
+        start = rng.choice(catalog.ids_in_category(interest))
+        interests = []
+        for _ in range(rounds):
+            if rng.random() < shift:
+                interest = rng.choice([c for c in categories if c != interest])
+            interests.append(interest)
+        traces.append({"session": f"sim-{seed}-{session}", "start": start, "interests": interests})
+    return traces
+
+
+def _percentile(values, q):
+    """Nearest-rank percentile of sorted ``values``."""
+    if not values:
+        return 0.0
+    return values[max(0, min(len(values) - 1, int(round(q * len(values))) - 1))]
+
+
+class ReplayHarness:
+    """
+    Replays session traces through recommenders and scores them.
+
+    A recommender is anything with the recommend(user_history,
+    candidate_videos, num_recommendations) -> (ids, analysis) method of
+    VideoRecommender, LocalRecommender, CategoryRecommender and
+    TieredRecommender. Every call gets its history and candidates from
+    ``select_candidates`` (app.select_candidates in production), so the
+    whole request path except the HTTP layer is measured.
+
+    Logged traces are replayed as recorded: before each logged choice
+    after the first, the recommender is asked for picks, and a hit is the
+    user's next choice being among them, the accuracy /results shows.
+    Choices were made from what the logging policy showed, so logged
+    traces favour that policy. Simulated traces are interactive: the user
+    picks a recommended video of their current interest when there is one
+    (a hit), else a random recommended video, so every policy is scored
+    on the sessions it leads to.
+
+    The report has the hit rate, the share of catalog categories a session
+    is shown (category coverage), recommend() latency percentiles, and
+    Claude calls and tokens per session for recommenders with
+    usage_stats(), e.g. VideoRecommender on a fake_llm.FakeAnthropic.
+    """
+
+    def __init__(self, catalog, select_candidates, num_recommendations=3, seed=7):
+        """
+        Args:
+            catalog: Catalog the traces refer to
+            select_candidates: Callable (history, profile, used_set) ->
+                (history_for_prompt, candidates_for_prompt)
+            num_recommendations: Videos asked for per call
+            seed: Seed of the simulated users' choices
+        """
+        self.catalog = catalog
+        self.select_candidates = select_candidates
+        self.num_recommendations = num_recommendations
+        self.seed = seed
+        self.categories = {v["category"] for v in catalog.items}
+
+    def _recommend(self, recommender, history, profile, used_set, latencies):
+        history_for_prompt, candidates = self.select_candidates(history, profile, used_set)
+        start = time.perf_counter()
+        ids, _ = recommender.recommend(history_for_prompt, candidates, self.num_recommendations)
+        latencies.append(time.perf_counter() - start)
+        return self.catalog.resolve(ids)
+
+    def _replay_logged(self, recommender, trace, latencies):
+        choices = self.catalog.resolve(trace["choices"])
+        history = choices[:1]
+        profile = UserProfile.from_history(history)
+        hits, calls, shown = 0, 0, set()
+        for choice in choices[1:]:
+            offered = self._recommend(recommender, history, profile, {v["id"] for v in history}, latencies)
+            calls += 1
+            hits += choice["id"] in {v["id"] for v in offered}
+            shown.update(v["category"] for v in offered)
+            history.append(choice)
+            profile.add(choice)
+        return hits, calls, shown
+
+    def _replay_simulated(self, recommender, trace, latencies):
+        rng = random.Random(f"{self.seed}-{trace['session']}")
+        history = self.catalog.resolve([trace["start"]])
+        profile = UserProfile.from_history(history)
+        used_set = {v["id"] for v in history}
+        hits, calls, shown = 0, 0, set()
+        for interest in trace["interests"]:
+            offered = self._recommend(recommender, history, profile, used_set, latencies)
+            calls += 1
+            if not offered:
+                break
+            shown.update(v["category"] for v in offered)
+            matching = [v for v in offered if v["category"] == interest]
+            hits += bool(matching)
+            choice = rng.choice(matching or offered)
+            used_set.add(choice["id"])
+            history.append(choice)
+            profile.add(choice)
+        return hits, calls, shown
+
+    def replay(self, recommender, traces):
+        """
+        Replay traces through one recommender.
+
+        Args:
+            recommender: Object with recommend(); usage_stats() is read if present
+            traces: Logged and/or simulated trace dicts
+
+        Returns:
+            dict: sessions, calls, hit_rate, category_coverage, latency
+            percentiles (p50_ms, p90_ms, p99_ms, max_ms), and
+            llm_calls_per_session and tokens_per_session
+        """
+        usage_stats = getattr(recommender, "usage_stats", None)
+        usage_before = (usage_stats() if usage_stats else None) or {}
+        latencies = []
+        hits = calls = sessions = 0
+        coverage = 0.0
+        for trace in traces:
+            if "choices" in trace:
+                session_hits, session_calls, shown = self._replay_logged(recommender, trace, latencies)
+            else:
+                session_hits, session_calls, shown = self._replay_simulated(recommender, trace, latencies)
+            if not session_calls:
+                continue
+            sessions += 1
+            hits += session_hits
+            calls += session_calls
+            coverage += len(shown) / len(self.categories)
+        usage_after = (usage_stats() if usage_stats else None) or {}
+
+        def used(name):
+            return usage_after.get(name, 0) - usage_before.get(name, 0)
+
+        latencies.sort()
+        per_session = sessions or 1
+        return {
+            "sessions": sessions,
+            "calls": calls,
+            "hit_rate": round(hits / calls, 4) if calls else 0.0,
+            "category_coverage": round(coverage / per_session, 4),
+            "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+            "p90_ms": round(_percentile(latencies, 0.90) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            "llm_calls_per_session": round(used("calls") / per_session, 2),
+            "tokens_per_session": round(
+                (used("total_input_tokens") + used("output_tokens")) / per_session, 1
+            ),
+        }
@@ -0,0 +1,342 @@
+"""Local stand-in for the Anthropic client, for offline runs, benchmarks and checks.
+
+FakeAnthropic accepts the same messages.create() and messages.stream()
+arguments the recommender sends, validates the prompt-caching markers,
+simulates the usage fields of a real response (including cache reads and
+writes of the marked prefix) and answers deterministically with the first
+candidate handles in the prompt, in the order the prompt asks for
+(analysis first, ids first, or a JSON object per user for batches). Stop
+sequences are honoured, and a ``script`` of text chunks can replace the
+generated answer.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from prompt_builder import estimate_tokens
+
+# Candidate handles as written by PromptBuilder (c1, c2, ... or v0, v1, ...)
+HANDLE_RE = re.compile(r"\b([cv]\d+)\b")
+
+# One user section of a batched prompt (PromptBuilder.build_batch)
+BATCH_USER_RE = re.compile(r"USER (u\d+) \(pick (\d+)\):.*?\nCandidates: ([^\n]*)", re.S)
+
+# Smallest prefix the API will cache (Sonnet models)
+MIN_CACHEABLE_TOKENS = 1024
+
+# The API accepts at most this many cache_control breakpoints per request
+MAX_CACHE_BREAKPOINTS = 4
+
+# Characters per streamed chunk when no script is given (about one token)
+CHUNK_CHARS = 4
+
+
+def _blocks(content):
+    """Normalize a system/message content field to a list of text blocks."""
+    if content is None:
+        return []
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return list(content)
+
+
+def _check_cache_control(block):
+    marker = block.get("cache_control")
+    if marker is None:
+        return False
+    if marker.get("type") != "ephemeral" or set(marker) - {"type", "ttl"}:
+        raise ValueError(f"Invalid cache_control marker: {marker}")
+    return True
+
+
+class FakeMessageStream:
+    """
+    Stand-in for the SDK's MessageStream: text chunks plus a message snapshot.
+
+    ``chunks_sent`` and ``closed`` show how much of the answer was generated
+    before the reader stopped.
+    """
+
+    def __init__(self, client, model, chunks, stop_reason, usage):
+        self._client = client
+        self.chunks = chunks
+        self.chunks_sent = 0
+        self.closed = False
+        self._stop_reason = stop_reason
+        self.current_message_snapshot = SimpleNamespace(
+            content=[SimpleNamespace(type="text", text="")],
+            usage=usage,
+            stop_reason=None,
+            model=model,
+        )
+
+    def _emit(self, chunk):
+        snapshot = self.current_message_snapshot
+        snapshot.content[0].text += chunk
+        snapshot.usage.output_tokens = estimate_tokens(snapshot.content[0].text)
+        self.chunks_sent += 1
+        if self.chunks_sent == len(self.chunks):
+            snapshot.stop_reason = self._stop_reason
+        return chunk
+
+    @property
+    def text_stream(self):
+        while self.chunks_sent < len(self.chunks) and not self.closed:
+            self._client._delay(self._client.token_latency)
+            yield self._emit(self.chunks[self.chunks_sent])
+
+    def get_final_message(self):
+        for _ in self.text_stream:
+            pass
+        return self.current_message_snapshot
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncMessageStream(FakeMessageStream):
+    """Stand-in for the SDK's AsyncMessageStream."""
+
+    @property
+    async def text_stream(self):
+        while self.chunks_sent < len(self.chunks) and not self.closed:
+            await self._client._async_delay(self._client.token_latency)
+            yield self._emit(self.chunks[self.chunks_sent])
+
+    async def get_final_message(self):
+        async for _ in self.text_stream:
+            pass
+        return self.current_message_snapshot
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeMessageStreamManager:
+    """What ``messages.stream()`` returns: a context manager opening the stream."""
+
+    def __init__(self, client, request):
+        self._client = client
+        self._request = request
+        self.stream = None
+
+    def __enter__(self):
+        self.stream = self._client._open_stream(FakeMessageStream, self._request)
+        self._client._delay(self._client.latency)
+        return self.stream
+
+    def __exit__(self, *exc_info):
+        self.stream.close()
+
+    async def __aenter__(self):
+        self.stream = self._client._open_stream(FakeAsyncMessageStream, self._request)
+        await self._client._async_delay(self._client.latency)
+        return self.stream
+
+    async def __aexit__(self, *exc_info):
+        await self.stream.close()
+
+
+class FakeMessages:
+    """The ``client.messages`` namespace of FakeAnthropic."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, model, max_tokens, messages, system=None, **kwargs):
+        """Validate the request, simulate usage and return a canned answer."""
+        client = self._client
+        request = dict(kwargs, model=model, max_tokens=max_tokens, messages=messages, system=system)
+        usage = client._start(request)
+        chunks, stop_reason = client._chunks(request)
+        client._delay(client.latency)
+        client._delay(client.token_latency * len(chunks))
+        return client._message(model, "".join(chunks), stop_reason, usage)
+
+    def stream(self, model, max_tokens, messages, system=None, **kwargs):
+        """Return a context manager that validates the request and opens a FakeMessageStream."""
+        request = dict(kwargs, model=model, max_tokens=max_tokens, messages=messages, system=system)
+        return FakeMessageStreamManager(self._client, request)
+
+
+class FakeAsyncMessages(FakeMessages):
+    """The ``client.messages`` namespace of FakeAsyncAnthropic."""
+
+    async def create(self, model, max_tokens, messages, system=None, **kwargs):
+        """Async version of FakeMessages.create (the delay does not block the loop)."""
+        client = self._client
+        request = dict(kwargs, model=model, max_tokens=max_tokens, messages=messages, system=system)
+        usage = client._start(request)
+        chunks, stop_reason = client._chunks(request)
+        await client._async_delay(client.latency)
+        await client._async_delay(client.token_latency * len(chunks))
+        return client._message(model, "".join(chunks), stop_reason, usage)
+
+
+class FakeAnthropic:
+    """
+    Deterministic fake of ``anthropic.Anthropic`` for the parts the app uses.
+
+    Args:
+        latency: Seconds before the first token (float, or callable returning one)
+        min_cacheable_tokens: Prefix size below which markers have no effect
+        fail_with: Optional exception instance raised by every call, or a
+            callable returning the exception for each call (None = answer)
+        token_latency: Seconds per generated chunk
+        script: Optional list of text chunks to answer with instead of the
+            generated answer (handles are used as written)
+    """
+
+    def __init__(self, latency=0.0, min_cacheable_tokens=MIN_CACHEABLE_TOKENS, fail_with=None,
+                 token_latency=0.0, script=None):
+        self.latency = latency
+        self.min_cacheable_tokens = min_cacheable_tokens
+        self.fail_with = fail_with
+        self.token_latency = token_latency
+        self.script = script
+        self.messages = FakeMessages(self)
+        self.requests = []
+        self.streams = []
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _seconds(latency):
+        return latency() if callable(latency) else latency
+
+    def _delay(self, latency):
+        seconds = self._seconds(latency)
+        if seconds:
+            time.sleep(seconds)
+
+    async def _async_delay(self, latency):
+        seconds = self._seconds(latency)
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def _usage(self, system, messages):
+        """Token usage with prompt caching applied to the marked prefix."""
+        blocks = _blocks(system)
+        for message in messages:
+            blocks.extend(_blocks(message["content"]))
+
+        breakpoints = 0
+        prefix = hashlib.sha256()
+        prefix_tokens = 0
+        cached_upto = 0  # tokens covered by the longest cacheable prefix
+        cached_key = None
+        total_tokens = 0
+        for block in blocks:
+            tokens = estimate_tokens(block.get("text", ""))
+            total_tokens += tokens
+            prefix.update(block.get("text", "").encode())
+            prefix_tokens += tokens
+            if _check_cache_control(block):
+                breakpoints += 1
+                if prefix_tokens >= self.min_cacheable_tokens:
+                    cached_upto = prefix_tokens
+                    cached_key = prefix.hexdigest()
+        if breakpoints > MAX_CACHE_BREAKPOINTS:
+            raise ValueError(f"At most {MAX_CACHE_BREAKPOINTS} cache_control blocks are allowed")
+
+        read = created = 0
+        if cached_key is not None:
+            with self._lock:
+                if cached_key in self._cached_prefixes:
+                    read = cached_upto
+                else:
+                    self._cached_prefixes.add(cached_key)
+                    created = cached_upto
+        return SimpleNamespace(
+            input_tokens=total_tokens - read - created,
+            cache_read_input_tokens=read,
+            cache_creation_input_tokens=created,
+            output_tokens=0,
+        )
+
+    def _answer(self, messages):
+        """First candidate handles of the prompt, with a short analysis (per user for batches)."""
+        text = "\n".join(b.get("text", "") for b in _blocks(messages[-1]["content"]))
+        if "JSON object mapping each user label" in text:
+            picks = {
+                label: HANDLE_RE.findall(offered)[:int(count)]
+                for label, count, offered in BATCH_USER_RE.findall(text)
+            }
+            return json.dumps(picks)
+        section = text.split("CANDIDATE THUMBNAILS", 1)[-1].split("TASK:", 1)[0]
+        wanted = re.search(r"JSON array of (\d+)", text)
+        count = int(wanted.group(1)) if wanted else 3
+        handles = []
+        for handle in HANDLE_RE.findall(section):
+            if handle not in handles:
+                handles.append(handle)
+        picks = "[" + ", ".join(f'"{h}"' for h in handles[:count]) + "]"
+        analysis = (
+            "The user keeps returning to the same kind of content, so these candidates "
+            "continue that pattern."
+        )
+        if "First line: ONLY the JSON array" in text:
+            return f"{picks}\n{analysis}"
+        return f"{analysis}\n\n{picks}"
+
+    def _chunks(self, request):
+        """The answer as streamed chunks, cut before the first stop sequence."""
+        if self.script is not None:
+            chunks = list(self.script)
+        else:
+            text = self._answer(request["messages"])
+            chunks = [text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)]
+
+        text = "".join(chunks)
+        stops = [text.find(s) for s in request.get("stop_sequences") or () if s in text]
+        if not stops:
+            return chunks, "end_turn"
+        cut = min(stops)
+        kept, length = [], 0
+        for chunk in chunks:
+            if length + len(chunk) >= cut:
+                if cut > length:
+                    kept.append(chunk[:cut - length])
+                break
+            kept.append(chunk)
+            length += len(chunk)
+        return kept, "stop_sequence"
+
+    def _start(self, request):
+        """Record and validate a request; returns its simulated input usage."""
+        with self._lock:
+            self.requests.append(request)
+        error = self.fail_with() if callable(self.fail_with) else self.fail_with
+        if error is not None:
+            raise error
+        return self._usage(request.get("system"), request["messages"])
+
+    def _open_stream(self, stream_class, request):
+        usage = self._start(request)
+        chunks, stop_reason = self._chunks(request)
+        stream = stream_class(self, request["model"], chunks, stop_reason, usage)
+        with self._lock:
+            self.streams.append(stream)
+        return stream
+
+    @staticmethod
+    def _message(model, text, stop_reason, usage):
+        usage.output_tokens = estimate_tokens(text)
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=text)],
+            usage=usage,
+            stop_reason=stop_reason,
+            model=model,
+        )
+
+
+class FakeAsyncAnthropic(FakeAnthropic):
+    """Deterministic fake of ``anthropic.AsyncAnthropic``; same arguments as FakeAnthropic."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.messages = FakeAsyncMessages(self)
@@ -0,0 +1,131 @@
+"""Incremental computation of the recommendation funnel visualization."""
+from analytics import UserProfile, calculate_familiarity_score
+
+# Category colors for visualization
+CATEGORY_COLORS = {
+    "food": "#ef4444",
+    "travel": "#3b82f6",
+    "tech": "#8b5cf6",
+    "lifestyle": "#ec4899",
+    "education": "#10b981",
+    "entertainment": "#f59e0b"
+}
+DEFAULT_COLOR = "#6b7280"
+
+
+def category_distribution(category_counts, total):
+    """Turn per-category counts into the count/percentage/color dict the template expects."""
+    distribution = {}
+    for category, count in category_counts.items():
+        if count <= 0:
+            continue
+        distribution[category] = {
+            "count": count,
+            "percentage": round((count / total) * 100, 1) if total else 0,
+            "color": CATEGORY_COLORS.get(category, DEFAULT_COLOR)
+        }
+    return distribution
+
+
+def record_familiarity(trail, history_length, familiarity_score):
+    """
+    Store the familiarity score reached after ``history_length`` choices.
+
+    The trail holds one score per choice so the funnel never has to rescore
+    history prefixes. Writing by position keeps it correct when a round page
+    is reloaded without a new choice.
+
+    Args:
+        trail: List of scores kept in the session
+        history_length: Number of choices the score was computed for
+        familiarity_score: Score for that history
+
+    Returns:
+        Updated trail
+    """
+    trail = list(trail[:history_length - 1])
+    if len(trail) < history_length - 1:
+        # Older sessions without a full trail: leave gaps for build_funnel to fill
+        trail.extend([None] * (history_length - 1 - len(trail)))
+    trail.append(familiarity_score)
+    return trail
+
+
+def build_funnel(catalog, history, familiarity_trail=()):
+    """
+    Build the funnel levels for a session in one pass over its history.
+
+    Starts from the catalog's precomputed per-category counts and removes one
+    chosen item per step, carrying the preferred-category state forward, so
+    each level costs O(categories) instead of a rescan of the catalog.
+
+    Args:
+        catalog: Catalog the session draws from
+        history: List of chosen video dicts, oldest first
+        familiarity_trail: Per-choice familiarity scores recorded as the user
+            played; missing entries are filled from a profile carried
+            forward through the history
+
+    Returns:
+        Tuple: (initial_distribution, funnel_levels, final_stats)
+    """
+    initial_distribution = category_distribution(catalog.category_counts, len(catalog))
+
+    remaining_counts = dict(catalog.category_counts)
+    removed_ids = set()
+    preference_counts = {}
+    first_seen = {}
+    preferred_category = None
+    profile = UserProfile()
+
+    funnel_levels = []
+    for i, chosen_video in enumerate(history):
+        category = chosen_video["category"]
+
+        # Remove the chosen item from the remaining pool
+        if chosen_video["id"] not in removed_ids and chosen_video["id"] in catalog:
+            removed_ids.add(chosen_video["id"])
+            remaining_counts[category] = remaining_counts.get(category, 0) - 1
+        remaining = len(catalog) - len(removed_ids)
+
+        # Update the preferred category; ties go to the category seen first
+        first_seen.setdefault(category, i)
+        preference_counts[category] = preference_counts.get(category, 0) + 1
+        if preferred_category is None:
+            preferred_category = category
+        else:
+            count, best = preference_counts[category], preference_counts[preferred_category]
+            if count > best or (count == best and first_seen[category] < first_seen[preferred_category]):
+                preferred_category = category
+
+        # Generate insight about AI learning
+        if i == 0:
+            insight = f"First choice revealed interest in {category} content. Filtering begins."
+        elif category == preferred_category:
+            insight = f"Confirmed preference for {preferred_category}. Narrowing focus on similar content."
+        else:
+            insight = f"Exploring {category} while maintaining {preferred_category} as primary interest."
+
+        familiarity_score = familiarity_trail[i] if i < len(familiarity_trail) else None
+        if familiarity_score is None:
+            # Catch the profile up to this level, then score it
+            for video in history[profile.num_videos:i + 1]:
+                profile.add(video)
+            familiarity_score = calculate_familiarity_score(profile)
+
+        funnel_levels.append({
+            "chosen": chosen_video,
+            "remaining": remaining,
+            "distribution": category_distribution(remaining_counts, remaining),
+            "preferred_category": preferred_category,
+            "insight": insight,
+            "familiarity_score": familiarity_score
+        })
+
+    final_stats = {
+        "primary_category": preferred_category or "None",
+        "familiarity": funnel_levels[-1]["familiarity_score"] if funnel_levels else 0,
+        "remaining": len(catalog) - len(removed_ids)
+    }
+
+    return initial_distribution, funnel_levels, final_stats
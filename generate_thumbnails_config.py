@@ -1,31 +1,147 @@
 #!/usr/bin/env python3
 """
-Script to pre-generate 1000 thumbnails and store them in thumbnails_config.json
+Script to pre-generate thumbnails and store them in thumbnails_config.json
+
+Items are generated in shards of ``--shard-size`` by worker processes.
+Every shard is seeded from ``--seed`` and its number, so the output
+depends on the seed, count and shard size only, not on the number of
+workers. Shards are written in order as they finish, and only a few are
+in flight at a time, so the whole catalog is never held in memory. Ids
+come from video_generator.sequential_video_id and are unique by
+construction.
+
+The output format follows the file extension: ``.json`` (a JSON array,
+the default), ``.jsonl`` (one item per line) or ``.vcat`` (a compiled
+catalog, see compiled_catalog.py).
+
+Usage:
+    python generate_thumbnails_config.py [--count N] [--output PATH] [--workers N] [--seed S] [--shard-size N]
 """
 
+import argparse
+import hashlib
 import json
-from video_generator import generate_video_pool
+import os
+import random
+import secrets
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 
-def main():
-    print("Generating 1000 thumbnails...")
-    thumbnails = generate_video_pool(1000, user_history=None)
+from compiled_catalog import CatalogWriter
+from video_generator import ID_SPACE, generate_thumbnail, sequential_video_id
+
+FORMATS = {".json": "json", ".jsonl": "jsonl", ".vcat": "compiled"}
+
+
+def id_offset(seed):
+    """Offset of the id bijection for a seed, so catalogs with different seeds get different ids."""
+    return int.from_bytes(hashlib.sha256(str(seed).encode()).digest()[:8], "big") % ID_SPACE
+
+
+def generate_shard(task):
+    """
+    Generate one shard in a worker process.
+
+    Args:
+        task: Tuple (seed, shard, start, count, fmt)
 
-    output_file = "thumbnails_config.json"
-    with open(output_file, "w") as f:
-        json.dump(thumbnails, f, indent=2)
+    Returns:
+        Tuple: (payload, category_counts), the payload being serialized
+        text for the JSON formats and a list of video dicts otherwise
+    """
+    seed, shard, start, count, fmt = task
+    random.seed(f"{seed}:{shard}")
+    offset = id_offset(seed)
+    videos = [generate_thumbnail(video_id=sequential_video_id(start + i, offset)) for i in range(count)]
+    counts = Counter(video["category"] for video in videos)
+    if fmt == "json":
+        # Same layout as json.dump(videos, f, indent=2), one shard at a time
+        payload = ",\n".join("  " + json.dumps(video, indent=2).replace("\n", "\n  ") for video in videos)
+    elif fmt == "jsonl":
+        payload = "".join(json.dumps(video) + "\n" for video in videos)
+    else:
+        payload = videos
+    return payload, counts
+
+
+def generate_shards(tasks, workers):
+    """Yield shard results in order, keeping at most 2 shards per worker in flight."""
+    if workers <= 1:
+        for task in tasks:
+            yield generate_shard(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(generate_shard, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def generate(output, count, workers, seed, shard_size):
+    """
+    Generate ``count`` thumbnails into ``output``.
+
+    Returns:
+        Counter of videos per category
+    """
+    fmt = FORMATS.get(os.path.splitext(output)[1])
+    if fmt is None:
+        raise ValueError(f"Unsupported output extension for {output} (use one of {', '.join(FORMATS)})")
+    tasks = [
+        (seed, shard, start, min(shard_size, count - start), fmt)
+        for shard, start in enumerate(range(0, count, shard_size))
+    ]
+    categories = Counter()
+
+    if fmt == "compiled":
+        with CatalogWriter(output) as writer:
+            for videos, counts in generate_shards(tasks, workers):
+                writer.add_all(videos)
+                categories.update(counts)
+        return categories
+
+    tmp_path = output + ".tmp"
+    with open(tmp_path, "w") as f:
+        if fmt == "json":
+            f.write("[\n" if count else "[")
+        for shard, (text, counts) in enumerate(generate_shards(tasks, workers)):
+            if fmt == "json" and shard:
+                f.write(",\n")
+            f.write(text)
+            categories.update(counts)
+        if fmt == "json":
+            f.write("\n]" if count else "]")
+    os.replace(tmp_path, output)
+    return categories
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the thumbnail catalog.")
+    parser.add_argument("--count", type=int, default=1000, help="number of thumbnails (default: 1000)")
+    parser.add_argument("--output", default="thumbnails_config.json", help="output file: .json, .jsonl or .vcat")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--seed", default=None, help="seed for a reproducible catalog (default: random)")
+    parser.add_argument("--shard-size", type=int, default=10000, help="thumbnails per shard (default: 10000)")
+    args = parser.parse_args()
+    seed = args.seed if args.seed is not None else str(secrets.randbelow(2 ** 32))
 
-    print(f"✓ Successfully generated {len(thumbnails)} thumbnails")
-    print(f"✓ Saved to {output_file}")
+    print(f"Generating {args.count} thumbnails (seed {seed}, {args.workers} workers)...")
+    start = time.perf_counter()
+    categories = generate(args.output, args.count, args.workers, seed, args.shard_size)
+    elapsed = time.perf_counter() - start
 
-    # Print some statistics
-    categories = {}
-    for thumb in thumbnails:
-        cat = thumb["category"]
-        categories[cat] = categories.get(cat, 0) + 1
+    total = sum(categories.values())
+    print(f"✓ Successfully generated {total} thumbnails in {elapsed:.2f} s ({total / max(elapsed, 1e-9):,.0f}/s)")
+    print(f"✓ Saved to {args.output}")
 
+    # Category statistics, counted by the workers as the shards streamed by
     print("\nCategory distribution:")
     for cat, count in sorted(categories.items()):
-        print(f"  {cat}: {count} ({count/len(thumbnails)*100:.1f}%)")
+        print(f"  {cat}: {count} ({count/total*100:.1f}%)")
 
 if __name__ == "__main__":
     main()
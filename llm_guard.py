@@ -0,0 +1,328 @@
+"""Deadline, hedging and circuit breaking around the LLM call."""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class LLMTimeoutError(TimeoutError):
+    """The LLM did not answer within the deadline."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The circuit breaker is open, so the LLM was not called."""
+
+
+def _retryable(error):
+    """
+    Whether a failed attempt is worth making again.
+
+    Errors with an HTTP status (the SDK's APIStatusError) are retried on
+    the statuses the SDK itself retries: timeouts, conflicts, rate limits
+    and server errors (overloaded is 529). Errors without one, such as a
+    reset connection, are retried too.
+    """
+    status = getattr(error, "status_code", None)
+    return status is None or status in (408, 409, 429) or status >= 500
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a cool-down period.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    every call is refused for ``cooldown`` seconds. It then lets a single
+    trial call through (half-open): success closes it again, failure
+    reopens it for another cool-down.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the breaker
+            cooldown: Seconds the breaker stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+            if self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+            }
+            if self.state == self.OPEN:
+                stats["retry_in"] = round(max(0.0, self.cooldown - (time.monotonic() - self.opened_at)), 1)
+        return stats
+
+
+class LLMGuard:
+    """
+    Runs LLM calls under a hard deadline, with optional hedging.
+
+    Each attempt runs in a small thread pool, so the calling request waits
+    at most ``timeout`` seconds no matter how long the provider takes; a
+    late attempt finishes (or hits the SDK timeout) in the background and
+    its answer is ignored. With ``hedge_after`` set, a duplicate attempt is
+    started whenever the outstanding ones have been running that long (or
+    have failed), up to ``max_hedges`` extra attempts, and the first answer
+    wins. Without hedging, an attempt failing with a transient error (see
+    _retryable) is made again straight away, up to ``retries`` times; the
+    SDK's own retries are off under the guard (see recommender.py). Calls
+    that still fail or time out feed the circuit breaker.
+    """
+
+    def __init__(self, timeout=10.0, hedge_after=None, max_hedges=1, retries=1, breaker=None, max_workers=8):
+        """
+        Args:
+            timeout: Deadline in seconds for one guarded call, hedges included
+            hedge_after: Seconds before a duplicate attempt is started (None = no hedging)
+            max_hedges: Maximum number of extra attempts per call
+            retries: Attempts made again after a transient error when not hedging
+            breaker: CircuitBreaker to consult (None = never short-circuit)
+            max_workers: Size of the thread pool running the attempts
+        """
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.max_hedges = max_hedges if hedge_after is not None else 0
+        self.retries = retries
+        self.breaker = breaker
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._counters = {
+            "calls": 0,
+            "successes": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "short_circuited": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "retries": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def call(self, fn, discard=None):
+        """
+        Call ``fn()`` under the deadline.
+
+        Args:
+            fn: Callable making one attempt
+            discard: Optional callable given the result of every successful
+                attempt that is not returned (a hedge that lost, or an
+                attempt finishing after the deadline), e.g. to close a stream
+
+        Returns:
+            Whatever the first successful attempt returned
+
+        Raises:
+            CircuitOpenError: The breaker is open; ``fn`` was not called
+            LLMTimeoutError: No attempt finished within the deadline
+            Exception: The last attempt's error, when every attempt failed
+        """
+        self._count("calls")
+        if self.breaker is not None and not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        start = time.monotonic()
+        deadline = start + self.timeout
+        next_hedge = start + self.hedge_after if self.max_hedges else None
+        attempts = [self._executor.submit(fn)]
+        pending = set(attempts)
+        error = None
+
+        while True:
+            wake = deadline if next_hedge is None else min(deadline, next_hedge)
+            done, pending = wait(pending, timeout=max(0.0, wake - time.monotonic()), return_when=FIRST_COMPLETED)
+            winner = next((f for f in attempts if f in done and f.exception() is None), None)
+            if winner is not None:
+                self._abandon([f for f in attempts if f is not winner], discard)
+                self._count("successes")
+                if winner is not attempts[0]:
+                    self._count("hedge_wins")
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return winner.result()
+            for future in done:
+                error = future.exception()
+
+            now = time.monotonic()
+            hedges_left = len(attempts) <= self.max_hedges
+            if now >= deadline:
+                self._abandon(attempts, discard)
+                self._fail("timeouts")
+                raise LLMTimeoutError(f"LLM call exceeded {self.timeout}s deadline")
+            if hedges_left and (not pending or now >= next_hedge):
+                # Hedge a slow attempt, or retry straight away after a failure
+                future = self._executor.submit(fn)
+                attempts.append(future)
+                pending.add(future)
+                next_hedge = now + self.hedge_after
+                self._count("hedges")
+            elif not pending and len(attempts) <= self.retries and _retryable(error):
+                attempts.append(self._executor.submit(fn))
+                pending.add(attempts[-1])
+                self._count("retries")
+            elif not pending:
+                self._fail("errors")
+                raise error
+            elif not hedges_left:
+                next_hedge = None
+
+    @staticmethod
+    def _abandon(futures, discard):
+        """Cancel attempts that are no longer wanted, discarding any late results."""
+        def discard_result(future):
+            if not future.cancelled() and future.exception() is None:
+                discard(future.result())
+
+        for future in futures:
+            if not future.cancel() and discard is not None:
+                future.add_done_callback(discard_result)
+
+    async def call_async(self, fn, discard=None):
+        """
+        Await ``fn()`` (a coroutine function) under the deadline.
+
+        Same semantics as call(), but attempts are tasks on the running
+        event loop, and attempts still running when the call returns are
+        cancelled rather than left to finish; ``discard`` is only called
+        for attempts that had already succeeded.
+        """
+        self._count("calls")
+        if self.breaker is not None and not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + self.timeout
+        next_hedge = start + self.hedge_after if self.max_hedges else None
+        attempts = [asyncio.ensure_future(fn())]
+        pending = set(attempts)
+        error = None
+
+        try:
+            while True:
+                wake = deadline if next_hedge is None else min(deadline, next_hedge)
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, wake - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = next((t for t in attempts if t in done and t.exception() is None), None)
+                if winner is not None:
+                    if discard is not None:
+                        for task in done:
+                            if task is not winner and task.exception() is None:
+                                discard(task.result())
+                    self._count("successes")
+                    if winner is not attempts[0]:
+                        self._count("hedge_wins")
+                    if self.breaker is not None:
+                        self.breaker.record_success()
+                    return winner.result()
+                for task in done:
+                    error = task.exception()
+
+                now = loop.time()
+                hedges_left = len(attempts) <= self.max_hedges
+                if now >= deadline:
+                    self._fail("timeouts")
+                    raise LLMTimeoutError(f"LLM call exceeded {self.timeout}s deadline")
+                if hedges_left and (not pending or now >= next_hedge):
+                    task = asyncio.ensure_future(fn())
+                    attempts.append(task)
+                    pending.add(task)
+                    next_hedge = now + self.hedge_after
+                    self._count("hedges")
+                elif not pending and len(attempts) <= self.retries and _retryable(error):
+                    attempts.append(asyncio.ensure_future(fn()))
+                    pending.add(attempts[-1])
+                    self._count("retries")
+                elif not pending:
+                    self._fail("errors")
+                    raise error
+                elif not hedges_left:
+                    next_hedge = None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _fail(self, counter):
+        self._count(counter)
+        if self.breaker is not None:
+            self.breaker.record_failure()
+
+    def stats(self):
+        """Counters, fallback rate and breaker state."""
+        with self._lock:
+            stats = dict(self._counters)
+        failed = stats["calls"] - stats["successes"]
+        stats["fallback_rate"] = round(failed / stats["calls"], 3) if stats["calls"] else 0.0
+        stats["timeout"] = self.timeout
+        stats["breaker"] = self.breaker.stats() if self.breaker is not None else None
+        return stats
+
+
+def create_guard():
+    """
+    Build the LLM guard from environment configuration.
+
+    Returns:
+        LLMGuard
+    """
+    hedge_after = float(os.getenv("LLM_HEDGE_AFTER", 0)) or None
+    return LLMGuard(
+        timeout=float(os.getenv("LLM_TIMEOUT", 10)),
+        hedge_after=hedge_after,
+        max_hedges=int(os.getenv("LLM_MAX_HEDGES", 1)),
+        retries=int(os.getenv("LLM_RETRIES", 1)),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", 5)),
+            cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN", 30)),
+        ),
+    )
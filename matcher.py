@@ -0,0 +1,139 @@
+"""Multi-pattern matching of vocabulary values in free-form titles."""
+import re
+import threading
+
+
+class TitleMatcher:
+    """
+    Finds every vocabulary value that occurs in a title in one pass.
+
+    The vocabulary maps a slot (e.g. "location", "format") to its values,
+    and a hit is reported as the value's index in its slot's list, like the
+    codes of item["attrs"]. A title matches a value exactly when
+    ``value in title`` would, so the matcher can replace per-value loops
+    without changing their results.
+
+    All values are compiled into one regex, factored as a trie of their
+    characters ("Best|Bangalore" becomes "B(?:angalore|est)"): the regex
+    engine then follows one branch per character instead of trying every
+    value at every position, so the cost of a scan barely grows with the
+    vocabulary. Branches are greedy, so the longest value starting at a
+    position matches, and the values it starts with (e.g. "Goa" for "Goa
+    beaches") are credited with it through a table built up front. The
+    search resumes one character after each match start, so values that
+    overlap another match are found too.
+
+    match() memoizes results per item id, since the same catalog items show
+    up in many users' histories.
+    """
+
+    def __init__(self, vocabulary, cache_size=65536):
+        """
+        Args:
+            vocabulary: Dict of slot -> list of values (matched case-sensitively)
+            cache_size: Number of item ids whose hits are memoized (0 = no memo)
+        """
+        self.vocabulary = {slot: list(values) for slot, values in vocabulary.items()}
+        self.cache_size = cache_size
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._counters = {"scans": 0}
+
+        positions = {}
+        for slot, values in self.vocabulary.items():
+            for code, value in enumerate(values):
+                if value:
+                    positions.setdefault(value, []).append((slot, code))
+        # Hits credited to each value: its own plus those of every value it starts with
+        self._hits = {
+            value: frozenset(hit for end in range(1, len(value) + 1) for hit in positions.get(value[:end], ()))
+            for value in positions
+        }
+        # scan() result of a title holding just one value
+        self._found = {value: self._group(hits) for value, hits in self._hits.items()}
+        self._search = re.compile(self._trie_regex(positions) if positions else r"(?!)").search
+
+    @staticmethod
+    def _trie_regex(values):
+        """Regex matching any of ``values``, longest first, factored by common prefixes."""
+        trie = {}
+        for value in values:
+            node = trie
+            for char in value:
+                node = node.setdefault(char, {})
+            node[""] = {}  # end of a value
+
+        def build(node):
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+            return "(?:" + body + ")?" if "" in node else body
+
+        return build(trie)
+
+    def scan(self, title):
+        """
+        Find the vocabulary values in a title.
+
+        Args:
+            title: Text to scan
+
+        Returns:
+            dict: Slot -> tuple of codes in vocabulary order, for slots with
+            hits (shared between calls: do not modify)
+        """
+        search = self._search
+        match = search(title)
+        if match is None:
+            return {}
+        value = match.group()
+        match = search(title, match.start() + 1)
+        if match is None:
+            return self._found[value]
+        hits = set(self._hits[value])
+        while match is not None:
+            hits |= self._hits[match.group()]
+            match = search(title, match.start() + 1)
+        return self._group(hits)
+
+    @staticmethod
+    def _group(hits):
+        found = {}
+        for slot, code in sorted(hits):
+            found.setdefault(slot, []).append(code)
+        return {slot: tuple(codes) for slot, codes in found.items()}
+
+    def match(self, video):
+        """
+        scan() the title of a catalog item, memoized by its id.
+
+        Args:
+            video: Video dict
+
+        Returns:
+            dict: Slot -> tuple of codes, as from scan()
+        """
+        video_id = video.get("id")
+        title = video.get("title", "")
+        if video_id is None or not self.cache_size:
+            return self.scan(title)
+        cached = self._cache.get(video_id)
+        # The title is kept to notice an id that was reused for another item
+        if cached is not None and cached[0] == title:
+            return cached[1]
+        found = self.scan(title)
+        with self._lock:
+            self._counters["scans"] += 1
+            if len(self._cache) >= self.cache_size:
+                # Evict the oldest entry (dicts keep insertion order)
+                self._cache.pop(next(iter(self._cache)), None)
+            self._cache[video_id] = (title, found)
+        return found
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["cached"] = len(self._cache)
+        stats["values"] = len(self._hits)
+        return stats
@@ -0,0 +1,323 @@
+"""Request stage timings, Server-Timing headers and Prometheus metrics."""
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "stage_seconds": ("histogram", "Time spent in each stage of a request"),
+    "request_seconds": ("histogram", "Time to handle a request, by endpoint"),
+    "requests_total": ("counter", "Requests handled, by endpoint and status"),
+    "llm_calls_total": ("counter", "Claude API calls, by outcome"),
+    "fallbacks_total": ("counter", "Recommendations not (fully) made by Claude, by reason"),
+    "cache_lookups_total": ("counter", "Recommendation cache lookups, by result"),
+    "prefetch_served_total": ("counter", "Recommendations served from a prefetch"),
+}
+
+# Stage timings of the request being handled: stage -> seconds
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class _Stage:
+    """Context manager timing one block as a stage."""
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Metrics:
+    """
+    Latency histograms, counters and gauges of one process.
+
+    Code is timed in named stages (``with metrics.stage("llm"): ...``).
+    Each stage lands in the ``stage_seconds`` histogram and, while a
+    request is being handled (between start_request() and
+    finish_request(), tracked in a context variable so threads and asyncio
+    tasks keep theirs apart), in that request's Server-Timing header.
+    Work outside a request, such as prefetching, only feeds the histogram.
+
+    Recording is a few dict and list updates under a lock. Gauges are
+    callables evaluated only when the metrics are read.
+
+    With ``directory`` set, gunicorn workers share one view: each writes a
+    snapshot to ``metrics-<parent pid>-<pid>.json`` every
+    ``flush_interval`` seconds, and render() sums the snapshots of all
+    workers of the same parent (the gunicorn master). Snapshots of workers
+    that exited keep counting toward counters and histograms, so totals
+    never go back when a worker restarts; their gauges are dropped. Files
+    left by masters that are gone are removed at startup.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0, namespace="recommender"):
+        """
+        Args:
+            directory: Directory of the per-worker snapshot files (None = this process only)
+            flush_interval: Seconds between snapshot writes
+            namespace: Prefix of the exported metric names
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._remove_stale()
+            self._flusher = threading.Thread(target=self._run, name="metrics", daemon=True)
+            self._flusher.start()
+
+    def stage(self, name):
+        """Context manager recording the time of its block as stage ``name``."""
+        return _Stage(self, name)
+
+    def observe(self, name, seconds):
+        """Record ``seconds`` spent in stage ``name``."""
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + seconds
+        self._observe(("stage_seconds", (("stage", name),)), seconds)
+
+    def observe_histogram(self, name, seconds, **labels):
+        """Record ``seconds`` in histogram ``name``."""
+        self._observe(_key(name, labels), seconds)
+
+    def _observe(self, key, seconds):
+        bucket = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket counts (+Inf last), then the count and the sum
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 1) + [0, 0.0]
+            histogram[bucket] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    def inc(self, name, amount=1, **labels):
+        """Add ``amount`` to counter ``name``."""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name, fn, help_text="", aggregate="max"):
+        """
+        Register a gauge read from ``fn()`` when the metrics are read.
+
+        Args:
+            name: Metric name (without the namespace)
+            fn: Callable returning a number
+            help_text: HELP line of the metric
+            aggregate: How workers' values combine: "max" for state shared
+                by all workers (e.g. the SQLite session store), "sum" for
+                per-worker state
+        """
+        self._gauges[name] = (fn, help_text, aggregate)
+
+    def start_request(self):
+        """Start collecting the stage timings of a request; returns a token for finish_request()."""
+        return _request_timings.set({}), time.perf_counter()
+
+    def finish_request(self, token, endpoint, status):
+        """
+        Record a finished request.
+
+        Args:
+            token: Return value of start_request()
+            endpoint: Endpoint label (keep the set of values small)
+            status: HTTP status code
+
+        Returns:
+            str: Value of the Server-Timing header (stages and total, in ms)
+        """
+        context_token, start = token
+        elapsed = time.perf_counter() - start
+        timings = _request_timings.get() or {}
+        _request_timings.reset(context_token)
+        self.observe_histogram("request_seconds", elapsed, endpoint=endpoint)
+        self.inc("requests_total", endpoint=endpoint, status=str(status))
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+        parts.append(f"total;dur={elapsed * 1000:.2f}")
+        return ", ".join(parts)
+
+    def snapshot(self):
+        """JSON-serializable state of this process, gauges evaluated now."""
+        with self._lock:
+            counters = [[name, dict(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, dict(labels), list(values)] for (name, labels), values in self._histograms.items()]
+        gauges = {}
+        for name, (fn, _, _) in self._gauges.items():
+            try:
+                gauges[name] = fn()
+            except Exception as e:
+                print(f"Metrics gauge {name} failed: {e!r}")
+        return {"pid": os.getpid(), "counters": counters, "histograms": histograms, "gauges": gauges}
+
+    def _files(self):
+        """(parent pid, pid, path) of every snapshot file in the directory."""
+        files = []
+        for name in os.listdir(self.directory):
+            parts = name[:-len(".json")].split("-") if name.endswith(".json") else ()
+            if len(parts) == 3 and parts[0] == "metrics" and parts[1].isdigit() and parts[2].isdigit():
+                files.append((int(parts[1]), int(parts[2]), os.path.join(self.directory, name)))
+        return files
+
+    def _remove_stale(self):
+        for parent, _, path in self._files():
+            if parent != os.getppid() and not _alive(parent):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _path(self):
+        return os.path.join(self.directory, f"metrics-{os.getppid()}-{os.getpid()}.json")
+
+    def flush(self):
+        """Write this worker's snapshot file (atomically)."""
+        if not self.directory:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.snapshot(), f, separators=(",", ":"))
+            os.replace(tmp_path, self._path())
+        except OSError as e:
+            print(f"Metrics snapshot not saved: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _snapshots(self):
+        """This process's snapshot plus those of the other workers."""
+        own = self.snapshot()
+        if not self.directory:
+            return [own]
+        snapshots = [own]
+        for parent, pid, path in self._files():
+            if parent != os.getppid() or pid == own["pid"]:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # Removed or being replaced meanwhile
+        return snapshots
+
+    def aggregate(self):
+        """
+        Combine the snapshots of all workers.
+
+        Returns:
+            Tuple: (counters, histograms, gauges) keyed like the live state
+        """
+        counters, histograms, gauges = {}, {}, {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot["counters"]:
+                key = _key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot["histograms"]:
+                key = _key(name, labels)
+                total = histograms.get(key)
+                histograms[key] = values if total is None else [a + b for a, b in zip(total, values)]
+            if snapshot["pid"] != os.getpid() and not _alive(snapshot["pid"]):
+                continue
+            for name, value in snapshot["gauges"].items():
+                if name not in self._gauges or value is None:
+                    continue
+                combine = sum if self._gauges[name][2] == "sum" else max
+                gauges[name] = combine((gauges[name], value)) if name in gauges else value
+        return counters, histograms, gauges
+
+    def render(self):
+        """Prometheus text exposition of the metrics of all workers."""
+        self.flush()
+        counters, histograms, gauges = self.aggregate()
+        lines = []
+        described = set()
+
+        def describe(name, kind, help_text):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {self.namespace}_{name} {help_text}")
+                lines.append(f"# TYPE {self.namespace}_{name} {kind}")
+
+        for (name, labels), values in sorted(histograms.items()):
+            describe(name, *HELP.get(name, ("histogram", name)))
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.namespace}_{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.namespace}_{name}_sum{_labels(labels)} {values[-1]:.6f}")
+            lines.append(f"{self.namespace}_{name}_count{_labels(labels)} {values[-2]}")
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, *HELP.get(name, ("counter", name)))
+            lines.append(f"{self.namespace}_{name}{_labels(labels)} {value}")
+        for name, value in sorted(gauges.items()):
+            describe(name, "gauge", self._gauges[name][1] or name)
+            lines.append(f"{self.namespace}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "counters": sum(self._counters.values()),
+                "histograms": len(self._histograms),
+                "observations": sum(values[-2] for values in self._histograms.values()),
+            }
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, owned by someone else
+    return True
+
+
+def create_metrics():
+    """
+    Build the metrics registry from environment configuration.
+
+    Returns:
+        Metrics, or None when METRICS_ENABLED is off
+    """
+    if os.getenv("METRICS_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    directory = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "video-recommender-metrics"))
+    return Metrics(
+        directory=directory or None,
+        flush_interval=float(os.getenv("METRICS_FLUSH_SECONDS", 5)),
+    )
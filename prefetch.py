@@ -0,0 +1,183 @@
+"""Speculative prefetch of next-round recommendations."""
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+class _Entry:
+    """One speculative computation for a (session, choice) pair."""
+
+    __slots__ = ("history_ids", "future", "created")
+
+    def __init__(self, history_ids, future):
+        self.history_ids = history_ids
+        self.future = future
+        self.created = time.monotonic()
+
+
+class RecommendationPrefetcher:
+    """
+    Computes follow-up recommendations before the user picks.
+
+    After a response offers three videos, the next request will choose one
+    of them, so the follow-up for each is computed in a bounded thread pool
+    while the user is looking at the page. The next request takes the
+    matching result (waiting for it if it is already running, computing it
+    itself if it has not started) and cancels the other branches of that
+    session.
+
+    Results live in the worker process that scheduled them; with several
+    gunicorn workers a request routed elsewhere simply misses.
+    """
+
+    def __init__(self, compute, max_workers=4, max_pending=256, ttl=600):
+        """
+        Args:
+            compute: Callable run in the pool; receives the keyword arguments
+                given to schedule() and returns the recommendation result
+            max_workers: Size of the thread pool
+            max_pending: Maximum number of unclaimed prefetches kept at once
+            ttl: Seconds before an unclaimed prefetch is dropped
+        """
+        self.compute = compute
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._entries = {}  # sid -> {choice_id: _Entry}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "scheduled": 0,
+            "hits": 0,
+            "waited": 0,
+            "misses": 0,
+            "cancelled": 0,
+            "wasted": 0,
+            "skipped": 0,
+            "errors": 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def schedule(self, sid, choice_id, history_ids, **kwargs):
+        """
+        Start computing the follow-up for one possible choice.
+
+        Args:
+            sid: Session identifier
+            choice_id: Video id the user may pick next
+            history_ids: History ids the follow-up assumes (including choice_id)
+            **kwargs: Passed to the compute callable
+        """
+        with self._lock:
+            self._expire_locked()
+            if self._pending >= self.max_pending:
+                self._counters["skipped"] += 1
+                return
+            self._pending += 1
+            self._counters["scheduled"] += 1
+
+        future = self._executor.submit(self.compute, **kwargs)
+        with self._lock:
+            previous = self._entries.setdefault(sid, {}).get(choice_id)
+            self._entries[sid][choice_id] = _Entry(list(history_ids), future)
+        if previous is not None:
+            self._discard(previous)
+
+    def take(self, sid, choice_id, history_ids, timeout=None):
+        """
+        Claim the prefetched follow-up for a choice and drop the other branches.
+
+        Args:
+            sid: Session identifier
+            choice_id: Video id the user picked
+            history_ids: Current history ids, used to check the prefetch is still valid
+            timeout: Seconds to wait for a prefetch that is already running
+                (one that has not started yet is cancelled instead)
+
+        Returns:
+            The computed result, or None on a miss
+        """
+        with self._lock:
+            branches = self._entries.pop(sid, {})
+            entry = branches.pop(choice_id, None)
+            if entry is not None:
+                self._pending -= 1
+        for other in branches.values():
+            self._discard(other)
+
+        if entry is None or entry.history_ids != list(history_ids):
+            if entry is not None:
+                self._discard(entry, released=True)
+            self._count("misses")
+            return None
+
+        # A job still queued behind other sessions' speculative work would
+        # make this request wait for all of it: drop it, the caller computes
+        # the answer itself
+        if entry.future.cancel():
+            self._count("cancelled")
+            self._count("misses")
+            return None
+
+        running = not entry.future.done()
+        try:
+            result = entry.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Still running; its result is wasted once the caller recomputes
+            self._count("wasted")
+            self._count("misses")
+            return None
+        except CancelledError:
+            self._count("misses")
+            return None
+        except Exception:
+            self._count("errors")
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        if running:
+            self._count("waited")
+        return result
+
+    def cancel_session(self, sid):
+        """Drop every outstanding prefetch of a session (e.g. on reset)."""
+        with self._lock:
+            branches = self._entries.pop(sid, {})
+        for entry in branches.values():
+            self._discard(entry)
+
+    def _discard(self, entry, released=False):
+        """Cancel an unclaimed prefetch, or count it as wasted if it already ran."""
+        if not released:
+            with self._lock:
+                self._pending -= 1
+        if entry.future.cancel():
+            self._count("cancelled")
+        else:
+            self._count("wasted")
+
+    def _expire_locked(self):
+        """Drop prefetches nobody claimed within the TTL. Caller holds the lock."""
+        cutoff = time.monotonic() - self.ttl
+        for sid in list(self._entries):
+            branches = self._entries[sid]
+            for choice_id in [c for c, e in branches.items() if e.created < cutoff]:
+                entry = branches.pop(choice_id)
+                self._pending -= 1
+                self._counters["cancelled" if entry.future.cancel() else "wasted"] += 1
+            if not branches:
+                del self._entries[sid]
+
+    def stats(self):
+        """Counters plus the hit rate over claimed requests."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["pending"] = self._pending
+        claimed = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / claimed, 3) if claimed else 0.0
+        return stats
@@ -0,0 +1,235 @@
+"""On-demand and slow-request profiling of single requests."""
+import cProfile
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+
+MODES = ("cprofile", "sample")
+
+
+class SamplingProfiler:
+    """
+    Samples the call stack of one thread at a fixed interval.
+
+    A background thread reads the target thread's current frame every
+    ``interval`` seconds (sys._current_frames), so the profiled code runs
+    unmodified and pays only for the GIL hand-offs. The result is in the
+    collapsed-stack format of flamegraph.pl and speedscope: one line per
+    distinct stack, root first, with its sample count.
+    """
+
+    def __init__(self, thread_id=None, interval=0.001):
+        """
+        Args:
+            thread_id: Thread to sample (default: the calling thread)
+            interval: Seconds between samples
+        """
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def folded(self):
+        """Collapsed stacks, most sampled first."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in sorted(self.samples.items(), key=lambda x: -x[1])
+        )
+
+
+class _Profile:
+    """One profiled request."""
+
+    __slots__ = ("mode", "automatic", "profiler", "start")
+
+    def __init__(self, mode, automatic, profiler):
+        self.mode = mode
+        self.automatic = automatic
+        self.profiler = profiler
+        self.start = time.perf_counter()
+
+
+class RequestProfiler:
+    """
+    Profiles single requests and saves the profiles to a directory.
+
+    On demand: a request carrying the admin token (see app.py for the
+    header and query parameter) runs under cProfile (a ``.pstats`` file,
+    for ``python -m pstats`` or snakeviz) or, with mode "sample", under the
+    SamplingProfiler (a ``.folded`` file for flame graphs).
+
+    Automatically: with ``slow_ms`` set, a ``sample_rate`` share of
+    requests run under the sampling profiler, whose overhead is small
+    enough to leave latency mostly intact, and the profile is kept only if
+    the request took at least ``slow_ms``. At most one such request per
+    worker is profiled at a time, and after a profile is kept no other is
+    started for ``interval`` seconds.
+
+    Nothing is installed when neither is configured (create_profiler
+    returns None).
+    """
+
+    def __init__(self, directory="profiles", token=None, slow_ms=0, sample_rate=0.05, interval=60,
+                 sample_interval=0.001):
+        """
+        Args:
+            directory: Where profiles are written
+            token: Admin token enabling on-demand profiling (None = off)
+            slow_ms: Latency from which an automatically sampled request is kept (0 = off)
+            sample_rate: Share of requests profiled while automatic profiling is armed
+            interval: Seconds after a kept automatic profile before the next is started
+            sample_interval: Seconds between samples of the sampling profiler
+        """
+        self.directory = directory
+        self.token = token
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+        self._auto_active = False
+        self._last_auto = float("-inf")
+        self._sequence = 0
+        self._counters = {"requested": 0, "rejected": 0, "sampled": 0, "saved": 0, "discarded": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def begin(self, token=None, mode=None):
+        """
+        Start profiling the current request if it asks for it or is picked for automatic profiling.
+
+        Args:
+            token: Admin token sent with the request, if any
+            mode: "cprofile" (default) or "sample", for on-demand profiles
+
+        Returns:
+            A profile handle for end(), or None
+        """
+        if token:
+            if self.token and hmac.compare_digest(token.encode(), self.token.encode()):
+                self._count("requested")
+                return self._start(mode if mode in MODES else "cprofile", automatic=False)
+            self._count("rejected")
+        if not self.slow_ms or random.random() >= self.sample_rate:
+            return None
+        with self._lock:
+            if self._auto_active or time.monotonic() - self._last_auto < self.interval:
+                return None
+            self._auto_active = True
+            self._counters["sampled"] += 1
+        return self._start("sample", automatic=True)
+
+    def _start(self, mode, automatic):
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profile = _Profile(mode, automatic, profiler)
+            profiler.enable()
+        else:
+            profile = _Profile(mode, automatic, SamplingProfiler(interval=self.sample_interval).start())
+        return profile
+
+    def _stop(self, profile):
+        if profile.mode == "cprofile":
+            profile.profiler.disable()
+        else:
+            profile.profiler.stop()
+        if profile.automatic:
+            with self._lock:
+                self._auto_active = False
+        return (time.perf_counter() - profile.start) * 1000
+
+    def end(self, profile, endpoint):
+        """
+        Stop a profile and save it (automatic ones only if the request was slow).
+
+        Args:
+            profile: Handle returned by begin()
+            endpoint: Endpoint name, used in the file name
+
+        Returns:
+            str: Path of the saved profile, or None
+        """
+        elapsed_ms = self._stop(profile)
+        if profile.automatic:
+            if elapsed_ms < self.slow_ms:
+                self._count("discarded")
+                return None
+            with self._lock:
+                self._last_auto = time.monotonic()
+
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{sequence}-{endpoint}-{elapsed_ms:.0f}ms"
+        path = os.path.join(self.directory, name + (".pstats" if profile.mode == "cprofile" else ".folded"))
+        try:
+            if profile.mode == "cprofile":
+                profile.profiler.dump_stats(path)
+            else:
+                with open(path, "w") as f:
+                    f.write(profile.profiler.folded())
+        except OSError as e:
+            print(f"Profile not saved: {e}")
+            return None
+        self._count("saved")
+        print(f"✓ Profiled {endpoint} ({elapsed_ms:.0f} ms{', slow' if profile.automatic else ''}): {path}")
+        return path
+
+    def cancel(self, profile):
+        """Stop a profile without saving it (e.g. the request failed)."""
+        self._stop(profile)
+        self._count("discarded")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["on_demand"] = bool(self.token)
+        stats["slow_ms"] = self.slow_ms
+        return stats
+
+
+def create_profiler():
+    """
+    Build the request profiler from environment configuration.
+
+    Returns:
+        RequestProfiler, or None when neither PROFILE_TOKEN nor PROFILE_SLOW_MS is set
+    """
+    token = os.getenv("PROFILE_TOKEN") or None
+    slow_ms = float(os.getenv("PROFILE_SLOW_MS", 0))
+    if token is None and not slow_ms:
+        return None
+    return RequestProfiler(
+        directory=os.getenv("PROFILE_DIR", "profiles"),
+        token=token,
+        slow_ms=slow_ms,
+        sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0.05)),
+        interval=float(os.getenv("PROFILE_INTERVAL_SECONDS", 60)),
+        sample_interval=float(os.getenv("PROFILE_SAMPLE_MS", 1)) / 1000,
+    )
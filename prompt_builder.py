@@ -0,0 +1,294 @@
+"""Token-budgeted, compact prompt construction for the recommender."""
+import threading
+
+from video_generator import ATTRIBUTE_VALUES
+
+LOCATIONS = ATTRIBUTE_VALUES["location"]
+
+INSTRUCTIONS = """You are an intelligent content recommendation engine analyzing user behavior. Predict which thumbnails the user will most likely click next, based on their viewing history.
+
+Look for CLEAR PATTERNS and CONTEXTUAL RELEVANCE:
+1. Location: prefer content from places the user already picked (e.g. Bangalore -> more Bangalore)
+2. Topic continuity: food -> restaurants, cafes, recipes, street food
+3. Category preferences: favor the categories the user keeps choosing
+4. Specific interests: topics in titles (e.g. "biryani", "iPhone review", "budget travel")
+5. Tag overlap between history and candidates
+6. Logical progression: "5 places to eat in Bangalore" -> "Best cafes in Bangalore"
+
+Choose content that feels like a natural, logical next step in their content journey."""
+
+RESPONSE_FORMAT = """RESPONSE FORMAT:
+First, provide your analysis (2-3 sentences) about the user's interests and why you picked these recommendations.
+Then, on a new line, provide ONLY the JSON array of {num} candidate handles, e.g. {example}"""
+
+# Ids first, so a streaming reader can act on them before the analysis arrives
+RESPONSE_FORMAT_IDS_FIRST = """RESPONSE FORMAT:
+First line: ONLY the JSON array of {num} candidate handles, e.g. {example}
+Then, on a new line, your analysis (2-3 sentences) about the user's interests and why you picked these recommendations."""
+
+# Several users in one request (see batching.py)
+RESPONSE_FORMAT_BATCH = """RESPONSE FORMAT:
+ONLY a JSON object mapping each user label to the JSON array of candidate handles picked for that user, e.g. {example}"""
+
+
+def estimate_tokens(text):
+    """Rough token estimate (about 4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+class PromptBuilder:
+    """
+    Builds recommendation prompts within an explicit token budget.
+
+    Each item's prompt fragment ("title" category #tags) is computed once
+    and cached by id. Candidates are listed under short ordinal handles
+    (c1, c2, ...) that the model answers with and that map back to ids.
+    Long histories keep the most recent items verbatim and fold the rest
+    into aggregated category/tag counts.
+
+    The instructions (and optionally a listing of the whole catalog under
+    stable row handles v0, v1, ...) never change between requests, so they
+    are kept apart from the per-user text and can be sent as a cacheable
+    prefix.
+    """
+
+    def __init__(self, token_budget=1500, history_window=8, catalog=None):
+        """
+        Args:
+            token_budget: Upper bound on the estimated prompt size in tokens
+            history_window: Number of most recent history items listed verbatim
+            catalog: Optional Catalog whose item fragments are precomputed
+        """
+        self.token_budget = token_budget
+        self.history_window = history_window
+        self.catalog = catalog
+        self._catalog_text = None
+        self._fragments = {}
+        self._lock = threading.Lock()
+        self._totals = {"requests": 0, "estimated_tokens": 0, "candidates_dropped": 0}
+        if catalog is not None:
+            for video in catalog:
+                self.fragment(video)
+
+    def fragment(self, video):
+        """Compact one-line description of a video, cached by id."""
+        fragment = self._fragments.get(video["id"])
+        if fragment is None:
+            tags = []
+            for tag in video["tags"][:3]:
+                if tag != video["category"] and tag not in tags:
+                    tags.append(tag)
+            fragment = f"\"{video['title']}\" {video['category']}"
+            if tags:
+                fragment += " " + " ".join("#" + tag for tag in tags)
+            self._fragments[video["id"]] = fragment
+        return fragment
+
+    def catalog_text(self):
+        """Stable listing of the whole catalog under row handles, built once."""
+        if self._catalog_text is None:
+            if self.catalog is None:
+                raise ValueError("PromptBuilder was created without a catalog")
+            lines = [f"v{row}: {self.fragment(video)}" for row, video in enumerate(self.catalog)]
+            self._catalog_text = (
+                "CATALOG (candidate handles v0, v1, ... refer to these entries):\n" + "\n".join(lines)
+            )
+        return self._catalog_text
+
+    def _history_text(self, user_history):
+        if not user_history:
+            return "No previous choices yet (this is the first round)."
+
+        recent = user_history[-self.history_window:] if self.history_window else user_history
+        older = user_history[:len(user_history) - len(recent)]
+
+        lines = []
+        if older:
+            categories = {}
+            tags = {}
+            places = {}
+            for video in older:
+                categories[video["category"]] = categories.get(video["category"], 0) + 1
+                for tag in set(video["tags"][:3]):
+                    if tag != video["category"]:
+                        tags[tag] = tags.get(tag, 0) + 1
+                # Integer-coded location (video_generator.ATTRIBUTE_SLOTS), not read from the title
+                code = video.get("attrs", {}).get("location")
+                if code is not None:
+                    places[code] = places.get(code, 0) + 1
+            top_tags = sorted(tags.items(), key=lambda x: x[1], reverse=True)[:8]
+            top_places = sorted(places.items(), key=lambda x: x[1], reverse=True)[:3]
+            lines.append(
+                f"Earlier choices ({len(older)}): "
+                + ", ".join(f"{cat} x{count}" for cat, count in categories.items())
+                + ("; tags: " + ", ".join(f"{tag} x{count}" for tag, count in top_tags) if top_tags else "")
+                + ("; places: " + ", ".join(f"{LOCATIONS[code]} x{count}" for code, count in top_places)
+                   if top_places else "")
+            )
+        start = len(older) + 1
+        for i, video in enumerate(recent, start):
+            lines.append(f"{i}. {self.fragment(video)}")
+        return "\n".join(lines)
+
+    def build_parts(self, user_history, candidate_videos, num_recommendations,
+                    fixed_text=INSTRUCTIONS, use_catalog=False, ids_first=False):
+        """
+        Build the per-request part of the prompt.
+
+        Candidates are assumed to be ordered best first; when the budget is
+        tight the tail of the list is dropped, but never below
+        ``num_recommendations`` candidates.
+
+        Args:
+            user_history: List of dicts with video metadata user has chosen
+            candidate_videos: List of candidate videos to choose from
+            num_recommendations: Number of recommendations to ask for
+            fixed_text: Text sent with every request, counted against the budget
+            use_catalog: Refer to catalog items by their catalog_text() handle
+                instead of describing them inline
+            ids_first: Ask for the JSON array before the analysis (for streaming)
+
+        Returns:
+            Tuple: (request_text, handles, stats) where handles maps each
+            handle to its video id
+        """
+        history_text = self._history_text(user_history)
+        prefix = "v" if use_catalog else "c"
+        example = "[" + ", ".join(f'"{prefix}{n}"' for n in range(1, num_recommendations + 1)) + "]"
+        response_format = (RESPONSE_FORMAT_IDS_FIRST if ids_first else RESPONSE_FORMAT).format(
+            num=num_recommendations, example=example
+        )
+
+        used = estimate_tokens(fixed_text) + estimate_tokens(history_text) + estimate_tokens(response_format) + 40
+        referenced = []
+        lines = []
+        handles = {}
+        for i, video in enumerate(candidate_videos, 1):
+            row = self.catalog.row_of(video["id"]) if use_catalog else None
+            if row is not None:
+                handle = entry = f"v{row}"
+            else:
+                handle = f"c{i}"
+                entry = f"{handle}: {self.fragment(video)}"
+            cost = estimate_tokens(entry) + 1
+            if used + cost > self.token_budget and len(handles) >= num_recommendations:
+                break
+            used += cost
+            if row is not None:
+                referenced.append(entry)
+            else:
+                lines.append(entry)
+            handles[handle] = video["id"]
+
+        if referenced:
+            lines.insert(0, ", ".join(referenced))
+        request_text = (
+            f"USER'S VIEWING HISTORY:\n{history_text}\n\n"
+            f"CANDIDATE THUMBNAILS ({len(handles)} available):\n" + "\n".join(lines) + "\n\n"
+            f"TASK:\nFrom these {len(handles)} candidates, select the {num_recommendations} that are "
+            f"MOST RELEVANT to the user's interests.\n\n{response_format}"
+        )
+
+        stats = {
+            "estimated_tokens": estimate_tokens(fixed_text) + estimate_tokens(request_text),
+            "candidates": len(handles),
+            "candidates_dropped": len(candidate_videos) - len(handles),
+            "history_items": len(user_history)
+        }
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["estimated_tokens"] += stats["estimated_tokens"]
+            self._totals["candidates_dropped"] += stats["candidates_dropped"]
+        return request_text, handles, stats
+
+    def build_batch(self, requests, fixed_text=INSTRUCTIONS, use_catalog=False):
+        """
+        Build the per-request part of a prompt covering several users.
+
+        Candidates are described once, in a section shared by every user;
+        each user section (labelled u1, u2, ...) has that user's history
+        and the handles they choose from. Every user gets the budget a
+        single request would have, charged for its history, its handle list
+        and the candidates it adds to the shared section, so candidates
+        that users have in common are paid for once.
+
+        Args:
+            requests: List of (user_history, candidate_videos, num_recommendations)
+            fixed_text: Text sent with every request, counted against each user's budget
+            use_catalog: Refer to catalog items by their catalog_text() handle
+
+        Returns:
+            Tuple: (request_text, handles, stats) where handles maps each
+            handle to its video id
+        """
+        user_budget = self.token_budget - estimate_tokens(fixed_text)
+        handles = {}
+        handle_of = {}
+        shared_lines = []
+        sections = []
+        dropped = 0
+        for label, (user_history, candidate_videos, num_recommendations) in enumerate(requests, 1):
+            history_text = self._history_text(user_history)
+            used = estimate_tokens(history_text) + 10
+            offered = []
+            for video in candidate_videos:
+                handle = handle_of.get(video["id"])
+                entry = None
+                if handle is None:
+                    row = self.catalog.row_of(video["id"]) if use_catalog else None
+                    if row is not None:
+                        handle = f"v{row}"
+                    else:
+                        handle = f"c{len(shared_lines) + 1}"
+                        entry = f"{handle}: {self.fragment(video)}"
+                cost = estimate_tokens(handle) + 1 + (estimate_tokens(entry) + 1 if entry else 0)
+                if used + cost > user_budget and len(offered) >= num_recommendations:
+                    break
+                used += cost
+                if handle not in handles:
+                    handles[handle] = video["id"]
+                    handle_of[video["id"]] = handle
+                    if entry:
+                        shared_lines.append(entry)
+                offered.append(handle)
+            dropped += len(candidate_videos) - len(offered)
+            sections.append(
+                f"USER u{label} (pick {num_recommendations}):\n{history_text}\n"
+                f"Candidates: {', '.join(offered)}"
+            )
+
+        prefix = "v" if use_catalog else "c"
+        example = "{" + ", ".join(
+            f'"u{label}": [' + ", ".join(f'"{prefix}{n}"' for n in picks) + "]"
+            for label, picks in ((1, (3, 1, 7)), (2, (2, 5, 4)))
+        ) + "}"
+        candidates_text = "\n".join(shared_lines) if shared_lines else "(see the catalog)"
+        request_text = (
+            f"CANDIDATE THUMBNAILS ({len(handles)}, shared by all users below):\n{candidates_text}\n\n"
+            + "\n\n".join(sections) + "\n\n"
+            f"TASK:\nFor each of the {len(requests)} users, select from that user's candidates the ones "
+            f"MOST RELEVANT to the user's viewing history, as many as the user's section asks for.\n\n"
+            + RESPONSE_FORMAT_BATCH.format(example=example)
+        )
+
+        stats = {
+            "estimated_tokens": estimate_tokens(fixed_text) + estimate_tokens(request_text),
+            "users": len(requests),
+            "candidates": len(handles),
+            "candidates_dropped": dropped,
+            "history_items": sum(len(history) for history, _, _ in requests)
+        }
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["estimated_tokens"] += stats["estimated_tokens"]
+            self._totals["candidates_dropped"] += stats["candidates_dropped"]
+        return request_text, handles, stats
+
+    def stats(self):
+        """Totals over every prompt built so far."""
+        with self._lock:
+            stats = dict(self._totals)
+        stats["avg_estimated_tokens"] = (
+            round(stats["estimated_tokens"] / stats["requests"], 1) if stats["requests"] else 0
+        )
+        return stats
@@ -0,0 +1,308 @@
+"""Vectorized local candidate ranker over the whole catalog."""
+import random
+
+import numpy as np
+
+from analytics import UserProfile
+from video_generator import ATTRIBUTE_VALUES, TITLE_MATCHER
+
+# Relative weight of each feature family in the profile vector
+FEATURE_WEIGHTS = {
+    "cat": 1.0,
+    "tag": 0.5,
+    "loc": 0.75,
+}
+
+# Number of strongest tag features kept in a profile vector
+MAX_PROFILE_TAGS = 24
+
+
+def item_features(video):
+    """Sparse feature names for one catalog item (category, tags, title locations)."""
+    features = {"cat:" + video.get("category", "")}
+    for tag in video.get("tags", []):
+        features.add("tag:" + tag)
+    attrs = video.get("attrs")
+    if attrs is not None:
+        if "location" in attrs:
+            features.add("loc:" + ATTRIBUTE_VALUES["location"][attrs["location"]])
+        return features
+    for code in TITLE_MATCHER.match(video).get("location", ()):
+        features.add("loc:" + ATTRIBUTE_VALUES["location"][code])
+    return features
+
+
+class CatalogRanker:
+    """
+    Scores every unused catalog item against a user profile in one pass.
+
+    The item x feature matrix is binary and very sparse (a handful of
+    features per item), and many items share exactly the same feature set,
+    e.g. every "food / biryani / Bangalore" video. Rows are therefore
+    deduplicated into feature signatures at load time and the matrix is
+    stored column-wise over signatures: for each feature, the array of
+    signatures that carry it. A profile vector only has a few non-zero
+    features, so the matrix-vector product reduces to adding each profile
+    weight onto its feature's signatures, and its cost depends on the
+    number of distinct signatures rather than on the catalog size.
+
+    Tags already carry the food type, location and product slots of the
+    generated titles, so they double as those features.
+    """
+
+    def __init__(self, catalog):
+        """Build the feature matrix for a catalog."""
+        self.catalog = catalog
+        self.feature_index = {}
+        signature_index = {}
+        members = []
+        sig_of_row = np.empty(len(catalog), dtype=np.int32)
+
+        for row, video in enumerate(catalog):
+            cols = []
+            for name in item_features(video):
+                col = self.feature_index.get(name)
+                if col is None:
+                    col = self.feature_index[name] = len(self.feature_index)
+                cols.append(col)
+            signature = tuple(sorted(cols))
+            sig = signature_index.get(signature)
+            if sig is None:
+                sig = signature_index[signature] = len(members)
+                members.append([])
+            members[sig].append(row)
+            sig_of_row[row] = sig
+        self.sig_of_row = sig_of_row
+
+        # Tiny popularity prior so ties break towards widely viewed items
+        views = np.fromiter((v.get("views", 0) for v in catalog), dtype=np.float64, count=len(catalog))
+        log_views = np.log1p(views)
+        peak = log_views.max() if len(log_views) else 0.0
+        self.prior = (1e-3 * log_views / peak if peak else log_views).astype(np.float32)
+
+        # Members of each signature, most popular first
+        self.members = [sorted(rows, key=lambda r: -self.prior[r]) for rows in members]
+
+        # CSC layout over signatures: signatures with feature j are
+        # indices[indptr[j]:indptr[j + 1]]
+        columns = [[] for _ in range(len(self.feature_index))]
+        for signature, sig in signature_index.items():
+            for col in signature:
+                columns[col].append(sig)
+        lengths = np.fromiter((len(c) for c in columns), dtype=np.int64, count=len(columns))
+        self.indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.indptr[1:])
+        self.indices = np.fromiter(
+            (sig for column in columns for sig in column),
+            dtype=np.int32, count=int(self.indptr[-1])
+        )
+
+    @property
+    def num_features(self):
+        return len(self.feature_index)
+
+    @property
+    def num_signatures(self):
+        return len(self.members)
+
+    def profile_vector(self, profile):
+        """
+        Sparse profile vector as (feature columns, weights).
+
+        Category, tag and location weights are the share of the user's
+        choices that carried them, scaled by FEATURE_WEIGHTS.
+        """
+        n = profile.num_videos
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        weighted = []
+        for category, count in profile.category_counts.items():
+            weighted.append(("cat:" + category, FEATURE_WEIGHTS["cat"] * count / n))
+        tags = sorted(profile.tag_counts.items(), key=lambda x: x[1], reverse=True)
+        for tag, count in tags[:MAX_PROFILE_TAGS]:
+            weighted.append(("tag:" + tag, FEATURE_WEIGHTS["tag"] * count / n))
+        for loc, count in profile.location_counts.items():
+            weighted.append(("loc:" + loc, FEATURE_WEIGHTS["loc"] * count / n))
+
+        cols, weights = [], []
+        for name, weight in weighted:
+            col = self.feature_index.get(name)
+            if col is not None:
+                cols.append(col)
+                weights.append(weight)
+        return np.asarray(cols, dtype=np.int64), np.asarray(weights, dtype=np.float32)
+
+    def signature_scores(self, profile):
+        """Sparse matrix-vector product: one score per feature signature."""
+        scores = np.zeros(len(self.members), dtype=np.float32)
+        cols, weights = self.profile_vector(profile)
+        indptr, indices = self.indptr, self.indices
+        for col, weight in zip(cols, weights):
+            # Signatures within one column are unique, so fancy-index add is exact
+            scores[indices[indptr[col]:indptr[col + 1]]] += weight
+        return scores
+
+    def score(self, profile, exclude=()):
+        """
+        Score every catalog row for a profile.
+
+        Args:
+            profile: UserProfile of the session
+            exclude: Collection of video ids to rule out (scored -inf)
+
+        Returns:
+            numpy array of scores, one per catalog row
+        """
+        scores = self.signature_scores(profile)[self.sig_of_row] + self.prior
+        excluded = [row for row in map(self.catalog.row_of, exclude) if row is not None]
+        if excluded:
+            scores[np.asarray(excluded, dtype=np.int64)] = -np.inf
+        return scores
+
+    def top_k(self, profile, k, exclude=(), category=None):
+        """
+        Return the ``k`` highest scoring unused videos, best first.
+
+        Walks signatures from best to worst and takes their most popular
+        unused members, so only about ``k`` rows are ever touched.
+
+        Args:
+            profile: UserProfile of the session
+            k: Number of videos to return
+            exclude: Collection of video ids already used
+            category: Only return videos from this category
+
+        Returns:
+            List of video dicts
+        """
+        excluded_rows = {row for row in map(self.catalog.row_of, exclude) if row is not None}
+        scores = self.signature_scores(profile)
+        items = self.catalog.items
+
+        found = []
+        for sig in np.argsort(-scores, kind="stable"):
+            members = self.members[sig]
+            # A signature holds one "cat:" feature, so its members share a category
+            if category is not None and (not members or items[members[0]]["category"] != category):
+                continue
+            for row in members:
+                if row not in excluded_rows:
+                    found.append(items[row])
+                    if len(found) >= k:
+                        return found
+        return found
+
+    def rank(self, profile, videos):
+        """Order a given list of videos by score against a profile, best first."""
+        scores = self.signature_scores(profile)
+        keyed = []
+        for position, video in enumerate(videos):
+            row = self.catalog.row_of(video["id"])
+            score = scores[self.sig_of_row[row]] + self.prior[row] if row is not None else -np.inf
+            keyed.append((-score, position, video))
+        keyed.sort(key=lambda x: (x[0], x[1]))
+        return [video for _, _, video in keyed]
+
+
+class LocalRecommender:
+    """Zero-LLM recommender with the same interface as VideoRecommender."""
+
+    def __init__(self, ranker):
+        self.ranker = ranker
+
+    def recommend(self, user_history, candidate_videos, num_recommendations=3):
+        """
+        Recommend videos from candidates by ranking them against the history.
+
+        Args:
+            user_history: List of dicts with video metadata user has chosen
+            candidate_videos: List of candidate videos to choose from
+            num_recommendations: Number of recommendations to return (default: 3)
+
+        Returns:
+            Tuple: (recommended_ids, analysis_text)
+        """
+        # Prompt-formatted history is trimmed; score on the full catalog entries
+        catalog = self.ranker.catalog
+        profile = UserProfile.from_history([catalog.get(v["id"]) or v for v in user_history])
+        ranked = self.ranker.rank(profile, candidate_videos)
+        recommended_ids = [v["id"] for v in ranked[:num_recommendations]]
+        return recommended_ids, self.explain(profile)
+
+    def explain(self, profile):
+        """Short explanation of what the ranking keyed on."""
+        top_categories = profile.top_categories()
+        if not top_categories:
+            return "Exploring your interests with a diverse selection."
+        category = top_categories[0][0]
+        frequent_tags = [tag for tag, count in profile.tag_counts.items() if count >= 2 and tag != category]
+        text = f"Based on your {profile.num_videos} choices, you seem to enjoy {category} content."
+        if frequent_tags:
+            text += f" Picking videos that share {', '.join(frequent_tags[:3])}."
+        return text
+
+
+class CategoryRecommender:
+    """
+    The quick category heuristic of the /round page, as a recommender.
+
+    Draws the picks at random from the ranker's 10 best unused videos plus
+    10 unused videos outside the favourite category, or from the whole
+    unused catalog before there is a favourite. Candidates are ignored.
+    """
+
+    def __init__(self, ranker, rng=None):
+        """
+        Args:
+            ranker: CatalogRanker over the catalog to draw from
+            rng: random.Random for the draws (default: the random module)
+        """
+        self.ranker = ranker
+        self.rng = rng or random
+
+    def pick(self, profile, used_set, num_recommendations=3):
+        """
+        Draw videos for a profile.
+
+        Args:
+            profile: UserProfile of the session
+            used_set: Set of video ids already chosen
+            num_recommendations: Number of videos to draw (default: 3)
+
+        Returns:
+            Tuple: (recommended_videos, analysis_text)
+        """
+        catalog = self.ranker.catalog
+        top_categories = profile.top_categories()
+        if not top_categories:
+            videos = catalog.sample(num_recommendations, exclude=used_set, rng=self.rng)
+            return videos, "Exploring your interests with a diverse selection."
+        preferred_category = top_categories[0][0]
+        # The best-ranked videos of the preferred category and diverse ones, 10 each
+        matching = self.ranker.top_k(profile, 10, exclude=used_set, category=preferred_category)
+        diverse = catalog.take(10, exclude=used_set, exclude_category=preferred_category)
+        candidates = matching + diverse
+        videos = self.rng.sample(candidates, min(num_recommendations, len(candidates)))
+        analysis_text = (
+            f"Based on your {profile.num_videos} choices, you seem to enjoy {preferred_category} content. "
+            f"I'm showing you more {preferred_category} videos with some variety."
+        )
+        return videos, analysis_text
+
+    def recommend(self, user_history, candidate_videos, num_recommendations=3):
+        """
+        Recommend videos like the /round page does, ignoring the candidates.
+
+        Args:
+            user_history: List of dicts with video metadata user has chosen
+            candidate_videos: Unused (the heuristic draws from the catalog)
+            num_recommendations: Number of recommendations to return (default: 3)
+
+        Returns:
+            Tuple: (recommended_ids, analysis_text)
+        """
+        catalog = self.ranker.catalog
+        profile = UserProfile.from_history([catalog.get(v["id"]) or v for v in user_history])
+        videos, analysis_text = self.pick(profile, {v["id"] for v in user_history}, num_recommendations)
+        return [v["id"] for v in videos], analysis_text
@@ -0,0 +1,175 @@
+"""Cache of LLM recommendation results keyed by history and candidate set."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(history_ids, candidate_ids, num_recommendations, history_window=0):
+    """
+    Canonical hash of a recommendation request.
+
+    Args:
+        history_ids: Chosen video ids, oldest first (order matters)
+        candidate_ids: Candidate video ids (order does not matter)
+        num_recommendations: Number of recommendations asked for
+        history_window: Only key on the most recent N history ids (0 = all)
+
+    Returns:
+        str: Hex digest
+    """
+    history = list(history_ids)
+    if history_window:
+        history = history[-history_window:]
+    payload = json.dumps(
+        [history, sorted(candidate_ids), num_recommendations], separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class RecommendationCache:
+    """
+    Bounded LRU + TTL cache in front of the LLM call.
+
+    The memory tier is per process. The optional disk tier is a SQLite file,
+    so entries survive restarts and are shared by gunicorn workers on the
+    same host. Each entry remembers the latency and tokens of the call that
+    produced it, so hits can be reported as time and spend saved.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, disk_path=None, history_window=0, purge_interval=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.history_window = history_window
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "saved_seconds": 0.0,
+            "saved_input_tokens": 0,
+            "saved_output_tokens": 0,
+        }
+
+        if disk_path:
+            conn = self._connection()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS recommendations ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS recommendations_expires ON recommendations (expires)")
+
+    def key(self, history_ids, candidate_ids, num_recommendations):
+        """Cache key for a request, honouring the configured history window."""
+        return cache_key(history_ids, candidate_ids, num_recommendations, self.history_window)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """
+        Look up a cached result.
+
+        Returns:
+            dict: The cached value ({"ids", "analysis", ...}), or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._record_hit(entry[1], "memory_hits")
+                    return entry[1]
+                del self._memory[key]
+                self._counters["expirations"] += 1
+
+        if self.disk_path:
+            row = self._connection().execute(
+                "SELECT value, expires FROM recommendations WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._store_locked(key, value, row[1])
+                    self._record_hit(value, "disk_hits")
+                return value
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        """Store a result in memory and, if configured, on disk."""
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            self._store_locked(key, value, expires)
+        if self.disk_path:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO recommendations (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value, separators=(",", ":")), expires),
+            )
+            # Expired rows are never served (get() checks expires), so purging can wait
+            if now - self._last_purge > self.purge_interval:
+                self._last_purge = now
+                conn.execute("DELETE FROM recommendations WHERE expires < ?", (now,))
+
+    def _store_locked(self, key, value, expires):
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _record_hit(self, value, tier):
+        self._counters["hits"] += 1
+        self._counters[tier] += 1
+        self._counters["saved_seconds"] += value.get("latency", 0.0)
+        self._counters["saved_input_tokens"] += value.get("input_tokens", 0)
+        self._counters["saved_output_tokens"] += value.get("output_tokens", 0)
+
+    def stats(self):
+        """Counters plus entry count and hit rate."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._memory)
+        stats["saved_seconds"] = round(stats["saved_seconds"], 3)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+def create_cache():
+    """
+    Build the recommendation cache from environment configuration.
+
+    Returns:
+        RecommendationCache, or None when REC_CACHE_ENABLED is off
+    """
+    if os.getenv("REC_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return RecommendationCache(
+        max_entries=int(os.getenv("REC_CACHE_SIZE", 1024)),
+        ttl=float(os.getenv("REC_CACHE_TTL", 3600)),
+        disk_path=os.getenv("REC_CACHE_PATH") or None,
+        history_window=int(os.getenv("REC_CACHE_HISTORY_WINDOW", 0)),
+    )
@@ -1,18 +1,258 @@
 """Claude-powered video recommendation engine."""
+import asyncio
 import json
 import os
-from anthropic import Anthropic
+import random
+import threading
+import time
+from anthropic import DEFAULT_MAX_RETRIES, Anthropic, AsyncAnthropic
+from prompt_builder import INSTRUCTIONS, PromptBuilder
+from recommendation_cache import cache_key as request_key
+from stream_parser import StreamingAnswerParser, parse_batch_answer
+
+MODEL = "claude-3-5-sonnet-20241022"  # Latest working Claude 3.5
+MAX_TOKENS = 512  # Reduced for speed
+
+# With ids-first answers, generation can stop where the JSON array closes
+IDS_STOP_SEQUENCE = "]"
+
+
+def _sdk_retries(guard):
+    """
+    Retries the Anthropic client makes on its own.
+
+    Zero when the guard retries or hedges failed attempts: SDK retries on
+    top would multiply the calls and run past the guard's deadline.
+    """
+    if guard is not None and (guard.max_hedges or guard.retries):
+        return 0
+    return DEFAULT_MAX_RETRIES
+
+
+class _OpenedStream:
+    """A response stream that has been read up to the point where the ids are known."""
+
+    def __init__(self, manager, parser):
+        self.manager = manager
+        self.parser = parser
+        self.stream = manager.__enter__()
+        self.chunks = iter(self.stream.text_stream)
+        self.first_analysis = ""
+
+    def read_ids(self):
+        for text in self.chunks:
+            delta = self.parser.feed(text)
+            if self.parser.ids is not None:
+                self.first_analysis = delta
+                return self
+        self.parser.close()
+        return self
+
+    def analysis_chunks(self):
+        """The rest of the answer, as analysis text deltas."""
+        if self.first_analysis:
+            yield self.first_analysis
+        for text in self.chunks:
+            delta = self.parser.feed(text)
+            if delta:
+                yield delta
+
+    @property
+    def usage(self):
+        return self.stream.current_message_snapshot.usage
+
+    def close(self):
+        """Close the response; the provider stops generating."""
+        self.manager.__exit__(None, None, None)
+
+
+class _AsyncOpenedStream(_OpenedStream):
+    """Async version of _OpenedStream; create it with ``await _AsyncOpenedStream.open()``."""
+
+    def __init__(self, manager, parser, stream):
+        self.manager = manager
+        self.parser = parser
+        self.stream = stream
+        self.chunks = stream.text_stream.__aiter__()
+        self.first_analysis = ""
+
+    @classmethod
+    async def open(cls, manager, parser):
+        return cls(manager, parser, await manager.__aenter__())
+
+    async def read_ids(self):
+        async for text in self.chunks:
+            delta = self.parser.feed(text)
+            if self.parser.ids is not None:
+                self.first_analysis = delta
+                return self
+        self.parser.close()
+        return self
+
+    async def analysis_chunks(self):
+        if self.first_analysis:
+            yield self.first_analysis
+        async for text in self.chunks:
+            delta = self.parser.feed(text)
+            if delta:
+                yield delta
+
+    async def close(self):
+        await self.manager.__aexit__(None, None, None)
 
 
 class VideoRecommender:
     """Uses Claude API to recommend videos based on user history."""
 
-    def __init__(self, api_key=None):
-        """Initialize the recommender with API key."""
-        self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
-        if not self.api_key:
-            raise ValueError("ANTHROPIC_API_KEY not found in environment")
-        self.client = Anthropic(api_key=self.api_key)
+    def __init__(self, api_key=None, cache=None, prompt_builder=None, client=None, cache_catalog=False,
+                 guard=None, fallback=None, stream_ids=False, singleflight=None, metrics=None):
+        """
+        Initialize the recommender with API key.
+
+        Args:
+            api_key: Anthropic API key (defaults to ANTHROPIC_API_KEY)
+            cache: Optional RecommendationCache consulted before calling Claude
+            prompt_builder: PromptBuilder to use (defaults to a fresh one)
+            client: Preconfigured client (e.g. fake_llm.FakeAnthropic); the
+                API key is only required when this is not given
+            cache_catalog: Send the prompt builder's catalog listing as part of
+                the cached system prefix and refer to candidates by handle
+            guard: Optional llm_guard.LLMGuard enforcing a deadline, hedging
+                and a circuit breaker around the API call
+            fallback: Recommender used when Claude times out, fails or gives
+                too few valid ids (e.g. ranker.LocalRecommender); random
+                candidates are used when it is not given
+            stream_ids: Have recommend() stream an ids-first answer and stop
+                generating once the ids are known; no analysis text is
+                returned (None), so callers supply their own
+            singleflight: Optional singleflight.SingleFlight; concurrent
+                recommend() calls for the same request share one API call
+            metrics: Optional metrics.Metrics receiving the prompt, llm and
+                parse stage timings and the call, fallback and cache counters
+        """
+        if client is None:
+            self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
+            if not self.api_key:
+                raise ValueError("ANTHROPIC_API_KEY not found in environment")
+            client = Anthropic(api_key=self.api_key, max_retries=_sdk_retries(guard))
+        self.client = client
+        self.cache = cache
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        self.cache_catalog = cache_catalog
+        self.guard = guard
+        self.fallback = fallback
+        self.stream_ids = stream_ids
+        self.singleflight = singleflight
+        self.metrics = metrics
+        self.last_prompt_stats = None
+        self._usage_lock = threading.Lock()
+        self._usage = {
+            "calls": 0,
+            "input_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "output_tokens": 0,
+        }
+
+    def _system_blocks(self):
+        """
+        Stable system prompt, marked as a cacheable prefix.
+
+        The breakpoint sits on the last block, so the instructions and (when
+        enabled) the catalog listing are cached together. The per-user part
+        goes in the user message after it.
+        """
+        blocks = [{"type": "text", "text": INSTRUCTIONS}]
+        if self.cache_catalog:
+            blocks.append({"type": "text", "text": self.prompt_builder.catalog_text()})
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+        return blocks
+
+    def _observe(self, stage, seconds):
+        if self.metrics is not None:
+            self.metrics.observe(stage, seconds)
+
+    def _count(self, name, **labels):
+        if self.metrics is not None:
+            self.metrics.inc(name, **labels)
+
+    def _fallback_ids(self, user_history, candidate_videos, count):
+        """Pick ``count`` candidates without Claude."""
+        if self.fallback is not None:
+            return self.fallback.recommend(user_history, candidate_videos, count)[0]
+        return [v["id"] for v in random.sample(candidate_videos, count)]
+
+    def _request(self, system, request_text, **options):
+        """Keyword arguments of one Messages API call."""
+        return dict(
+            model=MODEL,
+            max_tokens=MAX_TOKENS,
+            system=system,
+            messages=[
+                {"role": "user", "content": request_text}
+            ],
+            **options
+        )
+
+    def _create_message(self, system, request_text):
+        """Call the Messages API, under the guard's deadline when one is set."""
+        def create(**options):
+            return self.client.messages.create(**self._request(system, request_text, **options))
+
+        if self.guard is None:
+            return create()
+        # The SDK timeout bounds the background attempt the guard gave up on
+        return self.guard.call(lambda: create(timeout=self.guard.timeout))
+
+    def _open_stream(self, system, request_text, parser_args, analysis):
+        """
+        Start a streamed answer and read it until the ids are known.
+
+        Under the guard, the deadline covers the time to the ids; hedged
+        attempts that lose are closed.
+        """
+        options = {} if analysis else {"stop_sequences": [IDS_STOP_SEQUENCE]}
+
+        def open_until_ids(**timeout):
+            manager = self.client.messages.stream(**self._request(system, request_text, **options, **timeout))
+            opened = _OpenedStream(manager, StreamingAnswerParser(*parser_args))
+            try:
+                return opened.read_ids()
+            except BaseException:
+                opened.close()
+                raise
+
+        if self.guard is None:
+            return open_until_ids()
+        return self.guard.call(lambda: open_until_ids(timeout=self.guard.timeout), discard=_OpenedStream.close)
+
+    def _record_usage(self, usage):
+        """Add one response's token usage (cached and uncached input) to the totals."""
+        counts = {
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        }
+        with self._usage_lock:
+            self._usage["calls"] += 1
+            for name, count in counts.items():
+                self._usage[name] += count
+        self._count("llm_calls_total", outcome="ok")
+        return counts
+
+    def usage_stats(self):
+        """Token usage totals, with the share of input tokens read from the prompt cache."""
+        with self._usage_lock:
+            stats = dict(self._usage)
+        total_input = (
+            stats["input_tokens"] + stats["cache_read_input_tokens"] + stats["cache_creation_input_tokens"]
+        )
+        stats["total_input_tokens"] = total_input
+        stats["cached_input_ratio"] = (
+            round(stats["cache_read_input_tokens"] / total_input, 3) if total_input else 0.0
+        )
+        return stats
 
     def recommend(self, user_history, candidate_videos, num_recommendations=3):
         """
@@ -26,119 +266,405 @@ class VideoRecommender:
         Returns:
             Tuple: (recommended_ids, analysis_text)
         """
-        prompt = self._build_prompt(user_history, candidate_videos, num_recommendations)
+        cache_key, cached = self._check_cache(user_history, candidate_videos, num_recommendations)
+        if cached is not None:
+            return list(cached["ids"]), cached["analysis"]
 
+        if self.singleflight is None:
+            return self._recommend_uncached(user_history, candidate_videos, num_recommendations, cache_key)
+        recommended_ids, analysis_text = self.singleflight.do(
+            self._flight_key(cache_key, user_history, candidate_videos, num_recommendations),
+            lambda: self._recommend_uncached(user_history, candidate_videos, num_recommendations, cache_key)
+        )
+        # Coalesced callers share the leader's result, so each gets its own list
+        return list(recommended_ids), analysis_text
+
+    def _recommend_uncached(self, user_history, candidate_videos, num_recommendations, cache_key):
+        """One Claude call for recommend(), after a cache miss."""
+        if self.stream_ids:
+            events = list(self._stream_uncached(
+                user_history, candidate_videos, num_recommendations, cache_key, analysis=False
+            ))
+            return events[0][1], None
+
+        system, request_text, handles = self._prepare(user_history, candidate_videos, num_recommendations)
         try:
-            message = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",  # Latest working Claude 3.5
-                max_tokens=512,  # Reduced for speed
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+            start = time.perf_counter()
+            message = self._create_message(system, request_text)
+            latency = time.perf_counter() - start
+            self._observe("llm", latency)
+            return self._finish(
+                message, latency, handles, cache_key, user_history, candidate_videos, num_recommendations
             )
 
-            # Extract the response text
-            response_text = message.content[0].text
-
-            # Try to extract JSON and analysis
-            analysis_text = None
-            recommended_ids = []
-
-            # Look for JSON array in response
-            import re
-            json_match = re.search(r'\[[\s\S]*?\]', response_text)
-            if json_match:
-                recommended_ids = json.loads(json_match.group())
-                # Everything before JSON is analysis
-                analysis_text = response_text[:json_match.start()].strip()
-                if not analysis_text:
-                    # Everything after JSON might be analysis
-                    analysis_text = response_text[json_match.end():].strip()
-
-            # Validate recommendations
-            candidate_ids = {v["id"] for v in candidate_videos}
-            valid_recommendations = [
-                vid_id for vid_id in recommended_ids
-                if vid_id in candidate_ids
-            ][:num_recommendations]
-
-            # If we didn't get enough valid recommendations, fill with random candidates
-            if len(valid_recommendations) < num_recommendations:
-                remaining_candidates = [
-                    v["id"] for v in candidate_videos
-                    if v["id"] not in valid_recommendations
-                ]
-                import random
-                additional = random.sample(
-                    remaining_candidates,
-                    num_recommendations - len(valid_recommendations)
-                )
-                valid_recommendations.extend(additional)
+        except Exception as e:
+            return self._on_error(e, user_history, candidate_videos, num_recommendations)
+
+    def lookup(self, user_history, candidate_videos, num_recommendations=3):
+        """
+        Cache lookup for callers that send the request to Claude later (see batching.py).
+
+        Args:
+            user_history: List of dicts with video metadata user has chosen
+            candidate_videos: List of candidate videos to choose from
+            num_recommendations: Number of recommendations to return (default: 3)
 
-            return valid_recommendations, analysis_text
+        Returns:
+            Tuple: (cache_key, request_key, cached), where cache_key goes to
+            recommend_batch(), request_key is shared by identical requests,
+            and cached is the cached answer dict or None
+        """
+        cache_key, cached = self._check_cache(user_history, candidate_videos, num_recommendations)
+        return cache_key, self._flight_key(cache_key, user_history, candidate_videos, num_recommendations), cached
 
+    def recommend_batch(self, requests, cache_keys=None):
+        """
+        Answer several distinct requests with one Claude call.
+
+        The prompt has one shared candidate section and a history section
+        per request (PromptBuilder.build_batch) and asks for a JSON object
+        of handles per user. Requests missing from the answer, or short of
+        picks, are filled from the fallback. Answers carry no analysis text.
+
+        Args:
+            requests: List of (user_history, candidate_videos, num_recommendations)
+            cache_keys: Cache key per request from lookup(), to store the answers under
+
+        Returns:
+            Tuple: (results, missing), one (recommended_ids, None) per
+            request and the number of requests missing from the answer
+        """
+        cache_keys = cache_keys or [None] * len(requests)
+        request_text, handles, prompt_stats = self.prompt_builder.build_batch(
+            requests, use_catalog=self.cache_catalog
+        )
+        self.last_prompt_stats = prompt_stats
+        try:
+            start = time.perf_counter()
+            message = self._create_message(self._system_blocks(), request_text)
+            latency = time.perf_counter() - start
         except Exception as e:
-            print(f"Error in Claude API call: {e}")
-            # Fallback: return random videos
-            import random
-            return [v["id"] for v in random.sample(candidate_videos, num_recommendations)], None
-
-    def _build_prompt(self, user_history, candidate_videos, num_recommendations):
-        """Build the prompt for Claude API."""
-
-        # Format user history
-        if not user_history:
-            history_text = "No previous choices yet (this is the first round)."
-        else:
-            history_items = []
-            for i, video in enumerate(user_history, 1):
-                history_items.append(
-                    f"{i}. \"{video['title']}\" (Category: {video['category']}, Tags: {', '.join(video['tags'][:3])})"
-                )
-            history_text = "\n".join(history_items)
-
-        # Format candidate videos
-        candidate_items = []
-        for video in candidate_videos:
-            candidate_items.append(
-                f"- ID: {video['id']} | Title: \"{video['title']}\" | "
-                f"Category: {video['category']} | Tags: {', '.join(video['tags'][:3])}"
+            return [self._on_error(e, *request) for request in requests], 0
+
+        usage = self._record_usage(message.usage)
+        # Each cached entry is charged an equal share of the call
+        share = {name: count // len(requests) for name, count in usage.items()}
+        answers = parse_batch_answer(message.content[0].text)
+
+        results, missing = [], 0
+        for label, (request, cache_key) in enumerate(zip(requests, cache_keys), 1):
+            user_history, candidate_videos, num_recommendations = request
+            picks = answers.get(f"u{label}")
+            if picks is None:
+                missing += 1
+                picks = []
+            parser = StreamingAnswerParser(handles, {v["id"] for v in candidate_videos}, num_recommendations)
+            parser.feed(json.dumps(picks))
+            recommended_ids = parser.close()
+            self._store(cache_key, recommended_ids, None, share, latency, num_recommendations)
+            results.append(
+                (self._fill(list(recommended_ids), user_history, candidate_videos, num_recommendations), None)
             )
-        candidates_text = "\n".join(candidate_items)
+        return results, missing
 
-        prompt = f"""You are an intelligent content recommendation engine analyzing user behavior. Your goal is to predict which thumbnails a user will most likely click based on their viewing history.
+    def recommend_stream(self, user_history, candidate_videos, num_recommendations=3, analysis=True):
+        """
+        Recommend videos, yielding the ids as soon as they are known.
 
-USER'S VIEWING HISTORY:
-{history_text}
+        The prompt asks for the ids before the analysis and the answer is
+        parsed as it streams in, so the ids are yielded the moment the JSON
+        array closes, while Claude is still writing the analysis. With
+        ``analysis=False`` generation stops at the end of the array.
 
-CANDIDATE THUMBNAILS (100 available):
-{candidates_text}
+        Args:
+            user_history: List of dicts with video metadata user has chosen
+            candidate_videos: List of candidate videos to choose from
+            num_recommendations: Number of recommendations to return (default: 3)
+            analysis: Also stream the analysis text after the ids
 
-TASK:
-From these 100 pre-generated thumbnails, select the {num_recommendations} that are MOST RELEVANT to the user's interests. Look for CLEAR PATTERNS and CONTEXTUAL RELEVANCE to maximize engagement.
+        Yields:
+            ("ids", recommended_ids) once, then ("analysis", text) chunks
+        """
+        cache_key, cached = self._check_cache(user_history, candidate_videos, num_recommendations)
+        if cached is not None:
+            yield "ids", list(cached["ids"])
+            if analysis and cached["analysis"]:
+                yield "analysis", cached["analysis"]
+            return
+        yield from self._stream_uncached(user_history, candidate_videos, num_recommendations, cache_key, analysis)
 
-CRITICAL ANALYSIS POINTS:
-1. **Location Patterns**: If user chose content about "Bangalore" or "Mumbai", prioritize other content from the same location
-2. **Topic Continuity**: If user chose "food" content, they're likely interested in more food content (restaurants, cafes, recipes, etc.)
-3. **Category Preferences**: If user picked "tech" or "travel", favor similar categories
-4. **Specific Interests**: Extract specific topics from titles (e.g., "biryani", "iPhone review", "budget travel")
-5. **Tag Overlap**: Match tags between history and candidates
-6. **Logical Progression**: Pick content that naturally extends their interests (e.g., "5 places to eat in Bangalore" → "Best cafes in Bangalore" or "Street food in Bangalore")
+    def _stream_uncached(self, user_history, candidate_videos, num_recommendations, cache_key, analysis):
+        """The events of recommend_stream() after a cache miss."""
+        system, request_text, handles = self._prepare(
+            user_history, candidate_videos, num_recommendations, ids_first=True
+        )
+        parser_args = (handles, {v["id"] for v in candidate_videos}, num_recommendations)
+        start = time.perf_counter()
+        try:
+            opened = self._open_stream(system, request_text, parser_args, analysis)
+        except Exception as e:
+            recommended_ids, analysis_text = self._on_error(e, user_history, candidate_videos, num_recommendations)
+            yield "ids", recommended_ids
+            if analysis and analysis_text:
+                yield "analysis", analysis_text
+            return
 
-EXAMPLES OF GOOD RECOMMENDATIONS:
-- User picked "5 places to eat in Bangalore" → Recommend "Best cafes in Bangalore" or "Street food tour in Bangalore"
-- User picked "iPhone review" → Recommend "Top 5 iPhone accessories" or "iPhone vs Android"
-- User picked "Budget trip to Goa" → Recommend "Hidden gems in Goa" or "Things to do in Goa"
+        # Time to the ids; the analysis streams on after the response went out
+        self._observe("llm", time.perf_counter() - start)
+        parser = opened.parser
+        complete = False
+        try:
+            yield "ids", self._fill(list(parser.ids), user_history, candidate_videos, num_recommendations)
+            if analysis:
+                try:
+                    for delta in opened.analysis_chunks():
+                        yield "analysis", delta
+                except Exception as e:
+                    print(f"Error while streaming Claude's analysis: {e!r}")
+            complete = True
+        finally:
+            # Stops the generation when the reader is done early
+            opened.close()
+            usage = self._record_usage(opened.usage)
+        if complete:
+            self._store(
+                cache_key, parser.ids, parser.analysis, usage, time.perf_counter() - start, num_recommendations
+            )
+
+    def _check_cache(self, user_history, candidate_videos, num_recommendations):
+        """Returns (cache_key, cached_value); both None without a cache."""
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.key(
+            [v["id"] for v in user_history],
+            [v["id"] for v in candidate_videos],
+            num_recommendations
+        )
+        cached = self.cache.get(cache_key)
+        self._count("cache_lookups_total", result="miss" if cached is None else "hit")
+        return cache_key, cached
+
+    def _flight_key(self, cache_key, user_history, candidate_videos, num_recommendations):
+        """Canonical key under which identical concurrent requests are coalesced."""
+        if cache_key is not None:
+            return cache_key
+        return request_key(
+            [v["id"] for v in user_history],
+            [v["id"] for v in candidate_videos],
+            num_recommendations
+        )
+
+    def _prepare(self, user_history, candidate_videos, num_recommendations, ids_first=False):
+        """Returns (system_blocks, request_text, handles) for one API call."""
+        start = time.perf_counter()
+        system = self._system_blocks()
+        # The budget covers the instructions and the per-user part; the
+        # catalog listing is a fixed, cached cost outside of it
+        request_text, handles, prompt_stats = self.prompt_builder.build_parts(
+            user_history, candidate_videos, num_recommendations,
+            use_catalog=self.cache_catalog, ids_first=ids_first
+        )
+        self.last_prompt_stats = prompt_stats
+        self._observe("prompt", time.perf_counter() - start)
+        return system, request_text, handles
+
+    def _finish(self, message, latency, handles, cache_key, user_history, candidate_videos, num_recommendations):
+        """Parse and validate Claude's answer, cache it and fill any missing slots."""
+        usage = self._record_usage(message.usage)
+
+        # Map candidate handles (c1, c2, ...) back to valid video ids
+        start = time.perf_counter()
+        parser = StreamingAnswerParser(handles, {v["id"] for v in candidate_videos}, num_recommendations)
+        parser.feed(message.content[0].text)
+        recommended_ids = parser.close()
+        self._observe("parse", time.perf_counter() - start)
 
-Choose content that feels like a natural, logical next step in their content journey.
+        self._store(cache_key, recommended_ids, parser.analysis, usage, latency, num_recommendations)
+        return self._fill(list(recommended_ids), user_history, candidate_videos, num_recommendations), parser.analysis
 
-RESPONSE FORMAT:
-First, provide your analysis (2-3 sentences) about the user's interests and why you picked these recommendations.
-Then, on a new line, provide ONLY the JSON array of {num_recommendations} video IDs.
+    def _store(self, cache_key, recommended_ids, analysis_text, usage, latency, num_recommendations):
+        """Cache a complete answer from Claude (not fill-ins)."""
+        if cache_key is not None and len(recommended_ids) == num_recommendations:
+            self.cache.set(cache_key, {
+                "ids": recommended_ids,
+                "analysis": analysis_text,
+                "latency": latency,
+                "input_tokens": (
+                    usage["input_tokens"] + usage["cache_read_input_tokens"]
+                    + usage["cache_creation_input_tokens"]
+                ),
+                "output_tokens": usage["output_tokens"]
+            })
 
-Example:
-The user shows strong interest in food content, particularly in Bangalore. I'm recommending related food spots in the same city and expanding to cafes and street food based on their previous restaurant choices.
+    def _fill(self, recommended_ids, user_history, candidate_videos, num_recommendations):
+        """If we didn't get enough valid recommendations, fill from the fallback."""
+        if len(recommended_ids) < num_recommendations:
+            self._count("fallbacks_total", reason="incomplete")
+            remaining_candidates = [
+                v for v in candidate_videos
+                if v["id"] not in recommended_ids
+            ]
+            recommended_ids.extend(self._fallback_ids(
+                user_history, remaining_candidates,
+                num_recommendations - len(recommended_ids)
+            ))
+        return recommended_ids
 
-["video_id_1", "video_id_2", "video_id_3"]"""
+    def _on_error(self, error, user_history, candidate_videos, num_recommendations):
+        print(f"Error in Claude API call: {error!r}")
+        self._count("llm_calls_total", outcome="error")
+        self._count("fallbacks_total", reason="llm_error")
+        # Fallback: local ranking (or random videos without a fallback recommender)
+        if self.fallback is not None:
+            return self.fallback.recommend(user_history, candidate_videos, num_recommendations)
+        return self._fallback_ids(user_history, candidate_videos, num_recommendations), None
+
+
+class AsyncVideoRecommender(VideoRecommender):
+    """
+    VideoRecommender for the async serving path (see async_app.py).
+
+    Uses AsyncAnthropic, whose pooled HTTP connections are shared by every
+    request of the process, so waiting on Claude does not tie up a thread.
+    Prompting, parsing, caching and fallbacks are the same as the sync class.
+    """
+
+    def __init__(self, api_key=None, client=None, **kwargs):
+        """
+        Args:
+            api_key: Anthropic API key (defaults to ANTHROPIC_API_KEY)
+            client: Preconfigured async client (e.g. fake_llm.FakeAsyncAnthropic)
+            **kwargs: As for VideoRecommender
+        """
+        if client is None:
+            api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
+            if not api_key:
+                raise ValueError("ANTHROPIC_API_KEY not found in environment")
+            client = AsyncAnthropic(api_key=api_key, max_retries=_sdk_retries(kwargs.get("guard")))
+        super().__init__(api_key=api_key, client=client, **kwargs)
 
-        return prompt
+    async def _create_message(self, system, request_text):
+        """Call the Messages API, under the guard's deadline when one is set."""
+        async def create(**options):
+            return await self.client.messages.create(**self._request(system, request_text, **options))
+
+        if self.guard is None:
+            return await create()
+        return await self.guard.call_async(lambda: create(timeout=self.guard.timeout))
+
+    async def _open_stream(self, system, request_text, parser_args, analysis):
+        """Async version of VideoRecommender._open_stream."""
+        options = {} if analysis else {"stop_sequences": [IDS_STOP_SEQUENCE]}
+
+        async def open_until_ids(**timeout):
+            manager = self.client.messages.stream(**self._request(system, request_text, **options, **timeout))
+            opened = await _AsyncOpenedStream.open(manager, StreamingAnswerParser(*parser_args))
+            try:
+                return await opened.read_ids()
+            except BaseException:
+                await opened.close()
+                raise
+
+        if self.guard is None:
+            return await open_until_ids()
+        return await self.guard.call_async(
+            lambda: open_until_ids(timeout=self.guard.timeout),
+            discard=lambda opened: asyncio.ensure_future(opened.close())
+        )
+
+    async def recommend(self, user_history, candidate_videos, num_recommendations=3):
+        """
+        Async version of VideoRecommender.recommend.
+
+        Returns:
+            Tuple: (recommended_ids, analysis_text)
+        """
+        cache_key, cached = self._check_cache(user_history, candidate_videos, num_recommendations)
+        if cached is not None:
+            return list(cached["ids"]), cached["analysis"]
+
+        if self.singleflight is None:
+            return await self._recommend_uncached(user_history, candidate_videos, num_recommendations, cache_key)
+        recommended_ids, analysis_text = await self.singleflight.do_async(
+            self._flight_key(cache_key, user_history, candidate_videos, num_recommendations),
+            lambda: self._recommend_uncached(user_history, candidate_videos, num_recommendations, cache_key)
+        )
+        return list(recommended_ids), analysis_text
+
+    async def _recommend_uncached(self, user_history, candidate_videos, num_recommendations, cache_key):
+        """Async version of VideoRecommender._recommend_uncached."""
+        if self.stream_ids:
+            events = [
+                event async for event in self._stream_uncached(
+                    user_history, candidate_videos, num_recommendations, cache_key, analysis=False
+                )
+            ]
+            return events[0][1], None
+
+        system, request_text, handles = self._prepare(user_history, candidate_videos, num_recommendations)
+        try:
+            start = time.perf_counter()
+            message = await self._create_message(system, request_text)
+            latency = time.perf_counter() - start
+            self._observe("llm", latency)
+            return self._finish(
+                message, latency, handles, cache_key, user_history, candidate_videos, num_recommendations
+            )
+
+        except Exception as e:
+            return self._on_error(e, user_history, candidate_videos, num_recommendations)
+
+    async def recommend_stream(self, user_history, candidate_videos, num_recommendations=3, analysis=True):
+        """
+        Async version of VideoRecommender.recommend_stream.
+
+        Yields:
+            ("ids", recommended_ids) once, then ("analysis", text) chunks
+        """
+        cache_key, cached = self._check_cache(user_history, candidate_videos, num_recommendations)
+        if cached is not None:
+            yield "ids", list(cached["ids"])
+            if analysis and cached["analysis"]:
+                yield "analysis", cached["analysis"]
+            return
+        async for event in self._stream_uncached(
+            user_history, candidate_videos, num_recommendations, cache_key, analysis
+        ):
+            yield event
+
+    async def _stream_uncached(self, user_history, candidate_videos, num_recommendations, cache_key, analysis):
+        """Async version of VideoRecommender._stream_uncached."""
+        system, request_text, handles = self._prepare(
+            user_history, candidate_videos, num_recommendations, ids_first=True
+        )
+        parser_args = (handles, {v["id"] for v in candidate_videos}, num_recommendations)
+        start = time.perf_counter()
+        try:
+            opened = await self._open_stream(system, request_text, parser_args, analysis)
+        except Exception as e:
+            recommended_ids, analysis_text = self._on_error(e, user_history, candidate_videos, num_recommendations)
+            yield "ids", recommended_ids
+            if analysis and analysis_text:
+                yield "analysis", analysis_text
+            return
+
+        # Time to the ids; the analysis streams on after the response went out
+        self._observe("llm", time.perf_counter() - start)
+        parser = opened.parser
+        complete = False
+        try:
+            yield "ids", self._fill(list(parser.ids), user_history, candidate_videos, num_recommendations)
+            if analysis:
+                try:
+                    async for delta in opened.analysis_chunks():
+                        yield "analysis", delta
+                except Exception as e:
+                    print(f"Error while streaming Claude's analysis: {e!r}")
+            complete = True
+        finally:
+            await opened.close()
+            usage = self._record_usage(opened.usage)
+        if complete:
+            self._store(
+                cache_key, parser.ids, parser.analysis, usage, time.perf_counter() - start, num_recommendations
+            )
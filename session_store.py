@@ -0,0 +1,230 @@
+"""Server-side session storage for the Flask app.
+
+The browser only carries a signed session id; the session payload (item ids
+and small counters) lives in a backend on the server. Two backends are
+provided: an in-process LRU for single-process development and a SQLite
+file that several gunicorn workers can share.
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+
+class LRUSessionBackend:
+    """In-process session backend with least-recently-used eviction."""
+
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            payload = self._data.get(sid)
+            if payload is None:
+                return None
+            self._data.move_to_end(sid)
+        return json.loads(payload)
+
+    def set(self, sid, data):
+        payload = json.dumps(data, separators=(",", ":"))
+        with self._lock:
+            self._data[sid] = payload
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteSessionBackend:
+    """Session backend stored in a local SQLite file.
+
+    Safe to share between gunicorn workers on the same host: every thread
+    gets its own connection and the database runs in WAL mode so readers do
+    not block the writer.
+    """
+
+    def __init__(self, path, max_age=31 * 24 * 3600, purge_interval=3600):
+        self.path = path
+        self.max_age = max_age
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._last_purge = 0.0
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "sid TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE sid = ?", (sid,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, sid, data):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, updated) VALUES (?, ?, ?)",
+            (sid, json.dumps(data, separators=(",", ":")), now),
+        )
+        if now - self._last_purge > self.purge_interval:
+            self._last_purge = now
+            conn.execute("DELETE FROM sessions WHERE updated < ?", (now - self.max_age,))
+
+    def delete(self, sid):
+        self._connection().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and whether it was changed."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface keeping session data in a server-side backend."""
+
+    salt = "server-session"
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _signer(self, app):
+        if not app.secret_key:
+            return None
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request):
+        signer = self._signer(app)
+        if signer is None:
+            return None
+
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = signer.unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                data = self.backend.get(sid)
+                if data is not None:
+                    return ServerSideSession(data, sid=sid)
+
+        return ServerSideSession(sid=secrets.token_urlsafe(24), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        # Empty session: drop the server-side copy and the cookie
+        if not session:
+            if session.modified:
+                self.backend.delete(session.sid)
+                response.delete_cookie(
+                    name, domain=domain, path=path, secure=secure,
+                    samesite=samesite, httponly=httponly,
+                )
+                response.vary.add("Cookie")
+            return
+
+        if session.modified:
+            self.backend.set(session.sid, dict(session))
+
+        # The cookie only carries the id, so it only changes for new sessions
+        refresh = session.permanent and app.config["SESSION_REFRESH_EACH_REQUEST"]
+        if session.new or refresh:
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=httponly,
+                domain=domain,
+                path=path,
+                secure=secure,
+                samesite=samesite,
+            )
+            response.vary.add("Cookie")
+
+
+def create_session_interface(backend=None):
+    """
+    Build the session interface selected by configuration.
+
+    Args:
+        backend: "sqlite", "memory" or "cookie"; defaults to the
+            SESSION_BACKEND environment variable, then "sqlite"
+
+    Returns:
+        SessionInterface instance, or None to keep Flask's cookie sessions
+    """
+    backend = (backend or os.getenv("SESSION_BACKEND", "sqlite")).lower()
+
+    if backend == "cookie":
+        return None
+    if backend == "memory":
+        max_sessions = int(os.getenv("SESSION_MAX_ENTRIES", 10000))
+        return ServerSideSessionInterface(LRUSessionBackend(max_sessions))
+    if backend == "sqlite":
+        path = os.getenv("SESSION_SQLITE_PATH", "sessions.sqlite3")
+        return ServerSideSessionInterface(SQLiteSessionBackend(path))
+
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
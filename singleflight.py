@@ -0,0 +1,276 @@
+"""Coalescing of identical concurrent LLM requests (single flight)."""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows: coalesce within the process only
+    fcntl = None
+
+
+class _Call:
+    """One in-flight computation that concurrent callers wait on."""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs a computation once per key among concurrent callers.
+
+    Within a process, the first caller for a key (the leader) runs it and
+    every other thread asking for the same key meanwhile waits and gets the
+    same result, or the same exception.
+
+    With ``lock_dir`` set, gunicorn workers on the same host coordinate too:
+    the leader holds an exclusive flock on ``<key>.lock`` while it computes
+    and then writes the result to ``<key>.json``. A worker that finds the
+    lock taken waits for it and reads that file instead of computing again.
+    Results must therefore be JSON-serializable (tuples come back as lists).
+    """
+
+    def __init__(self, lock_dir=None, wait_timeout=30.0, poll_interval=0.02, result_ttl=60.0):
+        """
+        Args:
+            lock_dir: Directory for cross-process lock and result files (None = in-process only)
+            wait_timeout: Seconds to wait for another worker's lock before computing anyway
+            poll_interval: Seconds between attempts to take a busy lock
+            result_ttl: Seconds after which result files are purged
+        """
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self._last_purge = time.monotonic()
+        self._counters = {
+            "calls": 0,
+            "executed": 0,
+            "coalesced": 0,
+            "coalesced_processes": 0,
+            "lock_timeouts": 0,
+        }
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def do(self, key, fn):
+        """
+        Return ``fn()``, sharing one execution among concurrent callers of ``key``.
+
+        Args:
+            key: Canonical request key (a hex digest; used in file names)
+            fn: Callable computing the result
+
+        Returns:
+            The result of the shared execution
+        """
+        with self._lock:
+            self._counters["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_locked(key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, fn):
+        """
+        Async version of do() for coroutine functions.
+
+        Coalesces callers on the running event loop only: the async serving
+        mode runs a single process, and waiting on a file lock would block
+        the loop.
+        """
+        with self._lock:
+            self._counters["calls"] += 1
+        future = self._async_calls.get(key)
+        if future is not None:
+            self._count("coalesced")
+            return await asyncio.shield(future)
+
+        future = self._async_calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            self._count("executed")
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved here, so an unawaited future does not warn
+            raise
+        finally:
+            del self._async_calls[key]
+
+    def _run_locked(self, key, fn):
+        """Run ``fn`` as this process's leader, coordinating with other workers."""
+        if not self.lock_dir:
+            self._count("executed")
+            return fn()
+
+        started = time.time()
+        deadline = time.monotonic() + self.wait_timeout
+        lock_file, waited = self._acquire(os.path.join(self.lock_dir, key + ".lock"), deadline)
+        if lock_file is None:
+            self._count("lock_timeouts")
+            self._count("executed")
+            return fn()
+
+        with lock_file:
+            try:
+                if waited:
+                    shared = self._read_result(key, started)
+                    if shared is not None:
+                        self._count("coalesced_processes")
+                        return shared[0]
+                self._count("executed")
+                result = fn()
+                self._write_result(key, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._purge()
+
+    def _acquire(self, path, deadline):
+        """
+        Take the exclusive flock on a lock file.
+
+        _purge may unlink a lock file between our open() and flock(); a lock
+        on the unlinked file excludes nobody, so it is dropped and the path
+        opened again until the locked file is the one at the path.
+
+        Returns:
+            Tuple: (open locked file or None on timeout, whether we waited)
+        """
+        waited = False
+        while True:
+            lock_file = open(path, "a")
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    waited = True
+                    if time.monotonic() >= deadline:
+                        lock_file.close()
+                        return None, waited
+                    time.sleep(self.poll_interval)
+            try:
+                if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    return lock_file, waited
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    def _read_result(self, key, not_before):
+        """The result another worker wrote after ``not_before``, as a 1-tuple, or None."""
+        path = os.path.join(self.lock_dir, key + ".json")
+        try:
+            if os.path.getmtime(path) < not_before:
+                return None
+            with open(path) as f:
+                return (json.load(f),)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, key, result):
+        path = os.path.join(self.lock_dir, key + ".json")
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.lock_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(result, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Single-flight result not shared: {e}")
+
+    def _purge(self):
+        """
+        Delete result files, and lock files nobody holds, older than the TTL.
+
+        A lock file is only unlinked while we hold its flock and it is still
+        the file at its path, and _acquire re-opens the path when the file it
+        locked was unlinked meanwhile, so two workers never lead the same key
+        on different files.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_purge < self.result_ttl:
+                return
+            self._last_purge = now
+
+        cutoff = time.time() - self.result_ttl
+        for entry in os.scandir(self.lock_dir):
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                if entry.name.endswith(".lock"):
+                    with open(entry.path, "a") as lock_file:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        # The path may name a newer lock file by now, which a leader may hold
+                        if os.stat(entry.path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                            os.unlink(entry.path)
+                else:
+                    os.unlink(entry.path)
+            except OSError:
+                continue
+
+    def stats(self):
+        """Counters plus the share of calls that were served by another caller's execution."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["in_flight"] = len(self._calls) + len(self._async_calls)
+        coalesced = stats["coalesced"] + stats["coalesced_processes"]
+        stats["coalesced_rate"] = round(coalesced / stats["calls"], 3) if stats["calls"] else 0.0
+        return stats
+
+
+def create_singleflight():
+    """
+    Build the single-flight layer from environment configuration.
+
+    Returns:
+        SingleFlight, or None when SINGLEFLIGHT_ENABLED is off
+    """
+    if os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    lock_dir = os.getenv(
+        "SINGLEFLIGHT_LOCK_DIR", os.path.join(tempfile.gettempdir(), "video-recommender-singleflight")
+    )
+    return SingleFlight(
+        lock_dir=lock_dir or None,
+        wait_timeout=float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", 30)),
+    )
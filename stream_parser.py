@@ -0,0 +1,126 @@
+"""Incremental parser for Claude's recommendation answers."""
+import json
+import re
+
+
+class StreamingAnswerParser:
+    """
+    Reads an answer chunk by chunk and resolves the ids as soon as the JSON
+    array of handles closes.
+
+    Works for both answer layouts: ids first (text after the array is the
+    analysis) and analysis first (text before the array is). Handles are
+    mapped back to video ids, checked against the candidates and
+    de-duplicated; at most ``num_recommendations`` are kept.
+    """
+
+    def __init__(self, handles, candidate_ids, num_recommendations):
+        """
+        Args:
+            handles: Dict mapping prompt handles (c1, v12, ...) to video ids
+            candidate_ids: Collection of valid video ids
+            num_recommendations: Number of ids wanted
+        """
+        self.handles = handles
+        self.candidate_ids = candidate_ids
+        self.num_recommendations = num_recommendations
+        self.ids = None  # Set once the array has closed
+        self._buffer = ""
+        self._array_start = None
+        self._after = []
+
+    def feed(self, text):
+        """
+        Consume the next chunk of the answer.
+
+        Returns:
+            str: Analysis text that followed the array in this chunk ('' if none)
+        """
+        if self.ids is not None:
+            return self._add_after(text)
+
+        self._buffer += text
+        if self._array_start is None:
+            start = self._buffer.find("[")
+            if start < 0:
+                return ""
+            self._array_start = start
+        end = self._buffer.find("]", self._array_start)
+        if end < 0:
+            return ""
+
+        self._resolve(self._buffer[self._array_start:end + 1])
+        rest = self._buffer[end + 1:]
+        self._buffer = self._buffer[:end + 1]
+        return self._add_after(rest)
+
+    def _add_after(self, text):
+        if not self._after:
+            text = text.lstrip()
+        if text:
+            self._after.append(text)
+        return text
+
+    def close(self):
+        """
+        Mark the end of the answer.
+
+        An array left open, e.g. because the ``]`` stop sequence ended the
+        generation, is resolved from the handles read so far.
+
+        Returns:
+            list: The resolved ids (empty if no array was found)
+        """
+        if self.ids is None:
+            if self._array_start is not None:
+                self._resolve(self._buffer[self._array_start:] + "]")
+            else:
+                self.ids = []
+        return self.ids
+
+    def _resolve(self, array_text):
+        try:
+            handles = json.loads(array_text)
+        except ValueError:
+            # Truncated or sloppy JSON: take whatever quoted handles are there
+            handles = re.findall(r'"([^"]+)"', array_text)
+        ids = []
+        for handle in handles:
+            vid_id = self.handles.get(str(handle), str(handle))
+            if vid_id in self.candidate_ids and vid_id not in ids:
+                ids.append(vid_id)
+        self.ids = ids[:self.num_recommendations]
+
+    @property
+    def analysis(self):
+        """Analysis text read so far (after the array, else before it), or None."""
+        text = "".join(self._after).strip()
+        if not text and self._array_start is not None:
+            text = self._buffer[:self._array_start].strip()
+        return text or None
+
+
+# One "u1": [...] entry of a batched answer, for answers that are not valid JSON
+USER_ENTRY_RE = re.compile(r'"(u\d+)"\s*:\s*\[([^\]]*)\]')
+
+
+def parse_batch_answer(text):
+    """
+    Read the keyed JSON object of a batched answer.
+
+    Returns:
+        dict: User label (u1, u2, ...) -> list of handles; users whose
+        entry is missing or malformed are left out
+    """
+    start, end = text.find("{"), text.rfind("}")
+    try:
+        answer = json.loads(text[start:end + 1]) if 0 <= start < end else None
+    except ValueError:
+        answer = None
+    if not isinstance(answer, dict):
+        # Truncated or sloppy JSON: take whatever complete entries are there
+        answer = {
+            label: re.findall(r'"([^"]+)"', handles)
+            for label, handles in USER_ENTRY_RE.findall(text)
+        }
+    return {label: picks for label, picks in answer.items() if isinstance(picks, list)}
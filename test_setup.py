@@ -31,14 +31,522 @@ except Exception as e:
     print(f"   ❌ Video generation error: {e}")
     sys.exit(1)
 
-# Test 3: Check environment first
-print("\n3. Checking environment...")
+# Test 3: Incremental analytics profile
+print("\n3. Testing analytics profile...")
+
+REFERENCE_LOCATIONS = ["Bangalore", "Mumbai", "Delhi", "Chennai", "Hyderabad", "Pune", "Goa"]
+REFERENCE_FORMATS = ["Top", "Best", "places to", "things to", "How to"]
+
+
+def count_values(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+def reference_familiarity_score(user_history):
+    """The history-walking familiarity score the profile replaced."""
+    if not user_history:
+        return 0
+    view_score = min(40, 15 + (len(user_history) - 1) * 5)
+    category_counts = count_values(v.get("category", "") for v in user_history)
+    category_score = int(max(category_counts.values()) / len(user_history) * 30)
+    tag_counts = count_values(tag for v in user_history for tag in v.get("tags", []))
+    tag_score = min(20, sum(1 for count in tag_counts.values() if count >= 2) * 5)
+    pattern_score = 0
+    location_mentions = [loc for v in user_history for loc in REFERENCE_LOCATIONS if loc in v.get("title", "")]
+    if len(location_mentions) >= 2:
+        pattern_score += 5
+    format_matches = sum(1 for v in user_history if any(p in v.get("title", "") for p in REFERENCE_FORMATS))
+    if format_matches >= 2:
+        pattern_score += 5
+    return min(100, view_score + category_score + tag_score + pattern_score)
+
+
+def reference_preference_insights(user_history):
+    """The history-walking preference insights the profile replaced."""
+    if not user_history:
+        return {"primary_interest": "Unknown", "secondary_interest": None, "patterns": []}
+    category_counts = count_values(v.get("category", "") for v in user_history)
+    sorted_categories = sorted(category_counts.items(), key=lambda x: x[1], reverse=True)
+    primary_interest = sorted_categories[0][0]
+    secondary_interest = sorted_categories[1][0] if len(sorted_categories) > 1 else None
+    patterns = []
+    location_counts = count_values(
+        loc for v in user_history for loc in REFERENCE_LOCATIONS if loc in v.get("title", "")
+    )
+    if location_counts:
+        top_location = max(location_counts.items(), key=lambda x: x[1])
+        if top_location[1] >= 2:
+            patterns.append(f"Focused on {top_location[0]} content")
+    tag_counts = count_values(tag for v in user_history for tag in v.get("tags", []))
+    frequent_tags = [tag for tag, count in tag_counts.items() if count >= 2]
+    if frequent_tags:
+        patterns.append(f"Interest in: {', '.join(frequent_tags[:3])}")
+    return {
+        "primary_interest": primary_interest.capitalize(),
+        "secondary_interest": secondary_interest.capitalize() if secondary_interest else None,
+        "patterns": patterns
+    }
+
+
+try:
+    import random
+    from analytics import UserProfile, calculate_familiarity_score, get_preference_insights
+    analytics_rng = random.Random(4)
+    analytics_pool = generate_video_pool(300)
+    # Items without "attrs" take the title-matcher path, as items from outside the generator do
+    analytics_pool += [{k: v for k, v in video.items() if k != "attrs"} for video in analytics_pool[:150]]
+    assert sum(any(loc in v["title"] for loc in REFERENCE_LOCATIONS) for v in analytics_pool) > 50
+    assert sum(any(p in v["title"] for p in REFERENCE_FORMATS) for v in analytics_pool) > 50
+    checked = 0
+    for _ in range(200):
+        history = [analytics_rng.choice(analytics_pool) for _ in range(analytics_rng.randint(1, 25))]
+        profile = UserProfile()
+        for i, video in enumerate(history, 1):
+            profile = UserProfile.from_dict(profile.to_dict())
+            profile.add(video)
+            assert calculate_familiarity_score(profile) == reference_familiarity_score(history[:i]), history[:i]
+            assert get_preference_insights(profile) == reference_preference_insights(history[:i]), history[:i]
+            checked += 1
+    print(f"   ✅ Incremental profile matches the history-walking reference on {checked} prefixes")
+except Exception as e:
+    print(f"   ❌ Analytics profile error: {e!r}")
+    sys.exit(1)
+
+# Test 4: Cacheable prompt prefix
+print("\n4. Testing cacheable prompt prefix...")
+try:
+    from catalog import Catalog
+    from fake_llm import FakeAnthropic
+    from prompt_builder import PromptBuilder
+    from recommender import VideoRecommender
+    catalog = Catalog(generate_video_pool(300))
+    fake = FakeAnthropic()
+    rec = VideoRecommender(client=fake, prompt_builder=PromptBuilder(catalog=catalog), cache_catalog=True)
+    for start in (0, 3):
+        ids, _ = rec.recommend(catalog.items[start:start + 3], catalog.items[50:90], 3)
+        assert set(ids) <= {v["id"] for v in catalog.items[50:90]}
+    system = fake.requests[-1]["system"]
+    assert system[-1]["cache_control"] == {"type": "ephemeral"}
+    usage = rec.usage_stats()
+    assert usage["cache_creation_input_tokens"] > 0 and usage["cache_read_input_tokens"] > 0
+    print(f"   ✅ Second call read {usage['cache_read_input_tokens']} input tokens from the prompt cache")
+except Exception as e:
+    print(f"   ❌ Prompt caching error: {e}")
+    sys.exit(1)
+
+# Test 5: LLM deadline, hedging and circuit breaker
+print("\n5. Testing LLM latency guard...")
+try:
+    import time
+    from llm_guard import CircuitBreaker, LLMGuard
+    from ranker import CatalogRanker, LocalRecommender
+    history, candidates = catalog.items[:3], catalog.items[50:90]
+    local = LocalRecommender(CatalogRanker(catalog))
+
+    # A hung call is abandoned at the deadline and answered by the local ranker
+    guard = LLMGuard(timeout=0.2, breaker=CircuitBreaker(failure_threshold=2, cooldown=60))
+    slow = VideoRecommender(client=FakeAnthropic(latency=2.0), guard=guard, fallback=local)
+    start = time.monotonic()
+    ids, _ = slow.recommend(history, candidates, 3)
+    assert time.monotonic() - start < 1.0, "deadline not enforced"
+    assert ids == local.recommend(history, candidates, 3)[0]
+
+    # The second timeout opens the breaker; the third call is not attempted
+    slow.recommend(history, candidates, 3)
+    start = time.monotonic()
+    slow.recommend(history, candidates, 3)
+    assert time.monotonic() - start < 0.1
+    stats = guard.stats()
+    assert stats["timeouts"] == 2 and stats["short_circuited"] == 1 and stats["breaker"]["state"] == "open"
+
+    # A hedge started after 0.1s wins over a slow first attempt
+    delays = iter([2.0, 0.0])
+    hedged = LLMGuard(timeout=1.0, hedge_after=0.1)
+    fast = VideoRecommender(client=FakeAnthropic(latency=lambda: next(delays, 0.0)), guard=hedged)
+    start = time.monotonic()
+    fast.recommend(history, candidates, 3)
+    assert time.monotonic() - start < 0.5 and hedged.stats()["hedge_wins"] == 1
+
+    # With the default guard (no hedging), one transient error is retried, not a fallback
+    from llm_guard import create_guard
+    overloaded = Exception("Overloaded")
+    overloaded.status_code = 529
+    failures = iter([overloaded])
+    default_guard = create_guard()
+    flaky = FakeAnthropic(fail_with=lambda: next(failures, None))
+    VideoRecommender(client=flaky, guard=default_guard).recommend(history, candidates, 3)
+    stats = default_guard.stats()
+    assert stats["retries"] == 1 and stats["successes"] == 1 and stats["errors"] == 0, stats
+    assert VideoRecommender(guard=default_guard).client.max_retries == 0  # no SDK retries on top
+    print("   ✅ Timeouts fall back to the local ranker; breaker opens; hedge won; transient error retried")
+except Exception as e:
+    print(f"   ❌ LLM guard error: {e!r}")
+    sys.exit(1)
+
+# Test 6: Async recommender
+print("\n6. Testing async recommender...")
+try:
+    import asyncio
+    from fake_llm import FakeAsyncAnthropic
+    from recommender import AsyncVideoRecommender
+    rec = AsyncVideoRecommender(client=FakeAsyncAnthropic(latency=0.2), fallback=local)
+
+    async def concurrent_calls():
+        return await asyncio.gather(*(rec.recommend(history, candidates, 3) for _ in range(50)))
+
+    start = time.monotonic()
+    answers = asyncio.run(concurrent_calls())
+    elapsed = time.monotonic() - start
+    assert elapsed < 1.0, f"calls did not overlap ({elapsed:.2f}s)"
+    assert all(len(ids) == 3 and analysis for ids, analysis in answers)
+    print(f"   ✅ 50 concurrent 0.2s LLM calls finished in {elapsed:.2f}s")
+except Exception as e:
+    print(f"   ❌ Async recommender error: {e!r}")
+    sys.exit(1)
+
+# Test 7: Streaming ids-first answers
+print("\n7. Testing streamed recommendations...")
+try:
+    # Handles split across chunks are resolved once the array closes
+    script = ['["c', '2", "c1', '", "c99", "c', '3"]', '\nThe user likes', ' food.']
+    scripted = VideoRecommender(client=FakeAnthropic(script=script))
+    events = list(scripted.recommend_stream(history, candidates, 3))
+    assert events[0] == ("ids", [candidates[1]["id"], candidates[0]["id"], candidates[2]["id"]]), events[0]
+    assert "".join(text for kind, text in events[1:]) == "The user likes food."
+
+    # Ids arrive well before the full answer, and generation stops after them
+    fake = FakeAnthropic(token_latency=0.01)
+    start = time.monotonic()
+    VideoRecommender(client=fake).recommend(history, candidates, 3)
+    full_answer = time.monotonic() - start
+    start = time.monotonic()
+    stream = VideoRecommender(client=fake).recommend_stream(history, candidates, 3)
+    kind, ids = next(stream)
+    first_ids = time.monotonic() - start
+    assert kind == "ids" and len(ids) == 3 and fake.streams[-1].chunks_sent < len(fake.streams[-1].chunks)
+    stream.close()
+    assert fake.streams[-1].closed
+    ids_only, analysis = VideoRecommender(client=fake, stream_ids=True).recommend(history, candidates, 3)
+    assert ids_only == ids and analysis is None
+    assert fake.requests[-1]["stop_sequences"] == ["]"] and fake.streams[-1].chunks[-1].endswith('"')
+    assert first_ids < full_answer / 2
+    print(f"   ✅ First ids after {first_ids:.2f}s instead of {full_answer:.2f}s for the full answer")
+except Exception as e:
+    print(f"   ❌ Streaming error: {e!r}")
+    sys.exit(1)
+
+# Test 8: Single-flight coalescing
+print("\n8. Testing single-flight coalescing...")
+try:
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from singleflight import SingleFlight
+    fake = FakeAnthropic(latency=0.2)
+    flight = SingleFlight()
+    rec = VideoRecommender(client=fake, singleflight=flight)
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        answers = list(executor.map(lambda _: rec.recommend(history, candidates, 3), range(10)))
+    assert len(fake.requests) == 1, f"{len(fake.requests)} API calls"
+    assert all(answer == answers[0] for answer in answers)
+    assert flight.stats()["coalesced"] == 9, flight.stats()
+
+    # Two workers sharing a lock directory: the second reads the first one's result
+    with tempfile.TemporaryDirectory() as lock_dir:
+        workers = [SingleFlight(lock_dir=lock_dir), SingleFlight(lock_dir=lock_dir)]
+        computed = []
+
+        def compute():
+            time.sleep(0.2)
+            computed.append(1)
+            return ["v1", "v2"]
+
+        def call(worker):
+            return worker.do("k" * 64, compute)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(call, workers[0])]
+            time.sleep(0.05)
+            futures.append(executor.submit(call, workers[1]))
+            results = [f.result() for f in futures]
+        assert results == [["v1", "v2"]] * 2 and len(computed) == 1, (results, computed)
+        assert workers[1].stats()["coalesced_processes"] == 1
+    print("   ✅ 10 concurrent identical requests made 1 API call; a second worker reused the result")
+except Exception as e:
+    print(f"   ❌ Single-flight error: {e!r}")
+    sys.exit(1)
+
+# Test 9: Micro-batching
+print("\n9. Testing request batching...")
+try:
+    from batching import BatchingRecommender
+    users = [(pool[i:i + 2], pool[10 + i * 5:30 + i * 5]) for i in range(4)]
+
+    def batched_answers(batcher):
+        with ThreadPoolExecutor(max_workers=len(users)) as executor:
+            return list(executor.map(lambda user: batcher.recommend(user[0], user[1], 3), users))
+
+    fake = FakeAnthropic(latency=0.1)
+    batcher = BatchingRecommender(VideoRecommender(client=fake), max_batch=4, window=0.05)
+    answers = batched_answers(batcher)
+    assert len(fake.requests) == 1, f"{len(fake.requests)} API calls"
+    for (_, user_candidates), (ids, _) in zip(users, answers):
+        assert len(ids) == 3 and set(ids) <= {v["id"] for v in user_candidates}
+
+    # Users missing from the answer get the fallback's picks
+    fake = FakeAnthropic(latency=0.1, script=['{"u1": ["c1", "c2", "c3"]}'])
+    batcher = BatchingRecommender(VideoRecommender(client=fake, fallback=local), max_batch=4, window=0.05)
+    answers = batched_answers(batcher)
+    assert all(len(ids) == 3 for ids, _ in answers) and batcher.stats()["missing_entries"] == 3
+    print("   ✅ 4 concurrent users answered by 1 API call; missing entries fall back per user")
+except Exception as e:
+    print(f"   ❌ Batching error: {e!r}")
+    sys.exit(1)
+
+# Test 10: Tiered policy
+print("\n10. Testing tiered recommender...")
+try:
+    from tiered import TieredRecommender
+    by_category = {}
+    for video in catalog.items:
+        by_category.setdefault(video["category"], []).append(video)
+    food, other = by_category["food"], [v for v in catalog.items if v["category"] != "food"]
+    fake = FakeAnthropic()
+    tiered = TieredRecommender(local, VideoRecommender(client=fake), sample_rate=0)
+    assert tiered.route(food[:1]) == ("llm", "cold_start")
+    assert tiered.route(food[:6]) == ("local", "confident")
+    assert tiered.route(food[:2] + other[:2]) == ("llm", "ambiguous")
+    assert tiered.route(food[:6] + other[:3]) == ("llm", "shifted")
+    ids, analysis = tiered.recommend(food[:6], candidates, 3)
+    assert len(ids) == 3 and analysis and not fake.requests
+    tiered.recommend(food[:1], candidates, 3)
+    stats = tiered.stats()
+    assert len(fake.requests) == 1 and stats["local"]["requests"] == stats["llm"]["requests"] == 1
+    print("   ✅ Confident profiles stay local; cold, ambiguous and shifted ones go to the LLM")
+except Exception as e:
+    print(f"   ❌ Tiered recommender error: {e!r}")
+    sys.exit(1)
+
+# Test 11: Co-click model
+print("\n11. Testing co-click model...")
+try:
+    import os
+    from coclick import CoClickModel
+    model = CoClickModel(top_k=2, max_neighbors=3)
+    for target, times in (("b", 5), ("c", 3), ("d", 1), ("e", 1), ("f", 1)):
+        for _ in range(times):
+            model.record("a", target)
+    model.flush()
+    assert [v for v, _ in model.neighbors("a")] == ["b", "c"], model.neighbors("a")
+    assert model.stats()["pairs"] == 3  # bounded per item
+    assert model.candidates(["x", "a"], 5, exclude={"b"})[0] == "c"
+
+    # Two workers merge their counts through the snapshot
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        path = os.path.join(snapshot_dir, "coclick.json")
+        workers = [CoClickModel(path=path, snapshot_interval=3600) for _ in range(2)]
+        workers[0].record("a", "b")
+        workers[1].record("a", "b")
+        workers[1].record("a", "c")
+        for worker in workers:
+            worker.flush()
+            worker.save()
+        assert dict(CoClickModel(path=path).neighbors("a")) == {"b": 2, "c": 1}
+
+        # Choices after the last snapshot are saved on close (atexit)
+        workers[0].record("a", "c")
+        workers[0].close()
+        assert dict(CoClickModel(path=path).neighbors("a")) == {"b": 2, "c": 2}
+    print("   ✅ Top neighbours precomputed, counters bounded, worker snapshots merged and saved on exit")
+except Exception as e:
+    print(f"   ❌ Co-click error: {e!r}")
+    sys.exit(1)
+
+# Test 12: Approximate nearest-neighbour index
+print("\n12. Testing ANN candidate index...")
+try:
+    import random
+    from ann_index import VectorIndex
+    from analytics import UserProfile
+    from catalog import Catalog
+    from video_generator import generate_video_pool
+    ann_catalog = Catalog(generate_video_pool(3000))
+    index = VectorIndex(ann_catalog, nprobe=8)
+    rng = random.Random(0)
+    queries = []
+    for _ in range(20):
+        history = rng.sample(ann_catalog.items, 5)
+        queries.append((UserProfile.from_history(history), {v["id"] for v in history}))
+    profile, used = queries[0]
+    found = index.top_k(profile, 20, exclude=used)
+    assert len(found) == 20 and not used & {v["id"] for v in found}
+    assert index.recall(queries, 20, nprobe=index.num_lists) == 1.0
+    recall = index.recall(queries, 20)
+    assert recall >= 0.8, recall
+    print(f"   ✅ {index.stats()['points']} vectors in {index.num_lists} lists, recall@20 {recall:.2f}")
+except Exception as e:
+    print(f"   ❌ ANN index error: {e!r}")
+    sys.exit(1)
+
+# Test 13: Compiled catalog
+print("\n13. Testing compiled catalog...")
+try:
+    from compiled_catalog import CompiledCatalog
+    with tempfile.TemporaryDirectory() as catalog_dir:
+        compiled = CompiledCatalog.compile(ann_catalog.items, os.path.join(catalog_dir, "catalog.vcat"))
+        assert len(compiled) == len(ann_catalog) and compiled.category_counts == ann_catalog.category_counts
+        assert list(compiled.items[:50]) == ann_catalog.items[:50]
+        video = ann_catalog.items[1234]
+        assert compiled.get(video["id"]) == video and compiled.row_of("missing") is None
+        assert compiled.take(5, exclude=used, tag="food") == ann_catalog.take(5, exclude=used, tag="food")
+        del compiled
+    print("   ✅ Compiled catalog matches the JSON one")
+except Exception as e:
+    print(f"   ❌ Compiled catalog error: {e!r}")
+    sys.exit(1)
+
+# Test 14: Seeded parallel catalog generation
+print("\n14. Testing catalog generation...")
+try:
+    import json
+    import generate_thumbnails_config
+    with tempfile.TemporaryDirectory() as catalog_dir:
+        outputs = []
+        for workers in (1, 2):
+            outputs.append(os.path.join(catalog_dir, f"catalog-{workers}.jsonl"))
+            generate_thumbnails_config.generate(outputs[-1], 2500, workers, seed="setup", shard_size=1000)
+        with open(outputs[0]) as first, open(outputs[1]) as second:
+            assert first.read() == second.read()
+        with open(outputs[0]) as f:
+            ids = {json.loads(line)["id"] for line in f}
+        assert len(ids) == 2500
+    print("   ✅ Same catalog with 1 and 2 workers, unique ids")
+except Exception as e:
+    print(f"   ❌ Catalog generation error: {e!r}")
+    sys.exit(1)
+
+# Test 15: Integer-coded title attributes
+print("\n15. Testing structured title attributes...")
+try:
+    from video_generator import ATTRIBUTE_VALUES, title_attributes
+    for video in ann_catalog.items[:500]:
+        assert title_attributes(video["title"], video["category"], video["tags"]) == video["attrs"], video
+    kolkata = {"id": "k1", "title": "Best biryani in Kolkata", "category": "food", "tags": ["food", "biryani"]}
+    legacy = Catalog([kolkata]).get("k1")  # backfilled on load, into a copy
+    assert "attrs" not in kolkata
+    assert ATTRIBUTE_VALUES["location"][legacy["attrs"]["location"]] == "Kolkata"
+    # Analytics look for their own locations only, Kolkata is not one of them
+    assert UserProfile.from_history([legacy, legacy]).location_counts == {}
+    goa = Catalog([dict(kolkata, id="g1", title="Best biryani in Goa")]).get("g1")
+    assert UserProfile.from_history([goa, goa]).location_counts == {"Goa": 2}
+    print("   ✅ Attributes stored at generation match the title backfill")
+except Exception as e:
+    print(f"   ❌ Attribute error: {e!r}")
+    sys.exit(1)
+
+# Test 16: Multi-pattern title matcher
+print("\n16. Testing title matcher...")
+try:
+    from matcher import TitleMatcher
+    matcher = TitleMatcher({"location": ["Goa", "North Goa", "Mumbai"], "format": ["Top", "places to"]})
+    assert matcher.scan("Top 5 places to visit in North Goa") == {"format": (0, 1), "location": (0, 1)}
+    assert matcher.scan("Mumbaiplaces to") == {"format": (1,), "location": (2,)}
+    untagged = {"id": "u1", "title": "Top cafes in Mumbai and Pune"}
+    assert matcher.match(untagged) is matcher.match(untagged)
+    assert UserProfile.from_history([untagged] * 2).location_counts == {"Mumbai": 2, "Pune": 2}
+    print("   ✅ All vocabulary values found in one pass, memoized per item id")
+except Exception as e:
+    print(f"   ❌ Title matcher error: {e!r}")
+    sys.exit(1)
+
+# Test 17: Stage timings and Prometheus metrics
+print("\n17. Testing metrics...")
+try:
+    import json
+    import os
+    import tempfile
+    from metrics import Metrics
+    with tempfile.TemporaryDirectory() as metrics_dir:
+        registry = Metrics(directory=metrics_dir, flush_interval=3600)
+        token = registry.start_request()
+        with registry.stage("llm"):
+            registry.inc("llm_calls_total", outcome="ok")
+        header = registry.finish_request(token, "api_recommend", 200)
+        assert header.startswith("llm;dur=") and ", total;dur=" in header, header
+        # Another worker of the same master (pid 1 is alive) has made 2 calls
+        other = registry.snapshot()
+        other.update(pid=1, counters=[["llm_calls_total", {"outcome": "ok"}, 2]])
+        with open(os.path.join(metrics_dir, f"metrics-{os.getppid()}-1.json"), "w") as f:
+            json.dump(other, f)
+        text = registry.render()
+        assert 'recommender_llm_calls_total{outcome="ok"} 3' in text, text
+        assert 'recommender_stage_seconds_count{stage="llm"} 2' in text, text
+    print("   ✅ Server-Timing header built, workers' metrics summed")
+except Exception as e:
+    print(f"   ❌ Metrics error: {e!r}")
+    sys.exit(1)
+
+# Test 18: Request profiling
+print("\n18. Testing request profiler...")
+try:
+    from profiling import RequestProfiler
+    with tempfile.TemporaryDirectory() as profile_dir:
+        profiler = RequestProfiler(directory=profile_dir, token="secret", sample_rate=1.0)
+        assert profiler.begin("wrong") is None
+        profile = profiler.begin("secret")
+        generate_video_pool(200)
+        assert profiler.end(profile, "funnel").endswith(".pstats")
+        profile = profiler.begin("secret", mode="sample")
+        generate_video_pool(2000)
+        with open(profiler.end(profile, "funnel")) as f:
+            assert "generate_video_pool" in f.read()
+        # Automatic: slow requests only, one at a time
+        profiler.slow_ms = 10 ** 6
+        profile = profiler.begin()
+        assert profile.automatic and profiler.begin() is None
+        assert profiler.end(profile, "api_recommend") is None
+        assert len(os.listdir(profile_dir)) == 2
+    print("   ✅ pstats and collapsed stacks saved, fast automatic profiles dropped")
+except Exception as e:
+    print(f"   ❌ Profiler error: {e!r}")
+    sys.exit(1)
+
+# Test 19: Offline replay harness
+print("\n19. Testing replay harness...")
+try:
+    from catalog import Catalog
+    from evaluation import ReplayHarness, simulate_traces
+    from ranker import CatalogRanker, CategoryRecommender, LocalRecommender
+    replay_catalog = Catalog(generate_video_pool(300))
+    replay_ranker = CatalogRanker(replay_catalog)
+
+    def replay_candidates(history, profile, used_set):
+        return history, replay_ranker.top_k(profile, 20, exclude=used_set)
+
+    harness = ReplayHarness(replay_catalog, replay_candidates)
+    traces = simulate_traces(replay_catalog, 10, 5, seed=3)
+    traces.append({"session": "logged", "choices": [v["id"] for v in replay_catalog.items[:4]]})
+    claude = VideoRecommender(client=FakeAnthropic())
+    for recommender in (CategoryRecommender(replay_ranker), LocalRecommender(replay_ranker), claude):
+        report = harness.replay(recommender, traces)
+        assert report["sessions"] == 11 and report["calls"] == 53, report
+        assert 0 <= report["hit_rate"] <= 1 and report["category_coverage"] > 0, report
+    assert report["llm_calls_per_session"] == round(53 / 11, 2) and report["tokens_per_session"] > 0, report
+    print(f"   ✅ Replayed 11 sessions per policy (fake Claude: {report['hit_rate']:.0%} hits)")
+except Exception as e:
+    print(f"   ❌ Replay harness error: {e!r}")
+    sys.exit(1)
+
+# Test 20: Check environment first
+print("\n20. Checking environment...")
 import os
 load_dotenv()
 api_key = os.getenv('ANTHROPIC_API_KEY')
 
-# Test 4: Flask app
-print("\n4. Testing Flask app...")
+# Test 21: Flask app
+print("\n21. Testing Flask app...")
 try:
     if not api_key or api_key == 'your_api_key_here':
         os.environ['ANTHROPIC_API_KEY'] = 'test-key'
@@ -51,8 +559,8 @@ except Exception as e:
     print(f"   ❌ Flask app error: {e}")
     sys.exit(1)
 
-# Test 5: Validate API key
-print("\n5. Validating API key configuration...")
+# Test 22: Validate API key
+print("\n22. Validating API key configuration...")
 if api_key and api_key != 'your_api_key_here' and api_key.startswith('sk-ant'):
     print("   ✅ ANTHROPIC_API_KEY configured correctly")
     ready = True
@@ -0,0 +1,215 @@
+"""Tiered recommendation policy: the local ranker first, Claude only when it is needed."""
+import random
+import threading
+import time
+from collections import deque
+
+from analytics import UserProfile, calculate_familiarity_score
+
+TIERS = ("local", "llm")
+
+# Why a request went to its tier
+REASONS = ("confident", "cold_start", "ambiguous", "shifted", "sampled")
+
+
+class TieredRecommender:
+    """
+    Serves a request from the local ranker when the user's profile is
+    confident, and escalates to the LLM recommender when it is not.
+
+    A profile is confident when its familiarity score and the share of its
+    dominant category are both high enough. Requests escalate when the
+    history is too short, when the profile is ambiguous, when the last few
+    choices moved away from the dominant category (an interest shift), or
+    at random at ``sample_rate`` so Claude keeps seeing confident users too.
+
+    Same interface as VideoRecommender (recommend, recommend_stream,
+    usage_stats), so it can stand in for it in app.py.
+    """
+
+    def __init__(self, local, llm, min_familiarity=60, min_dominance=0.6, min_history=2,
+                 shift_window=3, sample_rate=0.05, rng=None):
+        """
+        Args:
+            local: ranker.LocalRecommender serving the confident tier
+            llm: VideoRecommender (or anything with its recommend()) serving escalations
+            min_familiarity: Lowest calculate_familiarity_score that counts as confident
+            min_dominance: Lowest share of choices in the top category that counts as confident
+            min_history: Histories shorter than this always escalate
+            shift_window: Recent choices checked for a move away from the top category,
+                once the history is at least twice as long (0 = off)
+            sample_rate: Share of confident requests escalated anyway
+            rng: random.Random used for sampling (seed it for replays)
+        """
+        self.local = local
+        self.llm = llm
+        self.min_familiarity = min_familiarity
+        self.min_dominance = min_dominance
+        self.min_history = min_history
+        self.shift_window = shift_window
+        self.sample_rate = sample_rate
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._reasons = {reason: 0 for reason in REASONS}
+        self._tiers = {tier: {"requests": 0, "seconds": 0.0, "latencies": deque(maxlen=1000)} for tier in TIERS}
+
+    def _full_history(self, user_history):
+        # Prompt-formatted history is trimmed; score on the full catalog entries
+        catalog = self.local.ranker.catalog
+        return [catalog.get(v["id"]) or v for v in user_history]
+
+    def route(self, user_history):
+        """
+        Decide which tier serves a request.
+
+        Args:
+            user_history: List of dicts with video metadata user has chosen
+
+        Returns:
+            Tuple: (tier, reason), tier being "local" or "llm"
+        """
+        history = self._full_history(user_history)
+        profile = UserProfile.from_history(history)
+        if profile.num_videos < self.min_history:
+            return "llm", "cold_start"
+
+        top_category = profile.top_categories()[0][0]
+        if self.shift_window and profile.num_videos >= 2 * self.shift_window:
+            recent = UserProfile.from_history(history[-self.shift_window:])
+            if recent.category_counts.get(top_category, 0) * 2 < recent.num_videos:
+                return "llm", "shifted"
+
+        dominance = profile.max_category_count / profile.num_videos
+        if calculate_familiarity_score(profile) < self.min_familiarity or dominance < self.min_dominance:
+            return "llm", "ambiguous"
+        if self.sample_rate and self.rng.random() < self.sample_rate:
+            return "llm", "sampled"
+        return "local", "confident"
+
+    def _record(self, tier, reason, seconds):
+        with self._lock:
+            self._reasons[reason] += 1
+            totals = self._tiers[tier]
+            totals["requests"] += 1
+            totals["seconds"] += seconds
+            totals["latencies"].append(seconds)
+
+    def recommend(self, user_history, candidate_videos, num_recommendations=3):
+        """
+        Recommend videos from candidates, from the tier route() picks.
+
+        Returns:
+            Tuple: (recommended_ids, analysis_text)
+        """
+        tier, reason = self.route(user_history)
+        recommender = self.local if tier == "local" else self.llm
+        start = time.perf_counter()
+        try:
+            return recommender.recommend(user_history, candidate_videos, num_recommendations)
+        finally:
+            self._record(tier, reason, time.perf_counter() - start)
+
+    def recommend_stream(self, user_history, candidate_videos, num_recommendations=3, analysis=True):
+        """
+        Like VideoRecommender.recommend_stream; local answers arrive as one analysis chunk.
+
+        Yields:
+            ("ids", recommended_ids) once, then ("analysis", text) chunks
+        """
+        tier, reason = self.route(user_history)
+        start = time.perf_counter()
+        if tier == "llm" and hasattr(self.llm, "recommend_stream"):
+            events = self.llm.recommend_stream(user_history, candidate_videos, num_recommendations, analysis)
+            try:
+                event = next(events)
+            finally:
+                # Time to the ids, which is what the tiers are compared on
+                self._record(tier, reason, time.perf_counter() - start)
+            try:
+                yield event
+                yield from events
+            finally:
+                events.close()
+            return
+
+        recommender = self.local if tier == "local" else self.llm
+        try:
+            recommended_ids, analysis_text = recommender.recommend(user_history, candidate_videos, num_recommendations)
+        finally:
+            self._record(tier, reason, time.perf_counter() - start)
+        yield "ids", recommended_ids
+        if analysis and analysis_text:
+            yield "analysis", analysis_text
+
+    def usage_stats(self):
+        """Token usage of the LLM tier (the local tier uses none)."""
+        return self.llm.usage_stats() if hasattr(self.llm, "usage_stats") else None
+
+    def stats(self):
+        """Requests, latency and LLM tokens per tier, escalation reasons and LLM calls avoided."""
+        with self._lock:
+            reasons = dict(self._reasons)
+            tiers = {
+                tier: dict(totals, latencies=sorted(totals["latencies"]))
+                for tier, totals in self._tiers.items()
+            }
+        total = sum(totals["requests"] for totals in tiers.values())
+        usage = self.usage_stats() or {}
+        stats = {"requests": total, "reasons": reasons}
+        for tier, totals in tiers.items():
+            latencies = totals.pop("latencies")
+            requests = totals["requests"]
+            totals["share"] = round(requests / total, 3) if total else 0.0
+            totals["avg_ms"] = round(totals.pop("seconds") / requests * 1000, 2) if requests else 0.0
+            totals["p95_ms"] = round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2) if latencies else 0.0
+            stats[tier] = totals
+        stats["local"]["tokens"] = 0
+        stats["llm"]["tokens"] = usage.get("total_input_tokens", 0) + usage.get("output_tokens", 0)
+        stats["llm_calls_avoided"] = stats["local"]["requests"]
+        return stats
+
+
+class AsyncTieredRecommender(TieredRecommender):
+    """TieredRecommender over a recommender.AsyncVideoRecommender (see async_app.py)."""
+
+    async def recommend(self, user_history, candidate_videos, num_recommendations=3):
+        """
+        Async version of TieredRecommender.recommend.
+
+        Returns:
+            Tuple: (recommended_ids, analysis_text)
+        """
+        tier, reason = self.route(user_history)
+        start = time.perf_counter()
+        try:
+            if tier == "local":
+                return self.local.recommend(user_history, candidate_videos, num_recommendations)
+            return await self.llm.recommend(user_history, candidate_videos, num_recommendations)
+        finally:
+            self._record(tier, reason, time.perf_counter() - start)
+
+    async def recommend_stream(self, user_history, candidate_videos, num_recommendations=3, analysis=True):
+        """Async version of TieredRecommender.recommend_stream."""
+        tier, reason = self.route(user_history)
+        start = time.perf_counter()
+        if tier == "llm":
+            events = self.llm.recommend_stream(user_history, candidate_videos, num_recommendations, analysis)
+            try:
+                event = await anext(events)
+            finally:
+                self._record(tier, reason, time.perf_counter() - start)
+            try:
+                yield event
+                async for event in events:
+                    yield event
+            finally:
+                await events.aclose()
+            return
+
+        try:
+            recommended_ids, analysis_text = self.local.recommend(user_history, candidate_videos, num_recommendations)
+        finally:
+            self._record(tier, reason, time.perf_counter() - start)
+        yield "ids", recommended_ids
+        if analysis and analysis_text:
+            yield "analysis", analysis_text
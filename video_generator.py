@@ -1,7 +1,10 @@
 """Generate realistic thumbnail-style content for recommendation testing."""
 import random
+import re
 import string
 
+from matcher import TitleMatcher
+
 
 # Realistic thumbnail templates (typical clickbait/list-style content)
 THUMBNAIL_TEMPLATES = {
@@ -98,10 +101,157 @@ COLORS = [
     "#FF6347", "#20B2AA", "#778899", "#FF69B4", "#DDA0DD"
 ]
 
+# Title formats the analytics count as "list-style" titles
+TITLE_FORMATS = ["Top", "Best", "places to", "things to", "How to"]
+
+# Template slots kept on every item as integer codes: item["attrs"] maps a
+# slot to an index into ATTRIBUTE_VALUES[slot]. The codes are stored in
+# catalog files, so values may only be appended.
+ATTRIBUTE_SOURCES = {
+    "location": "locations",
+    "food_type": "food_types",
+    "product": "products",
+    "topic": "topics",
+    "subject": "subjects",
+    "content_type": "content_types",
+}
+ATTRIBUTE_SLOTS = tuple(ATTRIBUTE_SOURCES) + ("format",)
+
+
+def _attribute_values():
+    values = {slot: [] for slot in ATTRIBUTE_SOURCES}
+    for template_data in THUMBNAIL_TEMPLATES.values():
+        for slot, source in ATTRIBUTE_SOURCES.items():
+            for value in template_data.get(source, []):
+                if value not in values[slot]:
+                    values[slot].append(value)
+    values["format"] = list(TITLE_FORMATS)
+    return values
+
+
+ATTRIBUTE_VALUES = _attribute_values()
+ATTRIBUTE_CODES = {slot: {value: code for code, value in enumerate(values)} for slot, values in ATTRIBUTE_VALUES.items()}
+# Tags carry slot values in lower case
+_LOWER_CODES = {slot: {value.lower(): code for code, value in enumerate(values)} for slot, values in ATTRIBUTE_VALUES.items()}
+# Every attribute value, for titles that match no template
+TITLE_MATCHER = TitleMatcher(ATTRIBUTE_VALUES)
+
+
+def _template_format(template):
+    """Format code of a template (the first TITLE_FORMATS entry in its fixed text), or None."""
+    for code, pattern in enumerate(TITLE_FORMATS):
+        if pattern in template:
+            return code
+    return None
+
+
+def _template_pattern(template):
+    """Regex matching the titles a template produces, with a named group per attribute slot."""
+    parts = re.split(r"\{(\w+)\}", template)
+    regex = []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            regex.append(re.escape(part))
+        elif part in ATTRIBUTE_CODES:
+            regex.append(f"(?P<{part}>" + "|".join(re.escape(v) for v in ATTRIBUTE_VALUES[part]) + ")")
+        else:
+            regex.append(".+?")
+    return re.compile("".join(regex) + "$")
+
+
+TEMPLATE_PATTERNS = {
+    category: [(_template_pattern(template), _template_format(template)) for template in data["templates"]]
+    for category, data in THUMBNAIL_TEMPLATES.items()
+}
+
+
+def encode_attributes(format_code=None, **slots):
+    """Integer-coded attributes from slot values, e.g. encode_attributes(location="Goa")."""
+    attrs = {slot: ATTRIBUTE_CODES[slot][value] for slot, value in slots.items()}
+    if format_code is not None:
+        attrs["format"] = format_code
+    return attrs
+
+
+def title_attributes(title, category=None, tags=()):
+    """
+    Recover the integer-coded attributes of an item from its title and tags.
+
+    Backfill for items generated before attributes were stored: the title
+    is matched against the templates of its category, and slots the
+    template does not show (e.g. the topic of "How I got fit in 30 days")
+    are taken from the tags, which the generator fills from the same
+    values. Titles matching no template (e.g. from another source) are
+    scanned for known values.
+
+    Args:
+        title: Video title
+        category: Video category, to try its templates first
+        tags: Video tags
+
+    Returns:
+        dict: Slot -> code, like item["attrs"]
+    """
+    attrs = {}
+    matched = False
+    candidates = TEMPLATE_PATTERNS.get(category) or [p for patterns in TEMPLATE_PATTERNS.values() for p in patterns]
+    for pattern, format_code in candidates:
+        match = pattern.match(title)
+        if match:
+            attrs = encode_attributes(format_code, **{k: v for k, v in match.groupdict().items() if v is not None})
+            matched = True
+            break
+    else:
+        found = TITLE_MATCHER.scan(title)
+        if "format" in found:
+            attrs["format"] = found["format"][0]
+
+    template_data = THUMBNAIL_TEMPLATES.get(category)
+    slots = [s for s, source in ATTRIBUTE_SOURCES.items() if template_data is None or source in template_data]
+    for slot in slots:
+        if slot in attrs:
+            continue
+        codes = _LOWER_CODES[slot]
+        code = next((codes[tag] for tag in tags if tag in codes), None)
+        if code is None and not matched and slot in found:
+            code = found[slot][0]
+        if code is not None:
+            attrs[slot] = code
+    return attrs
+
+
+ID_ALPHABET = string.ascii_lowercase + string.digits
+ID_LENGTH = 8
+ID_SPACE = len(ID_ALPHABET) ** ID_LENGTH
+# Odd and not a multiple of 3, so coprime with 36 ** 8
+_ID_MULTIPLIER = 2654435761
+# Two id characters at a time: half the divisions
+_ID_PAIRS = [b + a for a in ID_ALPHABET for b in ID_ALPHABET]
+
 
 def generate_video_id():
-    """Generate a unique video ID."""
-    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
+    """Generate a random video ID (unique within a pool, see generate_video_pool)."""
+    return ''.join(random.choices(ID_ALPHABET, k=ID_LENGTH))
+
+
+def sequential_video_id(index, offset=0):
+    """
+    Video ID for the ``index``-th item of a generated catalog.
+
+    ``index`` goes through the bijection i -> (a * i + offset) mod 36**8 of
+    the id space, so distinct indexes always get distinct ids, with no
+    bookkeeping across worker processes, while the ids still look random.
+
+    Args:
+        index: Position of the item in the catalog (below ID_SPACE)
+        offset: Per-catalog offset (e.g. derived from the seed)
+    """
+    n = (_ID_MULTIPLIER * index + offset) % ID_SPACE
+    pairs = []
+    for _ in range(ID_LENGTH // 2):
+        n, pair = divmod(n, len(_ID_PAIRS))
+        pairs.append(_ID_PAIRS[pair])
+    return ''.join(pairs)
 
 
 def generate_thumbnail(category=None, video_id=None, context=None):
@@ -121,6 +271,7 @@ def generate_thumbnail(category=None, video_id=None, context=None):
 
     template_data = THUMBNAIL_TEMPLATES[category]
     template = random.choice(template_data["templates"])
+    format_code = _template_format(template)
 
     # Generate title based on category
     if category == "food":
@@ -128,12 +279,14 @@ def generate_thumbnail(category=None, video_id=None, context=None):
         food_type = random.choice(template_data["food_types"])
         number = random.choice([3, 5, 7, 10])
         title = template.format(location=location, food_type=food_type, number=number)
+        attrs = encode_attributes(location=location, food_type=food_type)
         tags = [category, food_type, location.lower()] + random.sample(template_data["tags"], 2)
 
     elif category == "travel":
         location = random.choice(template_data["locations"])
         number = random.choice([3, 5, 7, 10])
         title = template.format(location=location, number=number)
+        attrs = encode_attributes(location=location)
         tags = [category, location.lower(), "travel"] + random.sample(template_data["tags"], 2)
 
     elif category == "tech":
@@ -149,6 +302,7 @@ def generate_thumbnail(category=None, video_id=None, context=None):
             price=price,
             use_case=use_case
         )
+        attrs = encode_attributes(product=product)
         tags = [category, product.lower(), "review"] + random.sample(template_data["tags"], 2)
 
     elif category == "lifestyle":
@@ -162,6 +316,7 @@ def generate_thumbnail(category=None, video_id=None, context=None):
             achievement=achievement,
             timeframe=timeframe
         )
+        attrs = encode_attributes(topic=topic)
         tags = [category, topic, "tips"] + random.sample(template_data["tags"], 2)
 
     elif category == "education":
@@ -169,6 +324,7 @@ def generate_thumbnail(category=None, video_id=None, context=None):
         number = random.choice([3, 5, 7, 10])
         timeframe = random.choice(template_data["timeframes"])
         title = template.format(subject=subject, number=number, timeframe=timeframe)
+        attrs = encode_attributes(subject=subject)
         tags = [category, subject.lower(), "learning"] + random.sample(template_data["tags"], 2)
 
     elif category == "entertainment":
@@ -176,6 +332,7 @@ def generate_thumbnail(category=None, video_id=None, context=None):
         number = random.choice([3, 5, 7, 10])
         platform = random.choice(template_data["platforms"])
         title = template.format(content_type=content_type, number=number, platform=platform)
+        attrs = encode_attributes(content_type=content_type)
         tags = [category, content_type, "recommendations"] + random.sample(template_data["tags"], 2)
 
     return {
@@ -187,7 +344,8 @@ def generate_thumbnail(category=None, video_id=None, context=None):
         "views": random.randint(10000, 5000000),
         "likes": random.randint(500, 200000),
         "thumbnail_color": random.choice(COLORS),
-        "creator": f"Creator_{random.randint(1, 500)}"
+        "creator": f"Creator_{random.randint(1, 500)}",
+        "attrs": dict(attrs, format=format_code) if format_code is not None else attrs
     }
 
 
@@ -246,6 +404,13 @@ def generate_video_pool(count=50, user_history=None):
     for _ in range(remaining):
         videos.append(generate_thumbnail())
 
+    # Random ids can collide in large pools; redraw until unique
+    seen = set()
+    for video in videos:
+        while video["id"] in seen:
+            video["id"] = generate_video_id()
+        seen.add(video["id"])
+
     # Shuffle and return exact count
     random.shuffle(videos)
     return videos[:count]
@@ -253,9 +418,12 @@ def generate_video_pool(count=50, user_history=None):
 
 def format_video_for_prompt(video):
     """Format video metadata for Claude prompt."""
-    return {
+    formatted = {
         "id": video["id"],
         "title": video["title"],
         "category": video["category"],
         "tags": video["tags"][:3]
     }
+    if "attrs" in video:
+        formatted["attrs"] = video["attrs"]
+    return formatted